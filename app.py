@@ -1,16 +1,49 @@
 import streamlit as st
+from streamlit.runtime.scriptrunner import add_script_run_ctx, get_script_run_ctx
 import pandas as pd
+import numpy as np
+import pyarrow as pa
+import pyarrow.ipc
 import random
+import threading
+import gzip
+import contextlib
+import fcntl
+import json
+import struct
+import unicodedata
+import bisect
+import sys
+import hashlib
+import shutil
+import sqlite3
+import time
+import queue
+import itertools
+import collections
+import re
+import urllib.request
+import urllib.error
+from concurrent.futures import Future, ThreadPoolExecutor
+from dataclasses import dataclass, field
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from urllib.parse import urlparse, parse_qs, urlencode
 from pyuca import Collator  # <- 日本語ソート用
 import os
 
 # ---------- Google Sheets 用ライブラリ ----------
 import gspread
+import requests
+from gspread.utils import rowcol_to_a1, numericise
 from google.oauth2.service_account import Credentials
 
 # ---------- Google Sheets 設定 ----------
 SHEET_KEY = "1VxyGPBc4OoLEf6GeqVGKk3m1BCEcsBMKMHJsmGmc62A"
-SHEET_NAME = "Sheet1"  # 読み書きするシート名
+SHEET_NAME = "Sheet1"  # 読み書きするシート名（既定の店舗）
+
+# 店舗ごとのワークシート {シート名: 表示名}（secrets の shop_sheets で上書き）
+SHOP_SHEETS = {SHEET_NAME: "本店"}
+ALL_SHOPS = "all"  # ?shop=all で全店舗をまとめて表示
 
 
 # ---------- Page config ----------
@@ -122,6 +155,10 @@ if is_admin:
 DEFAULT_BEER_IMG = "https://assets.untappd.com/site/assets/images/temp/badge-beer-default.png"
 DEFAULT_BREWERY_IMG = "https://assets.untappd.com/site/assets/images/temp/badge-brewery-default.png"
 
+# スライダー初期値（リセット・プリセット判定でも使う）
+DEFAULT_ABV_RANGE = (0.0, 20.0)
+DEFAULT_PRICE_RANGE = (0, 20000)
+
 # ---------- Country master ----------
 COUNTRY_INFO = {
     "Japan":{"jp":"日本","flag":"https://freesozai.jp/sozai/nation_flag/ntf_131/ntf_131.png",},
@@ -134,8 +171,21 @@ COUNTRY_INFO = {
     "Austria":{"jp":"オーストリア","flag":"https://freesozai.jp/sozai/nation_flag/ntf_309/ntf_309.svg",},
 }
 
+# 日本語名 → 内部用（英語）
+COUNTRY_BY_JP = {v["jp"]: k for k, v in COUNTRY_INFO.items() if v.get("jp")}
+
 # ---------- Helpers ----------
 
+# ひらがな → カタカナ（ぁ〜ゖ を ァ〜ヶ に）
+HIRAGANA_TO_KATAKANA = {c: c + 0x60 for c in range(ord("ぁ"), ord("ゖ") + 1)}
+
+def fold_search(s):
+    """
+    検索用の正規化。全角英数・半角カナを NFKC でそろえ、小文字にし、ひらがなをカタカナに寄せる。
+    カタログ側（search_blob）と検索語の両方に同じものを使う。
+    """
+    return unicodedata.normalize("NFKC", str(s)).lower().translate(HIRAGANA_TO_KATAKANA)
+
 def safe_str(v):
     if pd.isna(v) or v is None: return ""
     return str(v)
@@ -184,7 +234,7 @@ def get_countries_for_filter(df, admin=False):
     )
 
 
-@st.cache_data
+@st.cache_data(max_entries=64, show_spinner=False)
 def get_style_candidates(df):
     return sorted(
         df["style_main_jp"]
@@ -195,11 +245,15 @@ def get_style_candidates(df):
     )
 
 
+# 検索語ごとに結果を持つので件数を決めておく（古い version の分もここで押し出される）
 @st.cache_data(
-    hash_funcs={pd.DataFrame: lambda _: None}
+    hash_funcs={pd.DataFrame: lambda _: None},
+    max_entries=64,
+    show_spinner=False
 )
 def build_filtered_df(
     df,
+    catalog_version,
     search_text,
     size_choice,
     abv_min, abv_max,
@@ -210,7 +264,7 @@ def build_filtered_df(
 
     # --- フリー検索 ---
     if search_text and search_text.strip():
-        kw = search_text.strip().lower()
+        kw = fold_search(search_text.strip())
         d = d[d["search_blob"].str.contains(kw, na=False)]
 
     # --- サイズ ---
@@ -237,7 +291,9 @@ def build_filtered_df(
 
     return d
 
-@st.cache_resource
+# 裏のスレッド（段階読み込み・読み直し・カタログ API）からも呼ぶものは spinner を出さない。
+# spinner はキャッシュに当たっても st.empty() を積むので、そのセッションの描画に割り込んでしまう
+@st.cache_resource(show_spinner=False)
 def get_collator():
     from pyuca import Collator
     return Collator()
@@ -247,32 +303,803 @@ def locale_key(x):
     s = "" if x is None else str(x).strip()
     return collator.sort_key(s)
 
-# ---------- Load data ----------
-@st.cache_data
-def load_data():
-
-    # --- Google 認証 ---
-    info = st.secrets["gcp_service_account"]
-    SCOPES = [
-        "https://www.googleapis.com/auth/spreadsheets",
-        "https://www.googleapis.com/auth/drive"
-    ]
-    creds = Credentials.from_service_account_info(info, scopes=SCOPES)
+def locale_key_bytes(x):
+    # pyuca のキー（int のタプル）を並び順を保ったまま bytes に（Arrow に保存できる形）
+    key = locale_key(x)
+    return struct.pack(f">{len(key)}I", *key)
+
+# ---------- Sheets リクエストスケジューラ ----------
+PRIORITY_USER = 0        # 画面の表示・保存を待たせているリクエスト
+PRIORITY_BACKGROUND = 1  # 裏で動く処理（先読みなど）
+
+SHEETS_QUOTA_PER_MINUTE = 60  # Sheets API の 1 ユーザーあたり上限（リクエスト/分）
+SHEETS_MAX_RETRIES = 5
+SHEETS_WORKERS = 4  # 複数シートの同時読み込み用
+
+def is_retryable_error(e):
+    """429（クォータ超過）と 5xx、通信エラーだけ再試行する"""
+    if isinstance(e, gspread.exceptions.APIError):
+        code = getattr(getattr(e, "response", None), "status_code", None)
+        return code == 429 or (code is not None and code >= 500)
+    # gspread は requests の例外をそのまま投げる（組み込みの ConnectionError の子ではない）
+    return isinstance(e, (
+        ConnectionError, TimeoutError,
+        requests.exceptions.ConnectionError, requests.exceptions.Timeout,
+    ))
+
+class SheetsScheduler:
+    """
+    Sheets API 呼び出しを少数のワーカーに集めて実行する。
+    - トークンバケットでクォータ以内に抑える
+    - 429 / 5xx はジッター付き指数バックオフで再試行（その間は全体を一時停止）
+    - 優先度の小さいものから順に実行する
+    """
+    def __init__(self, per_minute=SHEETS_QUOTA_PER_MINUTE, max_retries=SHEETS_MAX_RETRIES,
+                 base_delay=1.0, max_delay=32.0, workers=SHEETS_WORKERS):
+        self.rate = per_minute / 60.0
+        self.capacity = float(per_minute)
+        self.tokens = float(per_minute)
+        self.refilled_at = time.monotonic()
+        self.paused_until = 0.0
+        self.token_lock = threading.Lock()
+
+        self.max_retries = max_retries
+        self.base_delay = base_delay
+        self.max_delay = max_delay
+
+        self.queue = queue.PriorityQueue()
+        self.seq = itertools.count()
+
+        # --- メトリクス ---
+        self.metrics_lock = threading.Lock()
+        self.completed = 0
+        self.failed = 0
+        self.retries = 0
+        self.latencies = collections.deque(maxlen=500)
+
+        self.workers = [
+            threading.Thread(target=self._run, daemon=True)
+            for _ in range(workers)
+        ]
+        for w in self.workers:
+            w.start()
+
+    def submit(self, fn, *args, priority=PRIORITY_USER, **kwargs):
+        future = Future()
+        self.queue.put((priority, next(self.seq), time.monotonic(), fn, args, kwargs, future, 0))
+        return future
+
+    def call(self, fn, *args, priority=PRIORITY_USER, **kwargs):
+        return self.submit(fn, *args, priority=priority, **kwargs).result()
+
+    def _take_token(self):
+        while True:
+            with self.token_lock:
+                now = time.monotonic()
+                self.tokens = min(self.capacity, self.tokens + (now - self.refilled_at) * self.rate)
+                self.refilled_at = now
+                if self.tokens >= 1:
+                    self.tokens -= 1
+                    return
+                wait = (1 - self.tokens) / self.rate
+            time.sleep(wait)
+
+    def _backoff_delay(self, attempt):
+        cap = min(self.max_delay, self.base_delay * (2 ** attempt))
+        return cap / 2 + random.uniform(0, cap / 2)
+
+    def _run(self):
+        while True:
+            item = self.queue.get()
+            priority, seq, submitted, fn, args, kwargs, future, attempt = item
+
+            # バックオフ中は待ってから取り直す（待っている間に来た優先リクエストを先に通す）
+            wait = self.paused_until - time.monotonic()
+            if wait > 0:
+                self.queue.put(item)
+                time.sleep(wait)
+                continue
+
+            self._take_token()
+
+            try:
+                result = fn(*args, **kwargs)
+            except Exception as e:
+                if is_retryable_error(e) and attempt < self.max_retries:
+                    with self.metrics_lock:
+                        self.retries += 1
+                    self.paused_until = max(self.paused_until, time.monotonic() + self._backoff_delay(attempt))
+                    self.queue.put((priority, seq, submitted, fn, args, kwargs, future, attempt + 1))
+                    continue
+
+                with self.metrics_lock:
+                    self.failed += 1
+                    self.latencies.append(time.monotonic() - submitted)
+                future.set_exception(e)
+                continue
+
+            with self.metrics_lock:
+                self.completed += 1
+                self.latencies.append(time.monotonic() - submitted)
+            future.set_result(result)
+
+    def metrics(self):
+        with self.metrics_lock:
+            lat = sorted(self.latencies)
+            completed, failed, retries = self.completed, self.failed, self.retries
+
+        def pct(p):
+            if not lat:
+                return 0.0
+            return lat[min(len(lat) - 1, int(len(lat) * p))]
+
+        return {
+            "queue_depth": self.queue.qsize(),
+            "completed": completed,
+            "failed": failed,
+            "retries": retries,
+            "latency_p50": pct(0.50),
+            "latency_p95": pct(0.95),
+            "paused_for": max(0.0, self.paused_until - time.monotonic()),
+        }
+
+
+@st.cache_resource(show_spinner=False)
+def get_sheets_scheduler():
+    return SheetsScheduler()
+
+def sheets_call(fn, *args, priority=PRIORITY_USER, **kwargs):
+    """Sheets API 呼び出しは必ずここを通す"""
+    return get_sheets_scheduler().call(fn, *args, priority=priority, **kwargs)
+
+
+# ---------- Google Sheets 接続 ----------
+SCOPES = [
+    "https://www.googleapis.com/auth/spreadsheets",
+    "https://www.googleapis.com/auth/drive"
+]
+
+@st.cache_resource(show_spinner=False)
+def get_spreadsheet():
+    # open_by_key もAPIを消費するので、スプレッドシートは全店舗で1つを使い回す
+    creds = Credentials.from_service_account_info(
+        st.secrets["gcp_service_account"],
+        scopes=SCOPES
+    )
     client = gspread.authorize(creds)
-    sheet = client.open_by_key(SHEET_KEY).worksheet(SHEET_NAME)
-
-    
-    # --- 全データ取得 ---
-    data = sheet.get_all_records()
-    df = pd.DataFrame(data)
-
-    expected = [
-        "id","name_jp","name_local","yomi","brewery_local","brewery_jp","country","city",
-        "brewery_description","brewery_image_url","style_main","style_main_jp",
-        "style_sub","style_sub_jp","abv","volume","vintage","price","comment","detailed_comment",
-        "in_stock","untappd_url","jan","beer_image_url"
-    ]
-    for c in expected:
+    return sheets_call(client.open_by_key, SHEET_KEY)
+
+@st.cache_resource(show_spinner=False)
+def get_worksheet(sheet_name=SHEET_NAME):
+    # worksheet もAPIを消費するので、開いたシートは使い回す
+    return sheets_call(get_spreadsheet().worksheet, sheet_name)
+
+
+# ---------- 在庫集計（差分で更新する） ----------
+class InventoryStats:
+    """
+    国・スタイル・醸造所ごとの ○/△/× 件数、ASK（価格0）の行、価格・ABV の分布。
+    最初の1回だけ groupby で数え、その後は変わった行の分だけ足し引きする。
+    """
+    DIMENSIONS = ("country", "style_main_jp", "brewery_local")
+    PRICE_BINS = [0, 1, 1000, 2000, 3000, 5000, 10000, float("inf")]
+    ABV_BINS = [0, 3, 4, 5, 6, 7, 8, 9, 10, 12, 15, float("inf")]
+
+    def __init__(self, df):
+        self.counts = {dim: collections.Counter() for dim in self.DIMENSIONS}  # (値, 在庫) -> 件数
+        self.status = collections.Counter()
+        self.ask = set()  # price 0 の行位置
+        self.price_hist = collections.Counter()
+        self.abv_hist = collections.Counter()
+
+        for dim in self.DIMENSIONS:
+            self.counts[dim].update(df.groupby([dim, "stock_status"]).size().to_dict())
+        self.status.update(df["stock_status"].value_counts().to_dict())
+
+        price = pd.to_numeric(df["price_num"], errors="coerce")
+        abv = pd.to_numeric(df["abv_num"], errors="coerce")
+        self.ask.update(df.index[price == 0])
+        self.price_hist.update(
+            pd.cut(price, self.PRICE_BINS, right=False, labels=False).dropna().astype(int).value_counts().to_dict()
+        )
+        self.abv_hist.update(
+            pd.cut(abv, self.ABV_BINS, right=False, labels=False).dropna().astype(int).value_counts().to_dict()
+        )
+
+    @staticmethod
+    def _bin(value, bins):
+        # pd.cut(right=False, labels=False) と同じ番号を返す
+        if value is None or pd.isna(value) or value < bins[0]:
+            return None
+        return bisect.bisect_right(bins, value) - 1
+
+    def _apply(self, rows, sign):
+        for pos, r in zip(rows.index, rows.itertuples(index=False)):
+            for dim in self.DIMENSIONS:
+                self.counts[dim][(getattr(r, dim), r.stock_status)] += sign
+            self.status[r.stock_status] += sign
+
+            price = pd.to_numeric(r.price_num, errors="coerce")
+            if price == 0:
+                (self.ask.add if sign > 0 else self.ask.discard)(pos)
+
+            for hist, value, bins in [
+                (self.price_hist, price, self.PRICE_BINS),
+                (self.abv_hist, pd.to_numeric(r.abv_num, errors="coerce"), self.ABV_BINS),
+            ]:
+                b = self._bin(value, bins)
+                if b is not None:
+                    hist[b] += sign
+
+        # 0 件になったキーは消しておく
+        for counter in [*self.counts.values(), self.status, self.price_hist, self.abv_hist]:
+            for key in [k for k, n in counter.items() if n <= 0]:
+                del counter[key]
+
+    def add(self, rows):
+        self._apply(rows, +1)
+
+    def remove(self, rows):
+        self._apply(rows, -1)
+
+    def table(self, dim):
+        """dim ごとの ○/△/× 件数表（件数の多い順）"""
+        s = pd.Series(self.counts[dim], dtype="int64")
+        if s.empty:
+            return pd.DataFrame(columns=["○", "△", "×", "合計"])
+        t = s.unstack(fill_value=0).reindex(columns=["○", "△", "×"], fill_value=0)
+        t["合計"] = t.sum(axis=1)
+        return t.sort_values("合計", ascending=False)
+
+    @staticmethod
+    def hist_labels(bins):
+        labels = []
+        for lo, hi in zip(bins[:-1], bins[1:]):
+            labels.append(f"{lo:g}〜" if hi == float("inf") else f"{lo:g}〜{hi:g}")
+        return labels
+
+
+# ---------- マスタ（醸造所・スタイル）を差分で更新する ----------
+class MasterData:
+    """
+    醸造所ペア（brewery_local, brewery_jp）とスタイルの出現件数を持ち、
+    管理画面の選択肢（ソート済みリスト）と表示名 → 内部値の辞書を返す。
+    件数は行の追加・変更ごとに足し引きし、選択肢は値の種類が変わった時だけ作り直す。
+    """
+    def __init__(self, df):
+        self.breweries = collections.Counter()  # (brewery_local, brewery_jp) -> 件数
+        self.style_main = collections.Counter()
+        self.style_sub = collections.Counter()
+        self._lists = None
+        self.add(df)
+
+    def _apply(self, rows, sign):
+        before = (len(self.breweries), len(self.style_main), len(self.style_sub))
+
+        self.breweries.update({
+            k: sign * n
+            for k, n in collections.Counter(zip(rows["brewery_local"], rows["brewery_jp"])).items()
+        })
+        for counter, col in [(self.style_main, "style_main_jp"), (self.style_sub, "style_sub_jp")]:
+            counter.update({k: sign * n for k, n in collections.Counter(rows[col]).items()})
+
+        changed = False
+        for counter in (self.breweries, self.style_main, self.style_sub):
+            for key in [k for k, n in counter.items() if n <= 0]:
+                del counter[key]
+                changed = True
+
+        if changed or before != (len(self.breweries), len(self.style_main), len(self.style_sub)):
+            self._lists = None
+
+    def add(self, rows):
+        self._apply(rows, +1)
+
+    def remove(self, rows):
+        self._apply(rows, -1)
+
+    def _build(self):
+        # 絞り込み用：brewery_local ごとに最初に出てきた日本語名（drop_duplicates と同じ）
+        by_local = {}
+        for local, jp in self.breweries:
+            by_local.setdefault(local, jp)
+        filter_breweries = sorted(by_local.items(), key=lambda x: x[1])
+
+        # 新規追加フォーム用：日本語名・現地名の両方がある組
+        form_breweries = sorted(
+            ({"brewery_jp": jp, "brewery_local": local} for local, jp in self.breweries if jp and local),
+            key=lambda b: b["brewery_jp"]
+        )
+
+        local_by_jp = {}
+        for local, jp in filter_breweries:
+            local_by_jp.setdefault(jp, local)
+
+        return {
+            "filter_breweries": filter_breweries,
+            "brewery_local_by_jp": local_by_jp,
+            "form_breweries": form_breweries,
+            "form_brewery_by_jp": {b["brewery_jp"]: b for b in reversed(form_breweries)},
+            "style_main": sorted({s for s in self.style_main if s.strip()}),
+            "style_sub": sorted({s for s in self.style_sub if s.strip()}),
+        }
+
+    def __getitem__(self, name):
+        if self._lists is None:
+            self._lists = self._build()
+        return self._lists[name]
+
+@st.cache_resource(max_entries=4)
+def get_merged_master(version, _df):
+    # 全店舗表示用（店舗ごとの store.master はそのまま使えない）
+    return MasterData(_df)
+
+
+# ---------- 検索候補（ソート済み配列の二分探索） ----------
+SUGGEST_COLUMNS = ["name_local", "name_jp", "brewery_local", "brewery_jp"]
+SUGGEST_LIMIT = 5
+
+def suggest_key(s):
+    return fold_search(str(s).strip())
+
+class SuggestIndex:
+    """
+    (検索キー, 候補に出す文字列) をキー順に並べた配列。
+    前方一致は bisect で先頭を見つけて、続く数件を読むだけ。
+    """
+    def __init__(self, df):
+        entries = set()
+        for col in SUGGEST_COLUMNS:
+            for term in df[col].astype(str):
+                term = term.strip()
+                if not term:
+                    continue
+                # "Westmalle Tripel" は "tripel" からでも出るよう、単語の頭ごとにキーを作る
+                words = term.split()
+                for i in range(len(words)):
+                    entries.add((suggest_key(" ".join(words[i:])), term))
+
+        # 読み（yomi）で引いて、日本語名を候補に出す
+        for yomi, name_jp, name_local in zip(df["yomi"].astype(str), df["name_jp"], df["name_local"]):
+            label = str(name_jp).strip() or str(name_local).strip()
+            if yomi.strip() and yomi != "nan" and label:
+                entries.add((suggest_key(yomi), label))
+
+        entries = sorted(entries)
+        self.keys = [k for k, _ in entries]
+        self.labels = [label for _, label in entries]
+
+    def suggest(self, prefix, limit=SUGGEST_LIMIT):
+        p = suggest_key(prefix)
+        if not p:
+            return []
+
+        out = []
+        i = bisect.bisect_left(self.keys, p)
+        while i < len(self.keys) and len(out) < limit and self.keys[i].startswith(p):
+            if self.labels[i] not in out:
+                out.append(self.labels[i])
+            i += 1
+        return out
+
+@st.cache_resource(max_entries=8)
+def get_suggest_index(version, _df):
+    return SuggestIndex(_df)
+
+
+# ---------- JAN インデックス ----------
+def normalize_jan(code):
+    # スキャナの改行・空白や全角数字が混ざっても数字だけで比べる。
+    # シートの値は numericise で数値になり先頭の 0 が落ちるので、こちらも 0 を落としてそろえる
+    return "".join(ch for ch in unicodedata.normalize("NFKC", str(code)) if ch.isdigit()).lstrip("0")
+
+def build_jan_index(df):
+    jan = df["jan"].fillna("").astype(str).map(normalize_jan)
+    mask = jan != ""
+    return dict(zip(jan[mask], df.index[mask]))
+
+
+# ---------- プロセス間共有（memory-map した Arrow ファイル） ----------
+# secrets の catalog_share_dir を設定すると有効。
+# 1つのプロセスだけがシートを読んで Arrow IPC ファイルに書き、
+# 他のワーカーは manifest.json を見てそのファイルを memory-map する。
+CATALOG_SHARE_DIR = st.secrets.get("catalog_share_dir", "")
+# prepare_catalog の派生列（search_blob の作り方など）を変えたら上げる。
+# 違う値の manifest は無いものとして扱い、デプロイ後の最初のプロセスがシートから読み直す
+CATALOG_FORMAT_VERSION = 3
+
+# 文字列列は Arrow のまま持つ（mmap したバッファをコピーしない）
+ARROW_TYPES = {
+    pa.string(): pd.ArrowDtype(pa.string()),
+    pa.large_string(): pd.ArrowDtype(pa.large_string()),
+}
+
+def shared_dir(sheet_name):
+    safe = "".join(ch if ch.isalnum() else "_" for ch in sheet_name)
+    return os.path.join(CATALOG_SHARE_DIR, safe)
+
+_shared_lock_held = threading.local()  # このスレッドが持っている flock（シート名 -> 入れ子の深さ）
+
+@contextlib.contextmanager
+def shared_catalog_lock(sheet_name):
+    """
+    プロセスをまたいだ排他（共有しない設定なら何もしない）。
+    同じスレッドからは入れ子にできる（flock は開き直すたびに別物になり、入れ子だと自分を待ってしまう）。
+    """
+    if not CATALOG_SHARE_DIR:
+        yield
+        return
+
+    held = _shared_lock_held.__dict__.setdefault("depth", {})
+    if held.get(sheet_name):
+        held[sheet_name] += 1
+        try:
+            yield
+        finally:
+            held[sheet_name] -= 1
+        return
+
+    os.makedirs(shared_dir(sheet_name), exist_ok=True)
+    with open(os.path.join(shared_dir(sheet_name), "lock"), "w") as f:
+        fcntl.flock(f, fcntl.LOCK_EX)
+        held[sheet_name] = 1
+        try:
+            yield
+        finally:
+            held[sheet_name] = 0
+            fcntl.flock(f, fcntl.LOCK_UN)
+
+def read_shared_manifest(sheet_name):
+    try:
+        with open(os.path.join(shared_dir(sheet_name), "manifest.json"), encoding="utf-8") as f:
+            manifest = json.load(f)
+    except (FileNotFoundError, json.JSONDecodeError):
+        return None
+    # 古い形式で書かれた Arrow ファイルは使わない（派生列の作り方が違う）
+    if manifest.get("format") != CATALOG_FORMAT_VERSION:
+        return None
+    return manifest
+
+def to_arrow_table(df):
+    arrays = {}
+    for col in df.columns:
+        s = df[col]
+        if col == "id":
+            # 空欄の id が混ざっても数値として比べられるように
+            s = pd.to_numeric(s, errors="coerce")
+        try:
+            arrays[col] = pa.array(s, from_pandas=True)
+        except (pa.ArrowInvalid, pa.ArrowTypeError):
+            # 数値と文字が混ざった生の列（price など）は文字列にそろえる
+            arrays[col] = pa.array(s.map(lambda v: "" if v is None or (not isinstance(v, str) and pd.isna(v)) else str(v)))
+    return pa.table(arrays)
+
+def publish_shared_catalog(sheet_name, df, fetched_at, brewery_details):
+    """新しい version を Arrow ファイルに書き、manifest を差し替える（呼ぶ側でロックする）"""
+    d = shared_dir(sheet_name)
+    os.makedirs(d, exist_ok=True)
+
+    token = f"{time.time_ns()}_{os.getpid()}"
+    name = f"catalog_{token}.arrow"
+    # 醸造所の説明・画像は行ではなくファイルのメタデータに持たせる（切り替える時に一緒に読む）
+    table = to_arrow_table(df).replace_schema_metadata({
+        "brewery_details": json.dumps(brewery_details, ensure_ascii=False)
+    })
+
+    tmp = os.path.join(d, name + ".tmp")
+    with pa.OSFile(tmp, "wb") as sink:
+        with pa.ipc.new_file(sink, table.schema) as writer:
+            writer.write_table(table)
+    os.replace(tmp, os.path.join(d, name))
+
+    # fetched_at はシートを最後に全件読んだ時刻（追加・編集で書き直しても引き継ぐ）
+    manifest = {
+        "format": CATALOG_FORMAT_VERSION,
+        "token": token,
+        "file": name,
+        "rows": len(df),
+        "fetched_at": fetched_at,
+    }
+    tmp = os.path.join(d, "manifest.json.tmp")
+    with open(tmp, "w", encoding="utf-8") as f:
+        json.dump(manifest, f)
+    os.replace(tmp, os.path.join(d, "manifest.json"))
+
+    # 古いファイルは消す（mmap 中のプロセスは閉じるまで読める）
+    for old in os.listdir(d):
+        if old.startswith("catalog_") and old.endswith(".arrow") and old != name:
+            try:
+                os.remove(os.path.join(d, old))
+            except OSError:
+                pass
+
+    return manifest
+
+def map_shared_catalog(sheet_name, manifest):
+    """(df, 醸造所の説明・画像) を返す"""
+    source = pa.memory_map(os.path.join(shared_dir(sheet_name), manifest["file"]), "r")
+    table = pa.ipc.open_file(source).read_all()
+    details = json.loads((table.schema.metadata or {}).get(b"brewery_details", b"{}"))
+    return (
+        table.to_pandas(types_mapper=ARROW_TYPES.get),
+        {name: tuple(v) for name, v in details.items()},
+    )
+
+def fetch_shared(store, sheet):
+    def switch_to(manifest):
+        # manifest が変わった時だけ切り替える（毎回の確認は小さい JSON を読むだけ）
+        if manifest["token"] != store.shared_token:
+            store.replace(*map_shared_catalog(store.sheet_name, manifest))
+            store.shared_token = manifest["token"]
+            store.fetched_at = manifest.get("fetched_at", time.time())
+
+    with store.lock:
+        manifest = read_shared_manifest(store.sheet_name)
+        if manifest is not None:
+            try:
+                switch_to(manifest)
+                return store.df
+            except FileNotFoundError:
+                # manifest を読んだ後に他のプロセスが新しい版を書き、このファイルを消した。
+                # 書き出しと削除はロックの中でしか起きないので、ロックを取って読み直す
+                pass
+
+        with shared_catalog_lock(store.sheet_name):
+            # ロック待ちの間に他のプロセスが書いたかもしれない
+            manifest = read_shared_manifest(store.sheet_name)
+            if manifest is None:
+                raw = pd.DataFrame(sheets_call(sheet.get_all_records))
+                manifest = publish_shared_catalog(
+                    store.sheet_name, prepare_catalog(raw), time.time(), brewery_details_of(raw)
+                )
+            switch_to(manifest)
+
+        return store.df
+
+
+# ---------- Catalog store（全セッション共有・差分更新用） ----------
+CATALOG_CHANGE_LOG_SIZE = 256  # 差分で追える直近の変更数
+
+class CatalogStore:
+    """
+    load_data() の結果をシートごとにプロセス内で1つだけ保持する。
+    version は中身が変わるたびに +1 され、各キャッシュのキーとして使う。
+    """
+    def __init__(self, sheet_name=SHEET_NAME):
+        self.sheet_name = sheet_name
+        self.lock = threading.RLock()
+        self.df = None
+        self.version = 0
+        self.shared_token = None  # プロセス間共有時、今読んでいる Arrow ファイルの token
+        self._stats = None
+        self._master = None
+        self.jan_index = {}  # JAN -> 行位置
+        self.brewery_details = {}  # brewery_local -> (説明, 画像URL)。フレームには持たない
+        self.loading = False     # 段階読み込みで続きのチャンクを待っている間 True
+        self.load_error = None
+        self.fetched_at = None   # シートを最後に全件読んだ時刻（time.time()）
+        self.refreshing = False  # 裏で読み直している間 True
+        self.generation = 0      # invalidate() ごとに +1（古い読み込みスレッドを止める目印）
+        # 差分で追いかける側（SQLite など）向けの変更履歴 (version, "update"/"append", 行位置)
+        self.changes = collections.deque(maxlen=CATALOG_CHANGE_LOG_SIZE)
+        self.changes_floor = 0   # この version より前からの変更は履歴に残っていない
+
+    @property
+    def stats(self):
+        # 集計は管理画面で初めて見た時に作る
+        with self.lock:
+            if self._stats is None and self.df is not None:
+                self._stats = InventoryStats(self.df)
+            return self._stats
+
+    @property
+    def master(self):
+        with self.lock:
+            if self._master is None and self.df is not None:
+                self._master = MasterData(self.df)
+            return self._master
+
+    def replace(self, df, brewery_details=None):
+        with self.lock:
+            self.df = df
+            self.brewery_details = brewery_details or {}
+            self._stats = None
+            self._master = None
+            self.jan_index = build_jan_index(df)
+            self.version += 1
+            self.changes.clear()
+            self.changes_floor = self.version
+
+    def _refresh_shared(self):
+        # 他のプロセスが新しい version を書いていたら、それに重ねて変更する
+        manifest = read_shared_manifest(self.sheet_name)
+        if manifest is not None and manifest["token"] != self.shared_token:
+            self.df, self.brewery_details = map_shared_catalog(self.sheet_name, manifest)
+            self._stats = None
+            self._master = None
+            self.jan_index = build_jan_index(self.df)
+            self.shared_token = manifest["token"]
+            self.fetched_at = manifest.get("fetched_at", self.fetched_at)
+            # 他のプロセスの変更は履歴にないので、次の version までは差分で追えない
+            self.changes.clear()
+            self.changes_floor = self.version + 1
+
+    def _publish_shared(self):
+        # 書き出した Arrow を自分も memory-map し直す（他プロセスと同じ1つのコピーを使う）
+        manifest = publish_shared_catalog(self.sheet_name, self.df, self.fetched_at, self.brewery_details)
+        self.df, _ = map_shared_catalog(self.sheet_name, manifest)
+        self.shared_token = manifest["token"]
+
+    def append(self, new_df, brewery_details=None):
+        # 追加行だけ加工済みで受け取り、全件再取得せずに反映する
+        with self.lock, shared_catalog_lock(self.sheet_name):
+            if CATALOG_SHARE_DIR:
+                self._refresh_shared()
+
+            if brewery_details:
+                self.brewery_details = merge_brewery_details(self.brewery_details, brewery_details)
+
+            combined = pd.concat([self.df, new_df], ignore_index=True)
+            added = combined.iloc[len(self.df):]
+            if self._stats is not None:
+                self._stats.add(added)
+            if self._master is not None:
+                self._master.add(added)
+            self.jan_index.update(build_jan_index(added))
+            self.df = combined
+
+            if CATALOG_SHARE_DIR:
+                self._publish_shared()
+            self.version += 1
+            self.changes.append((self.version, "append", list(added.index)))
+
+    def update(self, changes):
+        """
+        changes = {行位置: {列: 新しい値}}。
+        変わった行だけ派生列を作り直し、集計も差分で直す。
+        """
+        with self.lock, shared_catalog_lock(self.sheet_name):
+            if CATALOG_SHARE_DIR:
+                self._refresh_shared()
+
+            positions = list(changes)
+            old = self.df.loc[positions]
+
+            edited = old.copy()
+            for pos, values in changes.items():
+                for col, value in values.items():
+                    edited.at[pos, col] = value
+            new = prepare_catalog(edited)
+
+            # 他のセッションが描画中の df は書き換えない（コピーして差し替え）
+            df = self.df.copy()
+            for col in new.columns:
+                if df[col].dtype != new[col].dtype:
+                    df[col] = df[col].astype(object)
+                df.loc[new.index, col] = new[col]
+
+            if self._stats is not None:
+                self._stats.remove(old)
+                self._stats.add(new)
+            if self._master is not None:
+                self._master.remove(old)
+                self._master.add(new)
+
+            for jan in build_jan_index(old):
+                self.jan_index.pop(jan, None)
+            self.jan_index.update(build_jan_index(new))
+
+            self.df = df
+
+            if CATALOG_SHARE_DIR:
+                self._publish_shared()
+            self.version += 1
+            self.changes.append((self.version, "update", positions))
+
+    @contextlib.contextmanager
+    def editing(self):
+        """
+        書き込む間ロックを持ったまま最新の df を渡す。
+        その間は読み直しや他プロセスの保存で行位置がずれない。
+        """
+        with self.lock, shared_catalog_lock(self.sheet_name):
+            if CATALOG_SHARE_DIR:
+                self._refresh_shared()
+            yield self.df
+
+    def snapshot(self):
+        # df と version を同時に読む（描画中に version だけ進むのを防ぐ）
+        with self.lock:
+            return self.df, self.version
+
+    def invalidate(self):
+        # 次の load_data() でシートから取り直す
+        with self.lock:
+            self.df = None
+            self._stats = None
+            self._master = None
+            self.jan_index = {}
+            self.brewery_details = {}
+            self.loading = False
+            self.load_error = None
+            self.fetched_at = None
+            self.shared_token = None
+            self.generation += 1
+            self.changes.clear()
+            self.changes_floor = self.version + 1
+
+    def changes_since(self, old, new):
+        """
+        version old → new の間の変更を [("update"/"append", 行位置のリスト)] で返す。
+        履歴が途切れていれば None（呼ぶ側で全件作り直す）。
+        """
+        with self.lock:
+            if old < self.changes_floor:
+                return None
+            picked = [(v, kind, positions) for v, kind, positions in self.changes if old < v <= new]
+            if [v for v, _, _ in picked] != list(range(old + 1, new + 1)):
+                return None
+            return [(kind, positions) for _, kind, positions in picked]
+
+    def find_by_jan(self, code):
+        """JAN から行を O(1) で引く（見つからなければ None）"""
+        with self.lock:
+            pos = self.jan_index.get(normalize_jan(code))
+            if pos is None or self.df is None:
+                return None
+            return self.df.loc[pos]
+
+
+@st.cache_resource(show_spinner=False)
+def get_catalog_store(sheet_name=SHEET_NAME):
+    # シートごとに別の store / version を持つ
+    return CatalogStore(sheet_name)
+
+
+# ---------- Load data ----------
+EXPECTED_COLUMNS = [
+    "id","name_jp","name_local","yomi","brewery_local","brewery_jp","country","city",
+    "brewery_description","brewery_image_url","style_main","style_main_jp",
+    "style_sub","style_sub_jp","abv","volume","vintage","price","comment","detailed_comment",
+    "in_stock","untappd_url","jan","beer_image_url"
+]
+
+# 醸造所の説明・画像は同じ内容が行の数だけ並ぶので、フレームには持たない
+# （読み込み時に醸造所ごとの dict にして store に持つ）
+BREWERY_DETAIL_COLUMNS = ["brewery_description", "brewery_image_url"]
+
+def brewery_details_of(raw):
+    """
+    シートの生データから {brewery_local: (説明, 画像URL)} を作る。
+    どの行に書いてあってもいいように、列ごとに最初に見つかった空でない値を使う。
+    """
+    if "brewery_local" not in raw.columns:
+        return {}
+
+    names = raw["brewery_local"].fillna("").astype(str)
+    details = {}
+    for i, col in enumerate(BREWERY_DETAIL_COLUMNS):
+        if col not in raw.columns:
+            continue
+        values = raw[col].fillna("").astype(str).str.strip()
+        mask = (values != "") & (names != "")
+        for name, v in values[mask].groupby(names[mask], sort=False).first().items():
+            details.setdefault(name, ["", ""])[i] = v
+    return {name: tuple(v) for name, v in details.items()}
+
+def merge_brewery_details(base, new):
+    # 既にある値は残し、空いているところだけ埋める
+    merged = dict(base)
+    for name, values in new.items():
+        old = merged.get(name, ("", ""))
+        merged[name] = tuple(o or n for o, n in zip(old, values))
+    return merged
+
+def prepare_catalog(df):
+    """シートの生データに表示・検索用の派生列を付ける（新規行にも同じ処理を使う）"""
+    df = df.copy()
+
+    for c in EXPECTED_COLUMNS:
         if c not in df.columns:
             df[c] = pd.NA
 
@@ -282,9 +1109,10 @@ def load_data():
 
     str_cols = [
         "name_jp","name_local","brewery_local","brewery_jp","country","city",
-        "brewery_description","brewery_image_url","style_main","style_main_jp",
+        "style_main","style_main_jp",
         "style_sub","style_sub_jp","comment","detailed_comment","untappd_url","jan","beer_image_url"
     ]
+    df = df.drop(columns=BREWERY_DETAIL_COLUMNS)
     for c in str_cols:
         df[c] = df[c].fillna("").astype(str)
 
@@ -298,11 +1126,11 @@ def load_data():
 
     # --- yomi 正規化 ---
     df["yomi"] = df["yomi"].astype(str).str.strip()
-    df["yomi_sort"] = df["yomi"].apply(locale_key)
+    df["yomi_sort"] = df["yomi"].apply(locale_key_bytes)
 
     # --- フリー検索用結合列（軽量化） ---
     search_cols = [
-        "name_local","name_jp","brewery_local","brewery_jp",
+        "name_local","name_jp","yomi","brewery_local","brewery_jp",
         "style_main_jp","style_sub_jp","comment",
         "detailed_comment","untappd_url","jan"
     ]
@@ -312,56 +1140,285 @@ def load_data():
         .fillna("")
         .astype(str)
         .agg(" ".join, axis=1)
-        .str.lower()
+        .map(fold_search)
     )
     return df
 
-def update_row(beer_id, stock, price, comment, detailed_comment):
-    try:
-        df = load_data()
+# ---------- 段階読み込み（チャンクごとに取得） ----------
+# secrets の streaming_load = true で有効。最初のチャンクだけ待って表示し、残りは裏で読む
+STREAMING_LOAD = st.secrets.get("streaming_load", False)
+LOAD_CHUNK_ROWS = 500
+LOAD_POLL_SECONDS = 0.5
+
+def fetch_chunk(sheet, header, start_row, priority=PRIORITY_USER):
+    """start_row から LOAD_CHUNK_ROWS 行を取り、シートの値の行リストで返す"""
+    last_col = rowcol_to_a1(1, len(header)).rstrip("0123456789")
+    end_row = start_row + LOAD_CHUNK_ROWS - 1
+    values = sheets_call(sheet.get, f"A{start_row}:{last_col}{end_row}", priority=priority)
+
+    # get_all_records と同じく数値は数値に戻す（途中の空行もそのまま1行として残す）
+    return [
+        [numericise(v) for v in row] + [""] * (len(header) - len(row))
+        for row in values
+    ]
 
-        mask = df["id"] == beer_id
-        if not mask.any():
-            st.error("IDが見つかりません")
-            return
+def has_more_rows(sheet, start_row, rows):
+    """
+    start_row からのチャンクの後ろを読むか。
+    Sheets API は範囲の末尾の空行を返さないので件数では決めない。
+    空が返り、シートの行数（row_count）も過ぎた時だけ終わる（row_count が古くても空が返るまでは読む）
+    """
+    return bool(rows) or start_row + LOAD_CHUNK_ROWS - 1 < sheet.row_count
 
-        # --- 単純代入 ---
-        df.loc[mask, "in_stock"] = stock
-        df.loc[mask, "price"] = price
-        df.loc[mask, "comment"] = comment
-        df.loc[mask, "detailed_comment"] = detailed_comment
+def load_remaining_chunks(store, sheet, header, start_row, blank, generation):
+    """
+    残りのチャンクを裏で読む。
+    store へは溜まった行数が今の件数に届くたびにまとめて入れる（件数が倍々に増えるので、
+    全件のコピーも version の更新も O(log n) 回で済む）。
+    blank は直前までに続いている空行の数（後ろにデータがあれば行位置がずれないよう空行のまま入れる）。
+    """
+    pending = []
+
+    def flush():
+        with store.lock:
+            if store.generation != generation:
+                return False  # 途中で再読み込みされた
+            if pending:
+                raw = pd.DataFrame(pending, columns=header)
+                store.append(prepare_catalog(raw), brewery_details_of(raw))
+                pending.clear()
+            return True
 
-        # ==========================
-        # 🔥 ここから超重要
-        # ==========================
+    try:
+        has_more = True
+        while has_more:
+            rows = fetch_chunk(sheet, header, start_row, priority=PRIORITY_BACKGROUND)
+            if rows:
+                pending.extend([[""] * len(header) for _ in range(blank)])
+                pending.extend(rows)
+                blank = 0
+            blank += LOAD_CHUNK_ROWS - len(rows)
+            has_more = has_more_rows(sheet, start_row, rows)
+            start_row += LOAD_CHUNK_ROWS
+
+            if len(pending) >= max(LOAD_CHUNK_ROWS, len(store.df)) and not flush():
+                return
+        flush()
+    except Exception as e:
+        store.load_error = str(e)
+    finally:
+        with store.lock:
+            if store.generation == generation:
+                store.loading = False
+
+def stream_into_store(store, sheet):
+    with store.lock:
+        if store.df is not None:
+            return store.df
+
+        header = sheets_call(sheet.row_values, 1)
+        rows = fetch_chunk(sheet, header, 2)
+        raw = pd.DataFrame(rows, columns=header)
+        store.replace(prepare_catalog(raw), brewery_details_of(raw))
+        store.fetched_at = time.time()
+        has_more = has_more_rows(sheet, 2, rows)
+        store.loading = has_more
+        generation = store.generation
+
+    if has_more:
+        add_script_run_ctx(threading.Thread(
+            target=load_remaining_chunks,
+            args=(store, sheet, header, 2 + LOAD_CHUNK_ROWS, LOAD_CHUNK_ROWS - len(rows), generation),
+            daemon=True
+        )).start()
+
+    return store.df
+
+def fetch_into_store(store, sheet):
+    if CATALOG_SHARE_DIR:
+        return fetch_shared(store, sheet)
+
+    if STREAMING_LOAD:
+        return stream_into_store(store, sheet)
+
+    # ロック中に取得するので、同時アクセスでもシート取得は1回だけ
+    with store.lock:
+        if store.df is None:
+            # --- 全データ取得 ---
+            raw = pd.DataFrame(sheets_call(sheet.get_all_records))
+            store.replace(prepare_catalog(raw), brewery_details_of(raw))
+            store.fetched_at = time.time()
+
+        return store.df
+
+def load_data(sheet_name=SHEET_NAME):
+    return fetch_into_store(get_catalog_store(sheet_name), get_worksheet(sheet_name))
+
+def load_catalogs(sheet_names):
+    """
+    複数シートを並列に読み込む。
+    シートを開く（worksheet の API 呼び出し）ところから各スレッドで行う。
+    """
+    def load(sheet_name):
+        store, sheet = get_catalog_store(sheet_name), get_worksheet(sheet_name)
+        return fetch_into_store(store, sheet), store, sheet
 
-        df = df.fillna("")
+    if len(sheet_names) <= 1:
+        results = [load(n) for n in sheet_names]
+    else:
+        # cache_resource は ScriptRunContext のないスレッドから呼ぶと毎回作り直す
+        # （get_worksheet・get_collator・get_sheets_scheduler など）ので、ワーカーにも渡しておく
+        with ThreadPoolExecutor(
+            max_workers=len(sheet_names),
+            initializer=add_script_run_ctx,
+            initargs=(None, get_script_run_ctx())
+        ) as ex:
+            results = list(ex.map(load, sheet_names))
+
+    for _, store, sheet in results:
+        maybe_refresh_catalog(store, sheet)
+
+    return {n: df for n, (df, _, _) in zip(sheet_names, results)}
+
+# ---------- シートの読み直し（スプレッドシートで直接直した分を取り込む） ----------
+# secrets の catalog_refresh_seconds で有効（0 なら管理画面の再読み込みボタンだけ）
+CATALOG_REFRESH_SECONDS = float(st.secrets.get("catalog_refresh_seconds", 0))
+
+def refresh_catalog(store, sheet):
+    """裏でシートを全件読み直し、その間に誰も書いていなければ差し替える"""
+    try:
+        with store.lock:
+            version, token = store.version, store.shared_token
+
+        raw = pd.DataFrame(sheets_call(sheet.get_all_records, priority=PRIORITY_BACKGROUND))
+        df, details = prepare_catalog(raw), brewery_details_of(raw)
+
+        with store.lock, shared_catalog_lock(store.sheet_name):
+            if CATALOG_SHARE_DIR:
+                manifest = read_shared_manifest(store.sheet_name)
+                if manifest is not None and manifest["token"] != token:
+                    return  # 他のプロセスが書いた（読み直した）ので次の周期に回す
+                manifest = publish_shared_catalog(store.sheet_name, df, time.time(), details)
+                store.replace(*map_shared_catalog(store.sheet_name, manifest))
+                store.shared_token = manifest["token"]
+            elif store.version == version:
+                store.replace(df, details)
+            else:
+                return  # 読んでいる間に保存があった（次の周期に読み直す）
+            store.fetched_at = time.time()
+    except Exception:
+        # 失敗しても次の周期までは再試行しない
+        store.fetched_at = time.time()
+    finally:
+        store.refreshing = False
+
+def maybe_refresh_catalog(store, sheet):
+    if not CATALOG_REFRESH_SECONDS:
+        return
+    with store.lock:
+        if (
+            store.df is None or store.loading or store.refreshing
+            or store.fetched_at is None
+            or time.time() - store.fetched_at < CATALOG_REFRESH_SECONDS
+        ):
+            return
+        store.refreshing = True
+
+    add_script_run_ctx(threading.Thread(
+        target=refresh_catalog, args=(store, sheet), daemon=True
+    )).start()
+
+def reload_catalog(sheet_name=SHEET_NAME):
+    """管理画面の再読み込みボタン用。store を捨てて、次の load_data() でシートから取り直す"""
+    store = get_catalog_store(sheet_name)
+    with store.lock, shared_catalog_lock(sheet_name):
+        if CATALOG_SHARE_DIR:
+            # manifest を消すと、どのプロセスも次の読み込みでシートから取り直す
+            with contextlib.suppress(FileNotFoundError):
+                os.remove(os.path.join(shared_dir(sheet_name), "manifest.json"))
+        store.invalidate()
+
+@st.cache_resource(max_entries=4)
+def merge_catalogs(versions, _frames):
+    """全店舗まとめ表示用。versions（店舗ごとの version）が変わった時だけ作り直す"""
+    return pd.concat(
+        [f.assign(shop=name) for name, f in _frames.items()],
+        ignore_index=True
+    )
 
-        # list → 文字列化
-        df = df.map(
-            lambda x: ", ".join(map(str, x)) if isinstance(x, list) else x
-        )
-        # すべて文字列化（Sheets安全）
-        df = df.astype(str)
+def next_beer_id(df):
+    ids = pd.to_numeric(df["id"], errors="coerce")
+    if ids.notna().any():
+        return int(ids.max()) + 1
+    return 1
+
+def to_cell_value(v):
+    # numpy の数値は JSON にできないので Python の値にする
+    if v is None or (not isinstance(v, str) and pd.isna(v)):
+        return ""
+    if isinstance(v, np.generic):
+        return v.item()
+    return v
+
+def write_cells(changes, sheet_name=SHEET_NAME):
+    """
+    changes = {id: {列: 値}} を、変わったセルだけ batch_update 1回で書き込む。
+    store への反映も1回（version も1回だけ上がる）。
+    行位置は書き込む直前に store のロックの中で id から引く
+    （表を開いた後に読み直しや追加で行がずれていても別のビールに書かない）。
+    """
+    sheet = get_worksheet(sheet_name)
+    headers = sheets_call(sheet.row_values, 1)
+
+    missing = {c for values in changes.values() for c in values} - set(headers)
+    if missing:
+        raise ValueError(f"シートに列がありません: {', '.join(sorted(missing))}")
+
+    store = get_catalog_store(sheet_name)
+    with store.editing() as df:
+        if df is None:
+            raise RuntimeError("カタログを読み込み中です。少し待ってから保存してください")
+
+        rows = df["id"][df["id"].isin(list(changes))]
+        unknown = set(changes) - set(rows)
+        if unknown:
+            raise ValueError(f"IDが見つかりません: {', '.join(map(str, sorted(unknown)))}")
+        by_pos = {pos: changes[beer_id] for pos, beer_id in rows.items()}
+
+        # 行位置 0 がシートの2行目（1行目はヘッダー）
+        data = [
+            {
+                "range": rowcol_to_a1(pos + 2, headers.index(col) + 1),
+                "values": [[to_cell_value(value)]],
+            }
+            for pos, values in by_pos.items()
+            for col, value in values.items()
+        ]
+        sheets_call(sheet.batch_update, data)
 
-        # ==========================
+        store.update(by_pos)
 
-        SCOPES = [
-            "https://www.googleapis.com/auth/spreadsheets",
-            "https://www.googleapis.com/auth/drive"
-        ]
+def update_row(beer_id, stock, price, comment, detailed_comment, sheet_name=SHEET_NAME):
+    try:
+        df = load_data(sheet_name)
 
-        creds = Credentials.from_service_account_info(
-            st.secrets["gcp_service_account"],
-            scopes=SCOPES
-        )
+        mask = df["id"] == beer_id
+        if not mask.any():
+            st.error("IDが見つかりません")
+            return
 
-        client = gspread.authorize(creds)
-        sheet = client.open_by_key(SHEET_KEY).worksheet(SHEET_NAME)
+        changes = {
+            beer_id: {
+                "in_stock": stock,
+                "price": price,
+                "comment": comment,
+                "detailed_comment": detailed_comment,
+            }
+        }
 
-        sheet.update([df.columns.tolist()] + df.values.tolist())
+        # 変わった行のセルだけ書き込み、store も差分で更新（全件再取得しない）
+        write_cells(changes, sheet_name)
 
-        st.cache_data.clear()
         st.session_state.edit_id = None
         st.session_state["save_success_flash"] = True
 
@@ -371,72 +1428,953 @@ def update_row(beer_id, stock, price, comment, detailed_comment):
     except Exception as e:
         st.error(f"保存中にエラーが発生しました: {e}")
 
-# --- load_data の外 ---
-df_all = load_data()
+# ---------- 一括編集（表） ----------
+GRID_COLUMNS = {
+    # シートの列: 表に出す値の列
+    "in_stock": "stock_status",
+    "price": "price_num",
+    "comment": "comment",
+    "detailed_comment": "detailed_comment",
+}
 
-if is_admin:
-    base_df = df_all
-else:
-    base_df = df_all[df_all["stock_status"] == "○"]
+def build_edit_grid(df, positions):
+    grid = df.loc[positions, ["id", "name_jp", "name_local", "brewery_jp"]].copy()
+    for sheet_col, value_col in GRID_COLUMNS.items():
+        grid[sheet_col] = df.loc[positions, value_col]
+    grid["price"] = pd.to_numeric(grid["price"], errors="coerce")
+    return grid
 
-# ---------- 新規追加 master ----------
-def get_brewery_master(df):
+def reset_bulk_grid():
+    # 表の中身を捨て、data_editor の key も変えて編集内容をリセットする
+    st.session_state.pop("bulk_grid", None)
+    st.session_state["bulk_editor_gen"] = st.session_state.get("bulk_editor_gen", 0) + 1
+
+def diff_edit_grid(original, edited):
+    """
+    セル単位の差分 {id: {シートの列: 新しい値}}。
+    表の行位置は開いた時のものなので、行は id で指す（write_cells が今の行位置に直す）。
+    """
+    changes = {}
+    for col in GRID_COLUMNS:
+        before, after = original[col], edited[col]
+        changed = ~((before == after) | (before.isna() & after.isna()))
+        for pos in edited.index[changed]:
+            value = after.at[pos]
+            if col == "price" and pd.notna(value):
+                value = int(value)
+            changes.setdefault(edited.at[pos, "id"], {})[col] = value
+    return changes
+
+# ---------- Storage backend（SQLite） ----------
+# "pandas": 全件を DataFrame で絞り込み（従来どおり）
+# "sqlite": 絞り込み・並び替え・ページングを SQLite に任せる
+CATALOG_BACKEND = st.secrets.get("catalog_backend", "pandas")
+
+SQLITE_COLUMNS = [
+    "rowpos", "country", "style_main_jp", "brewery_local", "stock_status",
+    "abv_num", "price_num", "volume_num", "name_key", "search_blob",
+]
+
+class SqliteCatalogBackend:
+    """
+    シートから読み込んだ catalog を SQLite に写して、検索は SQL で行う。
+    返すのは df_all 内の行位置（rowpos）だけなので、表示する行だけ DataFrame から取り出す。
+    DB はプロセスごとのメモリ上に置く（rowpos はそのプロセスの df_all の行位置なので共有できない）。
+    表示には df_all も要るので、メモリは減らず DB の分だけ増える（速くなるのは絞り込みと並び替え）。
+    """
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.conn = sqlite3.connect(":memory:", check_same_thread=False)
+        self.synced_versions = None
+        self.synced_rows = []  # 店舗ごとの行数（結合表示で行位置をずらす量）
+
+    @staticmethod
+    def _row(pos, r):
+        def num(v):
+            return None if pd.isna(v) else float(v)
+
+        # 名前順は pyuca のキーを bytes のまま比べる（SQLite の BLOB は memcmp 順）
+        name_key = bytes(r.yomi_sort) if isinstance(r.yomi_sort, (bytes, bytearray)) else None
+        return (pos, r.country, r.style_main_jp, r.brewery_local, r.stock_status,
+                num(r.abv_num), num(r.price_num), num(r.volume_num),
+                name_key, r.search_blob)
+
+    def sync(self, df, versions):
+        """
+        versions = ((シート名, version), ...)。
+        前回から追える変更（CatalogStore.changes_since）だけ UPDATE / INSERT し、
+        追えない時（読み直し・他プロセスの変更・途中の店舗への追加）は作り直す。
+        """
+        with self.lock:
+            if self.synced_versions == versions:
+                return
+
+            deltas = self._deltas(versions)
+            if deltas is None:
+                self._rebuild(df, versions)
+            else:
+                for kind, positions in deltas:
+                    self._apply(df, kind, positions)
+            self.conn.commit()
+            self.synced_versions = versions
+
+    def _deltas(self, versions):
+        if self.synced_versions is None or [n for n, _ in self.synced_versions] != [n for n, _ in versions]:
+            return None
+
+        deltas = []
+        offset = 0
+        for i, ((name, old), (_, new)) in enumerate(zip(self.synced_versions, versions)):
+            changes = get_catalog_store(name).changes_since(old, new) if old <= new else None
+            if changes is None:
+                return None
+            for kind, positions in changes:
+                if kind == "append":
+                    if i != len(versions) - 1:
+                        return None  # 後ろの店舗の行位置がずれる
+                    self.synced_rows[i] += len(positions)
+                deltas.append((kind, [offset + p for p in positions]))
+            offset += self.synced_rows[i]
+        return deltas
+
+    def _apply(self, df, kind, positions):
+        c = self.conn
+        rows = [self._row(pos, r) for pos, r in zip(positions, df.iloc[positions].itertuples(index=False))]
+
+        if kind == "update":
+            # 外部コンテンツの FTS は、古い本文を渡して消してから入れ直す
+            for row in rows:
+                old = c.execute("SELECT search_blob FROM beers WHERE rowpos = ?", (row[0],)).fetchone()
+                if old is not None:
+                    c.execute(
+                        "INSERT INTO beers_fts(beers_fts, rowid, search_blob) VALUES ('delete', ?, ?)",
+                        (row[0], old[0])
+                    )
+            c.executemany(
+                f"UPDATE beers SET {', '.join(f'{col} = ?' for col in SQLITE_COLUMNS[1:])} WHERE rowpos = ?",
+                [row[1:] + row[:1] for row in rows]
+            )
+        else:
+            c.executemany(f"INSERT INTO beers VALUES ({','.join('?' * len(SQLITE_COLUMNS))})", rows)
+
+        c.executemany(
+            "INSERT INTO beers_fts(rowid, search_blob) VALUES (?, ?)",
+            [(row[0], row[-1]) for row in rows]
+        )
+
+    def _rebuild(self, df, versions):
+        rows = [self._row(pos, r) for pos, r in enumerate(df.itertuples(index=False))]
+
+        c = self.conn
+        c.executescript("""
+            DROP TABLE IF EXISTS beers;
+            DROP TABLE IF EXISTS beers_fts;
+            CREATE TABLE beers (
+                rowpos INTEGER PRIMARY KEY,
+                country TEXT, style_main_jp TEXT, brewery_local TEXT, stock_status TEXT,
+                abv_num REAL, price_num REAL, volume_num REAL,
+                name_key BLOB, search_blob TEXT
+            );
+            CREATE VIRTUAL TABLE beers_fts USING fts5(
+                search_blob, content='beers', content_rowid='rowpos', tokenize='trigram'
+            );
+        """)
+        c.executemany(f"INSERT INTO beers VALUES ({','.join('?' * len(SQLITE_COLUMNS))})", rows)
+        c.executescript("""
+            CREATE INDEX idx_beers_country ON beers(country);
+            CREATE INDEX idx_beers_style ON beers(style_main_jp);
+            CREATE INDEX idx_beers_abv ON beers(abv_num);
+            CREATE INDEX idx_beers_price ON beers(price_num);
+            CREATE INDEX idx_beers_stock ON beers(stock_status);
+            CREATE INDEX idx_beers_name ON beers(name_key);
+            INSERT INTO beers_fts(beers_fts) VALUES ('rebuild');
+        """)
+
+        # 結合表示（全店舗）は merge_catalogs と同じ順に店舗の行が並んでいる
+        if len(versions) == 1:
+            self.synced_rows = [len(df)]
+        else:
+            self.synced_rows = [int((df["shop"] == name).sum()) for name, _ in versions]
+
+    def _where(self, search_text, size_choice, abv_min, abv_max, price_min, price_max,
+               country_choice, in_stock_only, brewery_choice, styles=()):
+        # build_filtered_df と同じ条件（NULL は範囲条件で自然に除外される）
+        clauses = [
+            "abv_num >= ? AND abv_num <= ?",
+            "price_num >= ? AND price_num <= ?",
+        ]
+        params = [abv_min, abv_max, price_min, price_max]
+
+        if search_text and search_text.strip():
+            kw = fold_search(search_text.strip())
+            if len(kw) >= 3:
+                # trigram は3文字以上の部分一致をインデックスで引ける
+                clauses.append("rowpos IN (SELECT rowid FROM beers_fts WHERE beers_fts MATCH ?)")
+                params.append('"' + kw.replace('"', '""') + '"')
+            else:
+                clauses.append("instr(search_blob, ?) > 0")
+                params.append(kw)
+
+        if size_choice == "小瓶（≤500ml）":
+            clauses.append("volume_num <= 500")
+        elif size_choice == "大瓶（≥500ml）":
+            clauses.append("volume_num >= 500")
+
+        if country_choice != "すべて":
+            clauses.append("country = ?")
+            params.append(country_choice)
+
+        if in_stock_only:
+            clauses.append("stock_status = '○'")
+
+        if brewery_choice != "すべて":
+            clauses.append("brewery_local = ?")
+            params.append(brewery_choice)
+
+        if styles:
+            clauses.append(f"style_main_jp IN ({','.join('?' * len(styles))})")
+            params.extend(styles)
+
+        return " AND ".join(clauses), params
+
+    def style_candidates(self, **filters):
+        where, params = self._where(**filters)
+        with self.lock:
+            rows = self.conn.execute(
+                f"SELECT DISTINCT style_main_jp FROM beers WHERE {where} AND style_main_jp != ''",
+                params
+            ).fetchall()
+        return sorted((s for (s,) in rows), key=locale_key)
+
+    def query(self, sort_option, random_seed, limit, offset=0, **filters):
+        """(表示する rowpos のリスト, 全件数) を返す"""
+        where, params = self._where(**filters)
+
+        order_by = {
+            "名前順": "name_key IS NULL, name_key",
+            "ABV（低）": "abv_num IS NULL, abv_num ASC",
+            "ABV（高）": "abv_num IS NULL, abv_num DESC",
+            "価格（低）": "price_num IS NULL, CASE WHEN price_num = 0 THEN 1e9 ELSE price_num END",
+        }.get(sort_option)
+        order_params = []
+        if order_by is None:
+            # ランダム順: seed ごとに決まる並び（ページをまたいでも順番が変わらない）
+            order_by = "((rowpos + 1) * ?) % 2147483647"
+            order_params = [(random_seed or 0) * 2 + 1]
+
+        with self.lock:
+            total = self.conn.execute(
+                f"SELECT COUNT(*) FROM beers WHERE {where}", params
+            ).fetchone()[0]
+            rows = self.conn.execute(
+                f"SELECT rowpos FROM beers WHERE {where} ORDER BY {order_by}, rowpos LIMIT ? OFFSET ?",
+                params + order_params + [limit, offset]
+            ).fetchall()
+
+        return [pos for (pos,) in rows], total
+
+
+@st.cache_resource
+def get_sqlite_backend(view_key):
+    return SqliteCatalogBackend()
+
+
+# ---------- 似たビール（特徴ベクトル） ----------
+SIMILAR_TOP_K = 5
+# カテゴリ列と重み（違うと距離がどれだけ増えるかの目安）。
+# ハッシュすると別の値が同じ場所に落ちるので、version ごとのカテゴリ番号で比べる
+SIMILAR_CATEGORY_WEIGHTS = {
+    "style_main_jp": 2.0,
+    "style_sub_jp": 1.0,
+    "country": 1.0,
+    "brewery_local": 1.5,
+}
+SIMILAR_TABLE_MAX_ROWS = 5000      # 在庫数がこれ以下なら top-k 表を裏で作る
+PRICE_BANDS = [1, 1000, 2000, 3000, 5000]  # 0 は ASK として別扱い
+
+def similarity_features(df):
+    """
+    ABV はそのまま、価格は価格帯の one-hot にして横に並べる。
+    カテゴリ列は種類が多いので行列には入れず、category_codes() で別に比べる。
+    """
+    n = len(df)
+    rows = np.arange(n)
+    blocks = []
+
+    # ABV: 2% の差でカテゴリ1つ分くらい
+    abv = pd.to_numeric(df["abv_num"], errors="coerce").to_numpy(dtype=float, na_value=np.nan)
+    fill = np.nanmedian(abv) if np.isfinite(abv).any() else 0.0
+    blocks.append((np.where(np.isnan(abv), fill, abv) / 2.0).astype(np.float32)[:, None])
+
+    # 価格帯（不明 / ASK / 〜1000 / 〜2000 / 〜3000 / 〜5000 / それ以上）
+    price = pd.to_numeric(df["price_num"], errors="coerce").to_numpy(dtype=float, na_value=np.nan)
+    band = np.where(np.isnan(price), 0, np.digitize(np.nan_to_num(price), PRICE_BANDS) + 1)
+    price_onehot = np.zeros((n, len(PRICE_BANDS) + 2), dtype=np.float32)
+    price_onehot[rows, band] = 0.7
+    blocks.append(price_onehot)
+
+    return np.hstack(blocks)
+
+def category_codes(df):
+    """カテゴリ列ごとの番号（空欄は -1）を (行数, 列数) で返す。同じ version の中でだけ意味を持つ"""
+    codes = np.empty((len(df), len(SIMILAR_CATEGORY_WEIGHTS)), dtype=np.int64)
+    for j, col in enumerate(SIMILAR_CATEGORY_WEIGHTS):
+        values = df[col].fillna("").astype(str).to_numpy()
+        codes[:, j], _ = pd.factorize(values)
+        codes[values == "", j] = -1
+    return codes
+
+def category_distance(codes_a, codes_b):
+    """
+    カテゴリ列を one-hot（列ごとの重み w）で並べた時と同じ距離の2乗を番号から出す。
+    列ごとに 同じ値 0 / 片方だけ空欄 w² / 違う値 2w²（両方空欄は 0）。
+    最後の軸が列で、それ以外の軸はブロードキャストする。
+    """
+    d2 = np.float32(0)
+    for j, weight in enumerate(SIMILAR_CATEGORY_WEIGHTS.values()):
+        a, b = codes_a[..., j], codes_b[..., j]
+        has_a, has_b = a >= 0, b >= 0
+        same = (a == b) & has_a
+        d2 = d2 + np.float32(weight ** 2) * (has_a.astype(np.float32) + has_b - 2 * same)
+    return d2
+
+def build_similarity_table(index, k):
+    """在庫ありの各行について近い k 件の行位置を並べた表（O(在庫数²) なので裏のスレッドで作る）"""
+    matrix, sq, codes, candidates = index["matrix"], index["sq"], index["codes"], index["candidates"]
+    table = np.full((len(matrix), k), -1, dtype=np.int64)
+    cand_matrix = matrix[candidates]
+    cand_sq = sq[candidates]
+    cand_codes = codes[candidates][None, :, :]
+
+    for start in range(0, len(candidates), 256):
+        block = candidates[start:start + 256]
+        d2 = sq[block][:, None] - 2 * (matrix[block] @ cand_matrix.T) + cand_sq[None, :]
+        d2 += category_distance(codes[block][:, None, :], cand_codes)
+        d2[np.arange(len(block)), start + np.arange(len(block))] = np.inf  # 自分自身は除く
+
+        top = np.argpartition(d2, k - 1, axis=1)[:, :k]
+        order = np.take_along_axis(d2, top, axis=1).argsort(axis=1)
+        table[block] = candidates[np.take_along_axis(top, order, axis=1)]
+
+    return table
+
+@st.cache_resource(max_entries=4, show_spinner=False)
+def get_similarity_index(version, _df):
+    """
+    dataset version ごとに1回だけ特徴行列を作る。
+    小さめのカタログなら top-k 表も裏のスレッドで作り、できるまではその場で計算する。
+    """
+    index = {
+        "matrix": similarity_features(_df),
+        "codes": category_codes(_df),
+        "candidates": np.flatnonzero((_df["stock_status"] == "○").to_numpy()),
+        "table": None,
+        "table_ready": threading.Event(),
+    }
+    index["sq"] = (index["matrix"] * index["matrix"]).sum(axis=1)
+
+    k = min(SIMILAR_TOP_K, len(index["candidates"]) - 1)
+    if 0 < k and len(index["candidates"]) <= SIMILAR_TABLE_MAX_ROWS:
+        def build():
+            try:
+                index["table"] = build_similarity_table(index, k)
+            finally:
+                index["table_ready"].set()
+
+        threading.Thread(target=build, daemon=True).start()
+    else:
+        index["table_ready"].set()
+
+    return index
+
+def find_similar_positions(index, pos, k=SIMILAR_TOP_K):
+    """在庫ありの中から pos に近い行位置を近い順に返す"""
+    table = index["table"]
+    if table is not None and table[pos, 0] >= 0:
+        return table[pos][:k]
+
+    # 表がない（作っている途中 / 大きいカタログ / 在庫なしの行）ときはその場でベクトル計算
+    matrix, sq, candidates = index["matrix"], index["sq"], index["candidates"]
+    if len(candidates) == 0:
+        return candidates
+
+    d2 = sq[candidates] - 2 * (matrix[candidates] @ matrix[pos]) + sq[pos]
+    d2 += category_distance(index["codes"][candidates], index["codes"][pos])
+    d2[candidates == pos] = np.inf
+
+    k = min(k, len(candidates))
+    top = np.argpartition(d2, k - 1)[:k]
+    top = top[np.argsort(d2[top])]
+    return candidates[top][np.isfinite(d2[top])]
+
+def similar_beers_html(df, positions):
+    if len(positions) == 0:
+        return "<span style='color:#666;'>似たビールが見つかりません</span>"
+
+    items = []
+    for r in df.iloc[positions].itertuples(index=False):
+        style_line = " / ".join(filter(None, [r.style_main_jp, r.style_sub_jp]))
+        items.append(
+            f"<li><b>{r.name_local}</b> / {r.name_jp}<br>"
+            f"<span style='color:#666;'>{r.brewery_jp} / {style_line} / {beer_info_line(r)}</span></li>"
+        )
+    return "<ul class='similar-beers'>" + "".join(items) + "</ul>"
+
+
+# ---------- 静的メニュー（よく使うプリセットの事前描画） ----------
+MENU_SNAPSHOT_DIR = "menu_snapshots"
+MENU_SNAPSHOT_KEEP_SECONDS = 60 * 60  # 他のプロセスがまだ使っているかもしれないので、古い版もしばらく残す
+MENU_SIZES = {"all": "すべて", "small": "小瓶（≤500ml）", "large": "大瓶（≥500ml）"}
+
+MENU_CARD_CSS = """
+<style>
+.menu-card {
+    display: flex;
+    gap: 16px;
+    background: #f4f9ff;
+    border: 1px solid #cfe3f8;
+    border-radius: 12px;
+    padding: 14px 16px;
+    margin-bottom: 14px;
+    box-shadow: 0 2px 6px rgba(0,0,0,0.06);
+}
+.menu-card-img {
+    flex: 3;
+    display: flex;
+    justify-content: center;
+    align-items: center;
+}
+.menu-card-img img {
+    height: 170px;
+    object-fit: contain;
+}
+.menu-card-body {
+    flex: 5;
+}
+@media print {
+    .menu-card { break-inside: avoid; box-shadow: none; }
+}
+</style>
+"""
+
+def beer_info_line(r):
+    info_arr = []
+    if pd.notna(r.abv_num):
+        info_arr.append(f"ABV {r.abv_num}%")
+    if pd.notna(r.volume_num):
+        info_arr.append(f"{int(r.volume_num)}ml")
+    if pd.notna(r.vintage) and str(r.vintage).strip():
+        info_arr.append(str(r.vintage).strip())
+    if pd.notna(r.price_num):
+        info_arr.append("ASK" if r.price_num == 0 else f"¥{int(r.price_num)}")
+    return " | ".join(info_arr)
+
+def brewery_page_url(brewery, shop):
+    """醸造所ページへのリンク（shop は今の表示の ?shop= をそのまま引き継ぐ）"""
+    return "?" + urlencode({"view": "brewery", "brewery": brewery, "shop": shop})
+
+def brewery_link_html(r, shop):
     return (
-        df[
-            (df["brewery_jp"] != "") &
-            (df["brewery_local"] != "")
-        ][["brewery_jp", "brewery_local"]]
-        .drop_duplicates()
-        .sort_values("brewery_jp")
-        .to_dict("records")
+        f'<a href="{brewery_page_url(r.brewery_local, shop)}" target="_self" '
+        f'style="text-decoration:none;color:inherit;"><b>{r.brewery_local}</b></a>'
     )
 
-def get_style_master(df):
-    styles = (
-        df[["style_main_jp", "style_sub_jp"]]
-        .fillna("")
+def render_beer_card_html(r, shop, similar_html=""):
+    """render_beer_card と同じ内容の静的 HTML（ボタンの代わりに details を使う）"""
+    beer_img = r.beer_image_url or DEFAULT_BEER_IMG  # リンク切れは描画時に apply_image_fallback で差し替え
+    flag_html = (
+        f"<img src='{r.flag_url}' width='18' style='vertical-align:middle;margin-right:6px;'>"
+        if r.flag_url else ""
     )
+    style_line = " / ".join(filter(None, [r.style_main_jp, r.style_sub_jp]))
 
-    main = styles["style_main_jp"].unique().tolist()
-    sub  = styles["style_sub_jp"].unique().tolist()
+    detail_html = ""
+    if r.detailed_comment and r.detailed_comment.strip():
+        detail_html = (
+            f'<details><summary>詳細コメント</summary>'
+            f'<div class="detail-comment">{r.detailed_comment}</div></details>'
+        )
+
+    # markdown にそのまま渡すので、空行・インデントは入れない
+    return "".join([
+        '<div class="menu-card">',
+        f'<div class="menu-card-img"><img src="{beer_img}" loading="lazy"></div>',
+        '<div class="menu-card-body">',
+        f'<div>{flag_html}{brewery_link_html(r, shop)} / <span style="color:#666;">{r.brewery_jp}</span></div>',
+        f'<a href="{r.untappd_url}" target="_blank" style="text-decoration:none;color:inherit;">',
+        f'<b style="font-size:1.15em;">{r.name_local}</b><br>',
+        f'<span style="font-size:0.95em;">{r.name_jp}</span></a><br>',
+        f'<span style="color:#666;">{style_line}</span><br>',
+        f'{beer_info_line(r)}<br>',
+        f'{r.comment or ""}',
+        detail_html,
+        f'<details><summary>似たビール</summary>{similar_html}</details>' if similar_html else "",
+        '</div></div>',
+    ])
+
+def menu_preset_key(country_choice, size_choice):
+    size_key = next((k for k, v in MENU_SIZES.items() if v == size_choice), None)
+    if size_key is None:
+        return None
+    country_key = "all" if country_choice == "すべて" else country_choice
+    return f"{country_key}_{size_key}"
+
+def menu_page_html(title, cards):
+    return MENU_CARD_CSS + f"<h2>{title}</h2>\n" + "\n".join(cards)
+
+def catalog_content_tag(df):
+    """catalog の中身から決まる名前（プロセスごとの version と違い、同じ中身なら同じ名前になる）"""
+    row_hashes = pd.util.hash_pandas_object(df, index=False).to_numpy()
+    return hashlib.sha1(row_hashes.tobytes()).hexdigest()[:12]
+
+def build_menu_snapshots(shop, version, df):
+    """
+    お客さん向けの定番プリセット（国 × サイズ、在庫あり、名前順）を
+    HTML にして、中身から決まる名前のディレクトリへ書き出す（MenuSnapshots が裏で呼ぶ）。
+    """
+    def file_safe(s):
+        return "".join(ch if ch.isalnum() else "_" for ch in s)
+
+    view_dir = os.path.join(MENU_SNAPSHOT_DIR, file_safe(shop))
+    tag = catalog_content_tag(df)
+    out_dir = os.path.join(view_dir, tag)
+
+    # しばらく誰も書いていない古い中身のディレクトリだけ消す
+    if os.path.isdir(view_dir):
+        now = time.time()
+        for old in os.listdir(view_dir):
+            path = os.path.join(view_dir, old)
+            if old != tag and now - os.path.getmtime(path) > MENU_SNAPSHOT_KEEP_SECONDS:
+                shutil.rmtree(path, ignore_errors=True)
+    os.makedirs(out_dir, exist_ok=True)
+    os.utime(out_dir)
+
+    in_stock = df[df["stock_status"] == "○"]
+    snapshots = {}
+
+    # 似たビールは top-k 表があるときだけ埋め込む（行ごとに1回だけ作る）
+    sim_index = get_similarity_index(version, df)
+    sim_index["table_ready"].wait()
+    similar_cache = {}
+
+    def similar_for(pos):
+        if sim_index["table"] is None:
+            return ""
+        if pos not in similar_cache:
+            similar_cache[pos] = similar_beers_html(df, find_similar_positions(sim_index, pos))
+        return similar_cache[pos]
+
+    for country in ["すべて"] + get_countries_for_filter(in_stock):
+        for size_choice in MENU_SIZES.values():
+            d = build_filtered_df(
+                in_stock,
+                catalog_version=(version, "customer"),
+                search_text="",
+                size_choice=size_choice,
+                abv_min=DEFAULT_ABV_RANGE[0],
+                abv_max=DEFAULT_ABV_RANGE[1],
+                price_min=DEFAULT_PRICE_RANGE[0],
+                price_max=DEFAULT_PRICE_RANGE[1],
+                country_choice=country,
+            ).sort_values(by="yomi_sort", na_position="last")
+
+            key = menu_preset_key(country, size_choice)
+            cards = [render_beer_card_html(r, shop, similar_for(r.Index)) for r in d.itertuples()]
+            snapshots[key] = {
+                "count": len(d),
+                "styles": get_style_candidates(d),
+                "cards": cards,
+            }
+
+            title = f"{COUNTRY_INFO.get(country, {}).get('jp', country)} / {size_choice}"
+            # 同じ中身のプロセスが同じファイルを書くので、一時ファイルから差し替える
+            path = os.path.join(out_dir, f"{file_safe(key)}.html")
+            with open(f"{path}.{os.getpid()}.tmp", "w", encoding="utf-8") as f:
+                f.write(
+                    f"<!DOCTYPE html><html><head><meta charset='utf-8'><title>{title}</title></head>"
+                    f"<body>{menu_page_html(title, cards)}</body></html>"
+                )
+            os.replace(f"{path}.{os.getpid()}.tmp", path)
+
+    return snapshots
+
+class MenuSnapshots:
+    """
+    表示（?shop= の値）ごとの静的メニュー。version が変わったら裏のスレッドで作り直し、
+    できるまでは前の version のものを返す（お客さんの rerun では作らない）。
+    """
+    def __init__(self, shop):
+        self.shop = shop
+        self.lock = threading.Lock()
+        self.version = None
+        self.snapshots = None
+        self.building = False
+        self.first_built = threading.Event()  # 1回目の作成が終わった（失敗も含む）
+
+    def get(self, version, df, wait=False):
+        """
+        今ある中で最新のもの（まだ1つもなければ None）。
+        wait=True なら、1つもない時だけ1回目ができるまで待つ（印刷用の表示）。
+        """
+        with self.lock:
+            if self.version != version and not self.building:
+                self.building = True
+                add_script_run_ctx(threading.Thread(
+                    target=self._build, args=(version, df), daemon=True
+                )).start()
+        if wait:
+            self.first_built.wait()
+        return self.snapshots
+
+    def _build(self, version, df):
+        try:
+            snapshots = build_menu_snapshots(self.shop, version, df)
+            with self.lock:
+                self.version, self.snapshots = version, snapshots
+        finally:
+            with self.lock:
+                self.building = False
+            self.first_built.set()
+
+@st.cache_resource(show_spinner=False)
+def get_menu_snapshots(shop):
+    return MenuSnapshots(shop)
+
+
+# ---------- 読み取り専用カタログ API（サイネージ・POS 用） ----------
+# secrets の catalog_api_port（例: 8502）を設定すると有効。認証はないので、店内 LAN など閉じた所でだけ使う。
+# GET http://<host>:<port>/catalog.json?country=Belgium&style=IPA&stock=○&shop=Sheet1
+# stock の既定は ○（stock=all で全件）。ETag / If-None-Match に対応し、変化がなければ 304。
+CATALOG_API_PORT = int(st.secrets.get("catalog_api_port", 0))  # 0 で無効
+CATALOG_API_CACHE_SIZE = 64
+
+CATALOG_API_COLUMNS = {
+    "id": "id",
+    "name_jp": "name_jp",
+    "name_local": "name_local",
+    "brewery_jp": "brewery_jp",
+    "brewery_local": "brewery_local",
+    "country": "country",
+    "style_main_jp": "style_main_jp",
+    "style_sub_jp": "style_sub_jp",
+    "abv_num": "abv",
+    "volume_num": "volume",
+    "price_num": "price",
+    "stock_status": "stock",
+    "comment": "comment",
+    "beer_image_url": "beer_image_url",
+    "untappd_url": "untappd_url",
+}
+
+class CatalogApiCache:
+    """(シート, version, 形式, 条件) ごとに ETag・本文・gzip 済み本文を持つ小さな LRU"""
+    def __init__(self, size=CATALOG_API_CACHE_SIZE):
+        self.size = size
+        self.lock = threading.Lock()
+        self.entries = collections.OrderedDict()
+
+    def get(self, key, build):
+        with self.lock:
+            if key in self.entries:
+                self.entries.move_to_end(key)
+                return self.entries[key]
+
+        content_type, body = build()
+        entry = {
+            # 中身から作るので、version が進んでも内容が同じなら同じ ETag
+            "etag": '"' + hashlib.sha1(body).hexdigest()[:20] + '"',
+            "content_type": content_type,
+            "body": body,
+            "gzip": gzip.compress(body, compresslevel=6),
+        }
+
+        with self.lock:
+            self.entries[key] = entry
+            self.entries.move_to_end(key)
+            while len(self.entries) > self.size:
+                self.entries.popitem(last=False)
+        return entry
+
+def build_api_body(df, fmt, country, style, stock):
+    d = df
+    if stock != "all":
+        d = d[d["stock_status"] == stock]
+    if country:
+        d = d[d["country"] == country]
+    if style:
+        d = d[d["style_main_jp"] == style]
+
+    d = d.sort_values("yomi_sort")[list(CATALOG_API_COLUMNS)].rename(columns=CATALOG_API_COLUMNS)
+
+    if fmt == "csv":
+        return "text/csv; charset=utf-8", d.to_csv(index=False).encode("utf-8")
+    return "application/json; charset=utf-8", d.to_json(orient="records", force_ascii=False).encode("utf-8")
+
+def etag_matches(header, etag):
+    if not header:
+        return False
+    tags = [t.strip() for t in header.split(",")]
+    return "*" in tags or etag in tags or f"W/{etag}" in tags
+
+class CatalogApiHandler(BaseHTTPRequestHandler):
+    cache = CatalogApiCache()
+
+    def do_GET(self):
+        # 起動したセッションの ScriptRunContext を借りる（cache_resource を引けるように）
+        add_script_run_ctx(None, self.server.script_ctx)
+
+        url = urlparse(self.path)
+        fmt = {"/catalog.json": "json", "/catalog.csv": "csv"}.get(url.path)
+        if fmt is None:
+            self.send_error(404)
+            return
+
+        q = {k: v[-1] for k, v in parse_qs(url.query).items()}
+        sheet_name = q.get("shop", next(iter(SHOP_SHEETS)))
+        if sheet_name not in SHOP_SHEETS:
+            self.send_error(404, "unknown shop")
+            return
+
+        try:
+            store = get_catalog_store(sheet_name)
+            fetch_into_store(store, get_worksheet(sheet_name))
+            df, version = store.snapshot()
+        except Exception:
+            self.send_error(503, "catalog unavailable")
+            return
+
+        country, style, stock = q.get("country", ""), q.get("style", ""), q.get("stock", "○")
+        entry = self.cache.get(
+            (sheet_name, version, fmt, country, style, stock),
+            lambda: build_api_body(df, fmt, country, style, stock)
+        )
+
+        if etag_matches(self.headers.get("If-None-Match"), entry["etag"]):
+            self.send_response(304)
+            self.send_header("ETag", entry["etag"])
+            self.end_headers()
+            return
+
+        use_gzip = "gzip" in self.headers.get("Accept-Encoding", "")
+        body = entry["gzip"] if use_gzip else entry["body"]
+
+        self.send_response(200)
+        self.send_header("Content-Type", entry["content_type"])
+        self.send_header("Content-Length", str(len(body)))
+        self.send_header("ETag", entry["etag"])
+        self.send_header("Cache-Control", "no-cache")
+        self.send_header("Vary", "Accept-Encoding")
+        self.send_header("Access-Control-Allow-Origin", "*")
+        if use_gzip:
+            self.send_header("Content-Encoding", "gzip")
+        self.end_headers()
+        self.wfile.write(body)
+
+    def log_message(self, format, *args):
+        pass  # ポーリングのたびにログを出さない
+
+@st.cache_resource
+def start_catalog_api(port):
+    try:
+        server = ThreadingHTTPServer(("0.0.0.0", port), CatalogApiHandler)
+    except OSError:
+        return None  # 他のワーカーがすでに起動している
+    server.daemon_threads = True
+    server.script_ctx = get_script_run_ctx()
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    return server
+
+
+# ---------- リンク切れチェック（画像・Untappd の URL） ----------
+# 全 URL を裏のスレッドプールで HEAD して、結果を URL ごとに TTL 付きで覚えておく。
+# 描画時は結果を見るだけ（チェックを待たない）。
+URL_CHECK_COLUMNS = ["beer_image_url", "untappd_url"]  # 醸造所画像は醸造所ページで読んだ時に調べる
+URL_CHECK_WORKERS = 8
+URL_CHECK_TIMEOUT = 5            # 秒
+URL_CHECK_TTL = 6 * 60 * 60      # 秒（この間は同じ URL を見直さない）
+
+# ボット避けで HEAD を拒否するだけのサイト（Untappd など）は「切れている」とは扱わない
+URL_CHECK_IGNORED_STATUS = {401, 403, 429}
+
+class UrlChecker:
+    def __init__(self, workers=URL_CHECK_WORKERS, ttl=URL_CHECK_TTL, timeout=URL_CHECK_TIMEOUT):
+        self.executor = ThreadPoolExecutor(max_workers=workers, thread_name_prefix="url-check")
+        self.ttl = ttl
+        self.timeout = timeout
+        self.lock = threading.Lock()
+        self.results = {}    # url -> (ok, 詳細, 確認時刻)
+        self.pending = set()
+        self.scheduled = {}  # version -> 最後に投入した時刻
+
+    def _request(self, url, method):
+        req = urllib.request.Request(url, method=method, headers={"User-Agent": "Mozilla/5.0 (beer-catalog link check)"})
+        if method == "GET":
+            req.add_header("Range", "bytes=0-0")
+        with urllib.request.urlopen(req, timeout=self.timeout) as resp:
+            return resp.status
+
+    def _check(self, url):
+        try:
+            try:
+                status = self._request(url, "HEAD")
+            except urllib.error.HTTPError as e:
+                # HEAD に対応していないサーバーは GET（先頭1バイト）で確かめる
+                if e.code not in (405, 501):
+                    raise
+                status = self._request(url, "GET")
+            ok, detail = True, str(status)
+        except urllib.error.HTTPError as e:
+            ok, detail = e.code in URL_CHECK_IGNORED_STATUS, str(e.code)
+        except Exception as e:
+            ok, detail = False, type(e).__name__
+
+        with self.lock:
+            self.results[url] = (ok, detail, time.time())
+            self.pending.discard(url)
+
+    def schedule(self, version, urls):
+        """version ごとに1回（TTL が切れたらもう1回）、未確認・期限切れの URL を投入する"""
+        now = time.time()
+        with self.lock:
+            if now - self.scheduled.get(version, 0) < self.ttl:
+                return
+            self.scheduled[version] = now
+
+            todo = []
+            for url in urls:
+                if url in self.pending:
+                    continue
+                if not url.startswith(("http://", "https://")):
+                    self.results[url] = (False, "invalid URL", now)
+                    continue
+                checked = self.results.get(url)
+                if checked is None or now - checked[2] >= self.ttl:
+                    todo.append(url)
+            self.pending.update(todo)
+
+        for url in todo:
+            self.executor.submit(self._check, url)
+
+    def is_broken(self, url):
+        checked = self.results.get(url)
+        return checked is not None and not checked[0]
+
+    def detail(self, url):
+        checked = self.results.get(url)
+        return checked[1] if checked else ""
+
+    def reset(self):
+        with self.lock:
+            self.results.clear()
+            self.scheduled.clear()
+
+@st.cache_resource
+def get_url_checker():
+    return UrlChecker()
+
+@st.cache_resource(max_entries=4)
+def catalog_urls(version, _df):
+    urls = set()
+    for col in URL_CHECK_COLUMNS:
+        urls.update(u.strip() for u in _df[col].astype(str) if u.strip() and u != "nan")
+    return tuple(urls)
+
+def image_or_default(url):
+    # 切れていると分かっている画像はデフォルト画像に差し替える
+    url = (url or "").strip()
+    if not url or get_url_checker().is_broken(url):
+        return DEFAULT_BEER_IMG
+    return url
+
+IMG_SRC_RE = re.compile(r'(<img src=["\'])([^"\']*)(["\'])')
+
+def apply_image_fallback(html):
+    """事前描画したカード HTML の画像も、描画時に同じように差し替える"""
+    return IMG_SRC_RE.sub(lambda m: m.group(1) + image_or_default(m.group(2)) + m.group(3), html)
+
+
+# ---------- 醸造所ページ（醸造所 → 行位置、説明は開いた時に読む） ----------
+@st.cache_resource(max_entries=4)
+def get_brewery_groups(version, _df):
+    """brewery_local -> 行位置の配列（version ごとに1回だけ groupby）"""
+    named = _df[_df["brewery_local"] != ""]
+    return {
+        name: named.index[idx]
+        for name, idx in named.groupby("brewery_local", sort=False).indices.items()
+    }
+
+
+# ---------- 店舗（ワークシート）選択 ----------
+SHOP_SHEETS = dict(st.secrets.get("shop_sheets", SHOP_SHEETS))
+
+shop_param = st.query_params.get("shop", next(iter(SHOP_SHEETS)))
+if shop_param == ALL_SHOPS:
+    active_sheets = list(SHOP_SHEETS)
+elif shop_param in SHOP_SHEETS:
+    active_sheets = [shop_param]
+else:
+    active_sheets = [next(iter(SHOP_SHEETS))]
+
+if CATALOG_API_PORT:
+    start_catalog_api(CATALOG_API_PORT)
+
+# 1店舗表示の時だけ編集できる（全店舗表示は閲覧のみ）
+current_sheet = active_sheets[0] if len(active_sheets) == 1 else None
 
-    main = sorted({s for s in main if s.strip()})
-    sub  = sorted({s for s in sub if s.strip()})
+# --- load_data の外 ---
+load_catalogs(active_sheets)
+store_snapshots = {n: get_catalog_store(n).snapshot() for n in active_sheets}
+catalogs = {n: df for n, (df, _) in store_snapshots.items()}
+catalog_versions = tuple((n, version) for n, (_, version) in store_snapshots.items())
+
+# 段階読み込みで続きのチャンクを待っているか
+catalog_loading = any(get_catalog_store(n).loading for n in active_sheets)
+for n in active_sheets:
+    if get_catalog_store(n).load_error:
+        st.warning(f"{SHOP_SHEETS.get(n, n)} の読み込みが途中で止まりました: {get_catalog_store(n).load_error}")
+
+if current_sheet:
+    df_all = catalogs[current_sheet]
+else:
+    df_all = merge_catalogs(catalog_versions, catalogs)
+
+catalog_version = catalog_versions  # キャッシュキー用
 
-    return main, sub
+if is_admin:
+    base_df = df_all
+else:
+    base_df = df_all[df_all["stock_status"] == "○"]
+
+# 段階読み込み中は全件そろってから調べる
+if not catalog_loading:
+    get_url_checker().schedule(catalog_version, catalog_urls(catalog_version, df_all))
+
+# ---------- 新規追加 master ----------
+# 1店舗表示は store 側で差分更新しているもの、全店舗表示は version ごとに1回だけ作る
+if current_sheet:
+    master = get_catalog_store(current_sheet).master
+else:
+    master = get_merged_master(catalog_version, df_all)
 
 def add_new_beer_simple(
     name_jp, name_local, brewery_jp, brewery_local,
     country, style_main_jp, style_sub_jp,
     abv, volume, price, in_stock,
-    beer_image_url, untappd_url, comment, detailed_comment
+    beer_image_url, untappd_url, comment, detailed_comment,
+    sheet_name=SHEET_NAME
 ):
     try:
-        # --- 認証 ---
-        SCOPES = [
-            "https://www.googleapis.com/auth/spreadsheets",
-            "https://www.googleapis.com/auth/drive"
-        ]
-
-        creds = Credentials.from_service_account_info(
-            st.secrets["gcp_service_account"],
-            scopes=SCOPES
-        )
+        sheet = get_worksheet(sheet_name)
+        store = get_catalog_store(sheet_name)
 
-        client = gspread.authorize(creds)
-        sheet = client.open_by_key(SHEET_KEY).worksheet(SHEET_NAME)
-
-        # --- 既存データ取得（ID採番用） ---
-        df = load_data()
-
-        if "id" in df.columns and not df["id"].isna().all():
-            new_id = int(pd.to_numeric(df["id"], errors="coerce").max()) + 1
-        else:
-            new_id = 1
+        # 段階読み込みの途中は最大IDも行位置も確定していない
+        if store.loading:
+            st.warning("カタログを読み込み中です。読み込み完了後にもう一度お試しください。")
+            return
 
         # --- 新規行 ---
         new_row = {
-            "id": new_id,
+            "id": None,  # 追記直前に採番
             "name_jp": name_jp,
             "name_local": name_local,
             "yomi": "",
@@ -462,13 +2400,21 @@ def add_new_beer_simple(
             "beer_image_url": beer_image_url,
         }
 
-        # --- ヘッダー順に合わせる ---
-        headers = sheet.row_values(1)
-        row_data = [str(new_row.get(col, "")) for col in headers]
+        headers = sheets_call(sheet.row_values, 1)
+
+        # 採番から追記まで store をロックして、同時追加でIDが重ならないようにする
+        # （共有時は他のプロセスとも。load_data() がロック中に最新の manifest を読み直す）
+        with store.lock, shared_catalog_lock(sheet_name):
+            new_row["id"] = next_beer_id(load_data(sheet_name))
+
+            # --- ヘッダー順に合わせる ---
+            row_data = [str(new_row.get(col, "")) for col in headers]
 
-        sheet.append_row(row_data)
+            sheets_call(sheet.append_row, row_data)
+
+            # --- 追加行だけ反映（全件再取得しない） ---
+            store.append(prepare_catalog(pd.DataFrame([new_row])))
 
-        st.cache_data.clear()
         st.success("ビールを追加しました！")
         st.rerun()
 
@@ -476,6 +2422,99 @@ def add_new_beer_simple(
         st.error(f"追加中にエラーが発生しました: {e}")
 
 
+# ---------- 一括インポート（Excel / CSV） ----------
+def read_import_file(uploaded):
+    if uploaded.name.lower().endswith(".csv"):
+        try:
+            raw = pd.read_csv(uploaded, dtype=str, keep_default_na=False, encoding="utf-8-sig")
+        except UnicodeDecodeError:
+            # Excel で保存した CSV は Shift_JIS のことが多い
+            uploaded.seek(0)
+            raw = pd.read_csv(uploaded, dtype=str, keep_default_na=False, encoding="cp932")
+    else:
+        raw = pd.read_excel(uploaded, dtype=str, engine="openpyxl").fillna("")
+
+    raw.columns = [str(c).strip() for c in raw.columns]
+    return raw
+
+def validate_import_frame(raw, df):
+    """
+    取り込みファイルを列単位でまとめてチェックする。
+    戻り値: (取り込む行, エラー行)
+    """
+    # id は取り込み時にまとめて採番するので無視する
+    cols = [c for c in EXPECTED_COLUMNS if c != "id"]
+    d = raw.reindex(columns=cols, fill_value="").fillna("").astype(str)
+    d = d.apply(lambda s: s.str.strip())
+
+    abv = pd.to_numeric(d["abv"], errors="coerce")
+    price = pd.to_numeric(d["price"].str.replace(r"[^\d.]", "", regex=True), errors="coerce")
+    volume = pd.to_numeric(d["volume"].str.replace(r"[^\d.]", "", regex=True), errors="coerce")
+
+    # 先頭の 0 の有無（シート側は数値として読まれる）を気にせず比べる
+    jan = d["jan"].map(normalize_jan)
+    known_jan = set(df["jan"].map(normalize_jan)) - {""}
+
+    checks = {
+        "ビール名がありません": (d["name_local"] == "") & (d["name_jp"] == ""),
+        "ABVが不正です": (d["abv"] != "") & (abv.isna() | (abv < 0) | (abv > 100)),
+        "価格が不正です": (d["price"] != "") & price.isna(),
+        "容量が不正です": (d["volume"] != "") & volume.isna(),
+        "JANが登録済みです": (jan != "") & jan.isin(known_jan),
+        "JANがファイル内で重複しています": (jan != "") & jan.duplicated(keep=False),
+    }
+
+    reasons = pd.Series("", index=d.index)
+    for label, mask in checks.items():
+        reasons = reasons.where(~mask, reasons + label + " ")
+
+    # 在庫表記はシートと同じ ○ / △ / × にそろえる
+    d["in_stock"] = d["in_stock"].map(stock_status)
+
+    bad = reasons != ""
+    errors = raw[bad].assign(エラー=reasons[bad].str.strip())
+    return d[~bad], errors
+
+def bulk_import_beers(new_rows, sheet_name=SHEET_NAME):
+    try:
+        sheet = get_worksheet(sheet_name)
+        store = get_catalog_store(sheet_name)
+
+        if store.loading:
+            st.warning("カタログを読み込み中です。読み込み完了後にもう一度お試しください。")
+            return
+
+        headers = sheets_call(sheet.row_values, 1)
+
+        with store.lock, shared_catalog_lock(sheet_name):
+            # --- ID をまとめて確保 ---
+            start_id = next_beer_id(load_data(sheet_name))
+            new_rows = new_rows.copy()
+            new_rows.insert(0, "id", range(start_id, start_id + len(new_rows)))
+
+            # --- ヘッダー順に合わせて1回で追記 ---
+            rows = (
+                new_rows
+                .reindex(columns=headers, fill_value="")
+                .astype(str)
+                .values
+                .tolist()
+            )
+            sheets_call(sheet.append_rows, rows)
+
+            # --- 追加分だけ反映 ---
+            store.append(prepare_catalog(new_rows), brewery_details_of(new_rows))
+
+        # アップローダーの key を変えてファイルを外す（残っていると同じ行をもう一度追加できてしまう）
+        st.session_state["bulk_import_gen"] = st.session_state.get("bulk_import_gen", 0) + 1
+
+        st.success(f"{len(new_rows)} 件のビールを追加しました！")
+        st.rerun()
+
+    except Exception as e:
+        st.error(f"一括追加中にエラーが発生しました: {e}")
+
+
 # ---------- ランダム順用 state 初期化 ----------
 if "prev_sort_option" not in st.session_state:
     st.session_state.prev_sort_option = None
@@ -487,56 +2526,178 @@ if "edit_id" not in st.session_state:
     st.session_state.edit_id = None
 
 
-# ---------- style checkbox state 初期化 ----------
-if "style_state_init" not in st.session_state:
-    for s in df_all["style_main_jp"].dropna().unique():
-        st.session_state[f"style_{s}"] = False
-    st.session_state["style_state_init"] = True
+# ---------- フィルタ state（1つのオブジェクトにまとめる） ----------
+@dataclass
+class FilterState:
+    styles: set = field(default_factory=set)         # チェック中のスタイル
+    dirty: bool = False                               # フィルタが変わったら True（on_change で立てる）
+    open_details: set = field(default_factory=set)   # 詳細コメントを開いているカード
+    open_similar: set = field(default_factory=set)   # 似たビールを開いているカード
+    visible_cards: set = field(default_factory=set)  # 前回描画したカード
+
+def mark_filters_dirty():
+    st.session_state.filter_state.dirty = True
+
+def pick_suggestion(text):
+    st.session_state["search_text"] = text
+    mark_filters_dirty()
+
+def on_style_change(style):
+    fs = st.session_state.filter_state
+    if st.session_state.get(f"style_{style}"):
+        fs.styles.add(style)
+    else:
+        fs.styles.discard(style)
+    fs.dirty = True
+
+# カードごとの widget key（画面から外れたら消す）
+CARD_KEY_PREFIXES = ("btn", "similar", "edit", "stock", "price", "comment", "detailed", "save")
+
+def evict_stale_card_state(fs, rendered):
+    for card in fs.visible_cards - rendered:
+        for p in CARD_KEY_PREFIXES:
+            st.session_state.pop(f"{p}_{card}", None)
+        fs.open_details.discard(card)
+        fs.open_similar.discard(card)
+    fs.visible_cards = rendered
+
+def deep_sizeof(obj, seen=None):
+    """中身までたどったおおよそのバイト数（同じオブジェクトは1回だけ数える）"""
+    if seen is None:
+        seen = set()
+    if id(obj) in seen:
+        return 0
+    seen.add(id(obj))
+
+    if isinstance(obj, pd.DataFrame):
+        return int(obj.memory_usage(deep=True).sum())
+    if isinstance(obj, pd.Series):
+        return int(obj.memory_usage(deep=True))
+
+    size = sys.getsizeof(obj)
+    if isinstance(obj, dict):
+        size += sum(deep_sizeof(k, seen) + deep_sizeof(v, seen) for k, v in obj.items())
+    elif isinstance(obj, (list, tuple, set, frozenset)):
+        size += sum(deep_sizeof(v, seen) for v in obj)
+    elif hasattr(obj, "__dict__") and not isinstance(obj, type):
+        # dataclass（FilterState など）は属性をたどる
+        size += deep_sizeof(vars(obj), seen)
+    return size
+
+def session_state_footprint():
+    """(キー数, おおよそのバイト数) を返す（管理画面の確認用）"""
+    # pickle は再実行のたびに作り直される FilterState で失敗するので使わない
+    seen = set()
+    total = sum(
+        deep_sizeof(k, seen) + deep_sizeof(v, seen)
+        for k, v in st.session_state.items()
+    )
+    return len(st.session_state), total
 
+if "filter_state" not in st.session_state:
+    st.session_state.filter_state = FilterState()
 
-# ---------- Initialize show limit and filter signature ----------
+filter_state = st.session_state.filter_state
+
+
+# ---------- Initialize show limit ----------
 if "show_limit" not in st.session_state:
     st.session_state.show_limit = 10   # ▼ Step1: 初期表示件数（10件）
 
-# helper: compute a signature for current filters so we can reset show_limit when filters change
-def compute_filter_signature():
-    # include keys that affect filtered result
+# フィルタが変わったら表示上限をリセット（変更検知は dirty フラグだけ見る）
+if filter_state.dirty:
+    st.session_state.show_limit = 10
+    filter_state.open_details.clear()
+    filter_state.open_similar.clear()
+    filter_state.dirty = False
 
-    # 国ラジオ（日本語） → country_choice（英語） に変換
-    country_radio = st.session_state.get("country_radio", "すべて")
-    if country_radio == "すべて":
-        country_choice = "すべて"
+
+# ---------- 印刷・サイネージ用表示（?view=print&preset=Belgium_small） ----------
+if st.query_params.get("view") == "print":
+    print_snapshots = get_menu_snapshots(current_sheet or ALL_SHOPS).get(catalog_version, df_all, wait=True) or {}
+    print_key = st.query_params.get("preset", menu_preset_key("Belgium", "小瓶（≤500ml）"))
+    snap = print_snapshots.get(print_key)
+
+    st.markdown("""
+    <style>
+    header, footer, [data-testid="stToolbar"] { display: none !important; }
+    .block-container { padding-top: 1rem !important; }
+    </style>
+    """, unsafe_allow_html=True)
+
+    if snap is None:
+        st.error(f"プリセットが見つかりません: {print_key}")
+        st.caption("使えるプリセット: " + ", ".join(sorted(print_snapshots)))
     else:
-        country_choice = next(
-            (k for k, v in COUNTRY_INFO.items() if v.get("jp") == country_radio),
-            country_radio
-        )
+        country_key, size_key = print_key.rsplit("_", 1)
+        country_label = "すべて" if country_key == "all" else COUNTRY_INFO.get(country_key, {}).get("jp", country_key)
+        title = f"{country_label} / {MENU_SIZES[size_key]}"
+        st.markdown(apply_image_fallback(menu_page_html(title, snap["cards"])), unsafe_allow_html=True)
+    st.stop()
+
+
+# ---------- 醸造所ページ（?view=brewery&brewery=Cantillon） ----------
+if st.query_params.get("view") == "brewery":
+    brewery_groups = get_brewery_groups(catalog_version, df_all)
+    in_stock_mask = (df_all["stock_status"] == "○").to_numpy()
+
+    # お客さんには在庫ありのビールがある醸造所だけ出す
+    brewery_names = sorted(
+        (name for name, pos in brewery_groups.items() if is_admin or in_stock_mask[pos].any()),
+        key=lambda name: df_all.at[brewery_groups[name][0], "brewery_jp"] or name
+    )
 
-    keys = [
-        st.session_state.get("search_text",""),
-        st.session_state.get("sort_option",""),
-        st.session_state.get("size_choice",""),
-        str(st.session_state.get("abv_slider","")),
-        str(st.session_state.get("price_slider","")),
-        st.session_state.get("country_radio","")
-    ]
-    # include style selections
-    style_keys = [k for k in st.session_state.keys() if k.startswith("style_")]
-    style_vals = [f"{k}:{st.session_state.get(k)}" for k in sorted(style_keys)]
-    sig = "|".join(keys + style_vals)
-    return sig
-
-if "prev_filter_sig" not in st.session_state:
-    st.session_state.prev_filter_sig = compute_filter_signature()
-else:
-    current_sig = compute_filter_signature()
-    if current_sig != st.session_state.prev_filter_sig:
-        # フィルタが変わったら表示上限をリセット
-        st.session_state.show_limit = 10
-        st.session_state.prev_filter_sig = current_sig
-        for key in list(st.session_state.keys()):
-            if key.startswith("detail_") or key == "open_detail":
-                del st.session_state[key]
+    if not brewery_names:
+        st.info("表示できる醸造所がありません")
+        st.stop()
+
+    requested = st.query_params.get("brewery")
+    brewery = st.selectbox(
+        "醸造所",
+        brewery_names,
+        index=brewery_names.index(requested) if requested in brewery_names else 0,
+        format_func=lambda name: " / ".join(filter(None, [df_all.at[brewery_groups[name][0], "brewery_jp"], name])),
+        key="brewery_page"
+    )
+    st.query_params["brewery"] = brewery
+
+    positions = brewery_groups[brewery]
+    first = df_all.loc[positions[0]]
+
+    # 説明・画像は読み込み時に店舗ごとに作ってある（全店舗表示では先に見つかった店舗の値を使う）
+    description, image_url = "", ""
+    for n in active_sheets:
+        d_desc, d_img = get_catalog_store(n).brewery_details.get(brewery, ("", ""))
+        description, image_url = description or d_desc, image_url or d_img
+
+    if image_url:
+        get_url_checker().schedule(("brewery", brewery), [image_url])
+
+    hc1, hc2 = st.columns([1, 3])
+    with hc1:
+        if image_url and not get_url_checker().is_broken(image_url):
+            st.image(image_url, use_column_width=True)
+    with hc2:
+        flag_html = (
+            f"<img src='{first['flag_url']}' width='22' style='vertical-align:middle;margin-right:6px;'>"
+            if first["flag_url"] else ""
+        )
+        place = " / ".join(filter(None, [COUNTRY_INFO.get(first["country"], {}).get("jp", first["country"]), first["city"]]))
+        st.markdown(
+            f"<h2 style='margin-bottom:0;'>{flag_html}{first['brewery_jp'] or brewery}</h2>"
+            f"<div style='color:#666;'>{brewery}{' ・ ' + place if place else ''}</div>",
+            unsafe_allow_html=True
+        )
+        if description:
+            st.write(description)
+
+    beers = df_all.loc[positions[in_stock_mask[positions]]].sort_values("yomi_sort", na_position="last")
+    st.markdown(f"**在庫ありのビール：{len(beers)} 件**")
+    st.markdown(
+        MENU_CARD_CSS + apply_image_fallback("\n".join(render_beer_card_html(r, current_sheet or ALL_SHOPS) for r in beers.itertuples())),
+        unsafe_allow_html=True
+    )
+    st.stop()
 
 
 # ---------- Custom CSS ----------
@@ -564,6 +2725,79 @@ div[data-testid="stHorizontalBlock"]:hover {
 if is_admin:
     st.sidebar.success("管理モード")
 
+# ---------- 店舗切り替え（複数店舗がある時だけ） ----------
+if len(SHOP_SHEETS) > 1:
+    shop_options = list(SHOP_SHEETS) + [ALL_SHOPS]
+    shop_labels = {**SHOP_SHEETS, ALL_SHOPS: "全店舗"}
+    selected_shop = st.selectbox(
+        "店舗",
+        shop_options,
+        index=shop_options.index(current_sheet or ALL_SHOPS),
+        format_func=lambda s: shop_labels[s],
+        key="shop_select"
+    )
+    if selected_shop != (current_sheet or ALL_SHOPS):
+        st.query_params["shop"] = selected_shop
+        st.rerun()
+
+# ---------- バーコード（JAN）入力：管理モード ----------
+if is_admin and current_sheet:
+    # 保存後は次のスキャンに備えて入力欄を空にする
+    if st.session_state.pop("jan_clear", False):
+        st.session_state["jan_input"] = ""
+
+    jan_code = st.text_input(
+        "📷 JANコード",
+        placeholder="バーコードをスキャン / 入力",
+        key="jan_input"
+    )
+
+    if jan_code.strip():
+        jr = get_catalog_store(current_sheet).find_by_jan(jan_code)
+
+        if jr is None:
+            st.warning(f"JAN {jan_code.strip()} のビールが見つかりません")
+        else:
+            jan_id = int(float(jr["id"]))
+
+            with st.container(border=True):
+                jc1, jc2 = st.columns([1, 4])
+                with jc1:
+                    st.image(image_or_default(jr["beer_image_url"]), width=90)
+                with jc2:
+                    st.markdown(
+                        f"**{jr['name_local']}** / {jr['name_jp']}  \n"
+                        f"{jr['brewery_jp']} ・ 現在：{jr['stock_status']} ・ "
+                        f"{'ASK' if jr['price_num'] == 0 else jr['price']}"
+                    )
+
+                def save_scanned(stock, price):
+                    st.session_state["jan_clear"] = True
+                    update_row(
+                        jan_id, stock, price, jr["comment"], jr["detailed_comment"],
+                        sheet_name=current_sheet
+                    )
+
+                # 在庫はワンクリックで保存
+                sc1, sc2, sc3 = st.columns(3)
+                current_price = int(jr["price_num"]) if pd.notna(jr["price_num"]) else 0
+                for col, (label, stock) in zip(
+                    (sc1, sc2, sc3),
+                    [("○ 在庫あり", "○"), ("△ 取り寄せ", "△"), ("× 在庫なし", "×")]
+                ):
+                    if col.button(label, key=f"jan_stock_{stock}", use_container_width=True):
+                        save_scanned(stock, current_price)
+
+                # 価格は入力して Enter / ボタンで保存
+                with st.form("jan_price_form", border=False):
+                    pc1, pc2 = st.columns([3, 1])
+                    new_price = pc1.number_input(
+                        "価格", value=current_price, step=100, label_visibility="collapsed"
+                    )
+                    if pc2.form_submit_button("価格を保存", use_container_width=True):
+                        save_scanned(jr["stock_status"], new_price)
+
+
 # ---------- Filters UI ----------
 with st.expander("フィルター / 検索を表示", False):
     st.markdown('<div id="search_bar"></div>', unsafe_allow_html=True)
@@ -578,6 +2812,7 @@ with st.expander("フィルター / 検索を表示", False):
             placeholder="フリー検索",
             label_visibility="collapsed",
             key="search_text",
+            on_change=mark_filters_dirty,
             value=st.session_state.get("search_text", "")
         )
 
@@ -598,6 +2833,7 @@ with st.expander("フィルター / 検索を表示", False):
             options=sort_options,
             index=sort_options.index(st.session_state.get("sort_option", "名前順")),
             key="sort_option",
+            on_change=mark_filters_dirty,
             label_visibility="collapsed"
         )
 
@@ -616,9 +2852,10 @@ with st.expander("フィルター / 検索を表示", False):
         # ---------- 修正：完全リセット ----------
         if st.button("🔄 リセット", help="すべて初期化"):
 
-            # 1. スタイルチェックボックスなどプレフィックス付きキーを削除
-            for s in df_all["style_main_jp"].dropna().unique():
-                st.session_state[f"style_{s}"] = False
+            # 1. チェック中のスタイルだけ widget state を消す
+            for s in filter_state.styles:
+                st.session_state.pop(f"style_{s}", None)
+            filter_state.styles.clear()
 
             # 2. その他のUI状態も初期化
             for key in ["search_text", "sort_option", "size_choice", "abv_slider", "price_slider", "country_radio"]:
@@ -628,17 +2865,24 @@ with st.expander("フィルター / 検索を表示", False):
             st.session_state["search_text"] = ""
             st.session_state["sort_option"] = "名前順"
             st.session_state["size_choice"] = "小瓶（≤500ml）"
-            st.session_state["abv_slider"] = (0.0, 20.0)
-            st.session_state["price_slider"] = (0, 20000)
+            st.session_state["abv_slider"] = DEFAULT_ABV_RANGE
+            st.session_state["price_slider"] = DEFAULT_PRICE_RANGE
             
 
             # 4.詳細コメント state を全削除
-            for key in list(st.session_state.keys()):
-                if key.startswith("detail_"):
-                    del st.session_state[key]
+            filter_state.open_details.clear()
+            filter_state.dirty = True
 
             st.rerun()
 
+    # ---- 検索候補（カタログは絞り込まずに候補だけ出す） ----
+    if search_text and search_text.strip():
+        suggest_index = get_suggest_index((catalog_version, "admin" if is_admin else "customer"), base_df)
+        suggestions = [s for s in suggest_index.suggest(search_text) if s != search_text.strip()]
+        if suggestions:
+            for col, s in zip(st.columns(SUGGEST_LIMIT), suggestions):
+                col.button(s, key=f"suggest_{s}", on_click=pick_suggestion, args=(s,), use_container_width=True)
+
     # ===== 2行目：国（Excel から自動取得・日本語化） =====
     col_country_title, col_country, col_stock1 = st.columns([0.2,4,1.5])
 
@@ -661,6 +2905,7 @@ with st.expander("フィルター / 検索を表示", False):
             countries_display,
             horizontal=True,
             key="country_radio",
+            on_change=mark_filters_dirty,
             label_visibility="collapsed"
         )
 
@@ -676,10 +2921,7 @@ with st.expander("フィルター / 検索を表示", False):
     if country_choice_display == "すべて":
         country_choice = "すべて"
     else:
-        country_choice = next(
-            (k for k, v in COUNTRY_INFO.items() if v.get("jp") == country_choice_display),
-            country_choice_display
-        )
+        country_choice = COUNTRY_BY_JP.get(country_choice_display, country_choice_display)
 
 
     # ===== 3行目：サイズ・ABV・価格 =====
@@ -692,28 +2934,31 @@ with st.expander("フィルター / 検索を表示", False):
             "サイズ",
             ("すべて", "小瓶（≤500ml）", "大瓶（≥500ml）"),
             horizontal=True,
-            key="size_choice"
+            key="size_choice",
+            on_change=mark_filters_dirty
         )
 
     with col_abv:
         if "abv_slider" not in st.session_state:
-            st.session_state["abv_slider"] = (0.0, 20.0)
+            st.session_state["abv_slider"] = DEFAULT_ABV_RANGE
 
         abv_min, abv_max = st.slider(
             "ABV（%）",
             0.0, 20.0,
             step=0.5,
-            key="abv_slider"
+            key="abv_slider",
+            on_change=mark_filters_dirty
         )
 
     with col_price:
         if "price_slider" not in st.session_state:
-            st.session_state["price_slider"] = (0, 20000)
+            st.session_state["price_slider"] = DEFAULT_PRICE_RANGE
         price_min, price_max = st.slider(
             "価格（円）",
             0, 20000,
             step=100,
-            key="price_slider"
+            key="price_slider",
+            on_change=mark_filters_dirty
         )
 
     # ===== 4行目：スタイル（メイン） =====
@@ -725,15 +2970,16 @@ with st.expander("フィルター / 検索を表示", False):
     brewery_choice = "すべて"  # デフォルト値
 
     if is_admin:
-        # 醸造所リスト取得（重複削除＆ソート）
-        breweries = sorted(base_df[["brewery_local","brewery_jp"]].drop_duplicates("brewery_local").values, key=lambda x: x[1])
+        # 醸造所リスト（重複削除＆ソート済み）
+        breweries = master["filter_breweries"]
         # ["すべて"] + 日本語名リスト
         breweries_display = ["すべて"] + [b[1] for b in breweries]
 
         brewery_choice_display = st.selectbox(
             "醸造所で絞り込み",
             breweries_display,
-            key="brewery_filter"
+            key="brewery_filter",
+            on_change=mark_filters_dirty
         )
 
         # 日本語表示 → 内部用（brewery_local）変換
@@ -741,95 +2987,158 @@ with st.expander("フィルター / 検索を表示", False):
             brewery_choice = "すべて"
         else:
             # brewery_local を取得
-            brewery_choice = next((b[0] for b in breweries if b[1] == brewery_choice_display), brewery_choice_display)
+            brewery_choice = master["brewery_local_by_jp"].get(brewery_choice_display, brewery_choice_display)
 
         
 # ---------- Filtering ----------
-filtered_base = build_filtered_df(
-    base_df,
-    search_text=search_text,
-    size_choice=size_choice,
-    abv_min=abv_min,
-    abv_max=abv_max,
-    price_min=price_min,
-    price_max=price_max,
-    country_choice=country_choice,
-)
+if catalog_loading:
+    st.caption(f"⏳ カタログを読み込み中です（{len(df_all)} 件まで届いています）")
+
+use_sqlite = CATALOG_BACKEND == "sqlite"
+
+# お客さん向けの定番条件（検索なし・スライダー初期値・名前順・スタイル未選択）なら
+# 事前描画したメニューをそのまま使う
+any_style_selected = bool(filter_state.styles)
+menu_snapshot = None
+if (
+    not is_admin
+    and not catalog_loading  # 読み込み途中の version では作らない
+    and not (search_text and search_text.strip())
+    and (abv_min, abv_max) == DEFAULT_ABV_RANGE
+    and (price_min, price_max) == DEFAULT_PRICE_RANGE
+    and sort_option == "名前順"
+    and not any_style_selected
+):
+    preset_key = menu_preset_key(country_choice, size_choice)
+    menu_snapshots = get_menu_snapshots(current_sheet or ALL_SHOPS).get(catalog_version, df_all)
+    menu_snapshot = menu_snapshots.get(preset_key) if menu_snapshots else None
+
+if menu_snapshot is not None:
+    styles_available = menu_snapshot["styles"]
+
+elif use_sqlite:
+    sqlite_backend = get_sqlite_backend("|".join(active_sheets))
+    sqlite_backend.sync(df_all, catalog_version)
+
+    sql_filters = dict(
+        search_text=search_text,
+        size_choice=size_choice,
+        abv_min=abv_min,
+        abv_max=abv_max,
+        price_min=price_min,
+        price_max=price_max,
+        country_choice=country_choice,
+        in_stock_only=not is_admin,
+        brewery_choice=brewery_choice,
+    )
+    styles_available = sqlite_backend.style_candidates(**sql_filters)
 
-# 管理モード以外は在庫ありだけ
-if not is_admin:
-    filtered_base = filtered_base[filtered_base["stock_status"] == "○"]
-
-# 管理モード: brewery_choice フィルター適用
-if brewery_choice != "すべて":
-    filtered_base = filtered_base[filtered_base["brewery_local"] == brewery_choice]
-# ---------- Filtering（★1回だけ） ----------
-filtered_base = build_filtered_df(
-    base_df,
-    search_text=search_text,
-    size_choice=size_choice,
-    abv_min=abv_min,
-    abv_max=abv_max,
-    price_min=price_min,
-    price_max=price_max,
-    country_choice=country_choice,
-)
+else:
+    # ---------- Filtering（★1回だけ） ----------
+    filtered_base = build_filtered_df(
+        base_df,
+        catalog_version=(catalog_version, "admin" if is_admin else "customer"),
+        search_text=search_text,
+        size_choice=size_choice,
+        abv_min=abv_min,
+        abv_max=abv_max,
+        price_min=price_min,
+        price_max=price_max,
+        country_choice=country_choice,
+    )
+
+    # 管理モード以外は在庫ありだけ
+    if not is_admin:
+        filtered_base = filtered_base[filtered_base["stock_status"] == "○"]
+
+    # 管理モード: brewery_choice フィルター適用
+    if brewery_choice != "すべて":
+        filtered_base = filtered_base[filtered_base["brewery_local"] == brewery_choice]
+
+    styles_available = get_style_candidates(filtered_base)
 
 # ---------- スタイルフィルター ----------
 selected_styles = []  # 管理モードでも未定義エラーを防ぐ
 
 if not is_admin:
     with style_ui_placeholder:
-        styles_available = get_style_candidates(filtered_base)
         if styles_available:
             cols = st.columns(min(6, len(styles_available)))
             for i, s in enumerate(styles_available):
                 key = f"style_{s}"
-                if cols[i % len(cols)].checkbox(s, key=key):
+                if cols[i % len(cols)].checkbox(s, key=key, on_change=on_style_change, args=(s,)):
                     selected_styles.append(s)
 
-# ---------- style 選択を filtered に適用 ----------
-filtered = filtered_base.copy()
-if selected_styles:
-    filtered = filtered[filtered["style_main_jp"].isin(selected_styles)]
-
-# ---------- Sorting ----------
-if sort_option == "名前順":
-    filtered = filtered.sort_values(by="yomi_sort", na_position="last")
-elif sort_option == "ABV（低）":
-    filtered = filtered.sort_values(by="abv_num", ascending=True, na_position="last")
-elif sort_option == "ABV（高）":
-    filtered = filtered.sort_values(by="abv_num", ascending=False, na_position="last")
-elif sort_option == "価格（低）":
-    filtered = (filtered
-        .assign(price_sort=filtered["price_num"].replace(0, 10**9))
-        .sort_values(by="price_sort", ascending=True, na_position="last")
-    )
-elif sort_option == "ランダム順":
+    # 表示されなかったスタイルは widget state も消えるので、選択からも外す
+    filter_state.styles.intersection_update(selected_styles)
+
+# ランダム順に「切り替わった瞬間」だけ seed 更新
+if sort_option == "ランダム順" and st.session_state.prev_sort_option != "ランダム順":
+    st.session_state.random_seed = random.randint(0, 10**9)
+
+st.session_state.prev_sort_option = sort_option
 
-    # ランダム順に「切り替わった瞬間」だけ seed 更新
-    if st.session_state.prev_sort_option != "ランダム順":
-        st.session_state.random_seed = random.randint(0, 10**9)
+if menu_snapshot is not None:
+    filtered_count = menu_snapshot["count"]
 
-    filtered = filtered.sample(
-        frac=1,
-        random_state=st.session_state.random_seed
+    st.markdown(f"**表示件数：{filtered_count} 件**")
+
+    st.markdown(
+        MENU_CARD_CSS + apply_image_fallback("\n".join(menu_snapshot["cards"][:st.session_state.show_limit])),
+        unsafe_allow_html=True
+    )
+    display_df = df_all.iloc[0:0]  # カードは描画済み
+
+elif use_sqlite:
+    # 並び替え・件数・ページングまで SQL で済ませ、表示する行だけ取り出す
+    page_rowpos, filtered_count = sqlite_backend.query(
+        sort_option=sort_option,
+        random_seed=st.session_state.random_seed,
+        limit=st.session_state.show_limit,
+        styles=selected_styles,
+        **sql_filters
     )
 
-st.session_state.prev_sort_option = sort_option
+    st.markdown(f"**表示件数：{filtered_count} 件**")
+
+    display_df = df_all.iloc[page_rowpos]
+
+else:
+    # ---------- style 選択を filtered に適用 ----------
+    filtered = filtered_base.copy()
+    if selected_styles:
+        filtered = filtered[filtered["style_main_jp"].isin(selected_styles)]
+
+    # ---------- Sorting ----------
+    if sort_option == "名前順":
+        filtered = filtered.sort_values(by="yomi_sort", na_position="last")
+    elif sort_option == "ABV（低）":
+        filtered = filtered.sort_values(by="abv_num", ascending=True, na_position="last")
+    elif sort_option == "ABV（高）":
+        filtered = filtered.sort_values(by="abv_num", ascending=False, na_position="last")
+    elif sort_option == "価格（低）":
+        filtered = (filtered
+            .assign(price_sort=filtered["price_num"].replace(0, 10**9))
+            .sort_values(by="price_sort", ascending=True, na_position="last")
+        )
+    elif sort_option == "ランダム順":
+        filtered = filtered.sample(
+            frac=1,
+            random_state=st.session_state.random_seed
+        )
 
-# ---------- Prepare display_df ----------
-filtered_count = len(filtered)
+    # ---------- Prepare display_df ----------
+    filtered_count = len(filtered)
 
-st.markdown(f"**表示件数：{filtered_count} 件**")
+    st.markdown(f"**表示件数：{filtered_count} 件**")
 
-display_df = filtered.head(st.session_state.show_limit)
+    display_df = filtered.head(st.session_state.show_limit)
 
 # --- カード描画関数（高速・安全版） ---
-def render_beer_card(r, beer_id_safe):
+def render_beer_card(r, beer_id_safe, pos):
 
     # --- 変数定義 ---
-    beer_img = r.beer_image_url or DEFAULT_BEER_IMG
+    beer_img = image_or_default(r.beer_image_url)
     untappd_url = r.untappd_url
     flag_img = r.flag_url
     style_line = " / ".join(filter(None, [r.style_main_jp, r.style_sub_jp]))
@@ -841,7 +3150,6 @@ def render_beer_card(r, beer_id_safe):
 
     # ===== 左：ビール画像のみ =====
     with left_col:
-        beer_img = r.beer_image_url or DEFAULT_BEER_IMG
         st.markdown(
             f"""
             <div style="display:flex;justify-content:center;align-items:center;height:100%;">
@@ -859,7 +3167,7 @@ def render_beer_card(r, beer_id_safe):
         brewery_name_html = f"""
         <div>
             {"<img src='"+flag_img+"' width='18' style='vertical-align:middle;margin-right:6px;'>" if flag_img else ""}
-            <b>{r.brewery_local}</b> / <span style="color:#666;">{r.brewery_jp}</span>
+            {brewery_link_html(r, current_sheet or ALL_SHOPS)} / <span style="color:#666;">{r.brewery_jp}</span>
         </div>
         """
         st.markdown(brewery_name_html, unsafe_allow_html=True)
@@ -868,17 +3176,7 @@ def render_beer_card(r, beer_id_safe):
         # ===== 旧 col3（ビール情報）ベース =====
         style_line = " / ".join(filter(None, [r.style_main_jp, r.style_sub_jp]))
 
-        info_arr = []
-        if pd.notna(r.abv_num):
-            info_arr.append(f"ABV {r.abv_num}%")
-        if pd.notna(r.volume_num):
-            info_arr.append(f"{int(r.volume_num)}ml")
-        if pd.notna(r.vintage) and str(r.vintage).strip():
-            info_arr.append(str(r.vintage).strip())
-        if pd.notna(r.price_num):
-            info_arr.append("ASK" if r.price_num == 0 else f"¥{int(r.price_num)}")
-
-        beer_info = " | ".join(info_arr)
+        beer_info = beer_info_line(r)
 
         st.markdown(
             f"""
@@ -897,18 +3195,14 @@ def render_beer_card(r, beer_id_safe):
         # ====== 詳細コメント（自前 toggle / 軽量）=====
         if r.detailed_comment and r.detailed_comment.strip():
 
-            detail_key = f"detail_{beer_id_safe}"
-
-            # 初期化（必要なカードだけ）
-            if detail_key not in st.session_state:
-                st.session_state[detail_key] = False
+            open_details = st.session_state.filter_state.open_details
 
             # トグルボタン
             if st.button("詳細コメント", key=f"btn_{beer_id_safe}"):
-                st.session_state[detail_key] = not st.session_state[detail_key]
+                open_details ^= {beer_id_safe}
 
             # 表示
-            if st.session_state[detail_key]:
+            if beer_id_safe in open_details:
                 st.markdown(
                     f"""
                     <div class="detail-comment">
@@ -918,8 +3212,21 @@ def render_beer_card(r, beer_id_safe):
                     unsafe_allow_html=True
                 )
 
-        # ===== 管理モード 編集UI =====
-        if is_admin:
+        # ====== 似たビール（開いた時だけ近傍を引く）=====
+        open_similar = st.session_state.filter_state.open_similar
+
+        if st.button("似たビール", key=f"similar_{beer_id_safe}"):
+            open_similar ^= {beer_id_safe}
+
+        if beer_id_safe in open_similar:
+            sim_index = get_similarity_index(catalog_version, df_all)
+            st.markdown(
+                similar_beers_html(df_all, find_similar_positions(sim_index, pos)),
+                unsafe_allow_html=True
+            )
+
+        # ===== 管理モード 編集UI（全店舗表示では編集しない） =====
+        if is_admin and current_sheet:
 
             if st.button("✏ 編集", key=f"edit_{beer_id_safe}"):
                 st.session_state.edit_id = beer_id_safe
@@ -961,7 +3268,8 @@ def render_beer_card(r, beer_id_safe):
                             new_stock,
                             new_price,
                             new_comment,
-                            new_detailed_comment
+                            new_detailed_comment,
+                            sheet_name=current_sheet
                         )
 
                 with col2:
@@ -970,13 +3278,22 @@ def render_beer_card(r, beer_id_safe):
 
 
 # ---------- Render（統一版） ----------
-for global_idx, r in enumerate(display_df.itertuples(index=False)):
+rendered_cards = set()
+for global_idx, r in enumerate(display_df.itertuples()):
     try:
         beer_id_safe = int(float(r.id))
     except (ValueError, TypeError):
         continue
 
-    render_beer_card(r, beer_id_safe)
+    # 全店舗表示では店舗ごとに id が重なるので、widget key に店舗名を含める
+    if current_sheet is None:
+        beer_id_safe = f"{r.shop}_{beer_id_safe}"
+
+    render_beer_card(r, beer_id_safe, pos=r.Index)  # Index = df_all 内の行位置
+    rendered_cards.add(beer_id_safe)
+
+# 画面から外れたカードの state を消す
+evict_stale_card_state(filter_state, rendered_cards)
 
 # ---------- トップへ戻るボタン ----------
 st.markdown(
@@ -1000,7 +3317,7 @@ st.markdown(
 
 # ---------- "もっと見る" ボタン (Step1 continuation) ----------
 # Show button below the list; if clicked, increase limit by 10
-if st.session_state.show_limit < len(filtered):
+if st.session_state.show_limit < filtered_count:
     # use container to place button nicely
     with st.container():
         if st.button("🔽もっと見る🔽", use_container_width=True):
@@ -1013,7 +3330,7 @@ else:
 # ---------- 新規作成 ----------
 st.markdown("---")  # 区切り線
 
-if is_admin:
+if is_admin and current_sheet:
 
     # 新規作成フォーム表示フラグの初期化
     if "show_new_beer_form" not in st.session_state:
@@ -1034,7 +3351,7 @@ if is_admin:
 
             country = st.selectbox("国", list(COUNTRY_INFO.keys()))
 
-            brewery_master = get_brewery_master(df_all)
+            brewery_master = master["form_breweries"]
 
             brewery_options = ["（新規入力）"] + [
                 b["brewery_jp"] for b in brewery_master
@@ -1051,10 +3368,7 @@ if is_admin:
                 brewery_local = ""
 
             else:
-                selected = next(
-                    (b for b in brewery_master if b["brewery_jp"] == brewery_choice),
-                    None
-                )
+                selected = master["form_brewery_by_jp"].get(brewery_choice)
 
                 if selected is None:
                     st.error("選択された醸造所が見つかりません")
@@ -1064,7 +3378,7 @@ if is_admin:
                 brewery_local = selected["brewery_local"]
 
 
-            style_main_list, style_sub_list = get_style_master(df_all)
+            style_main_list, style_sub_list = master["style_main"], master["style_sub"]
 
             style_main_options = ["（未選択）"] + style_main_list
             style_sub_options  = ["（未選択）"] + style_sub_list
@@ -1105,18 +3419,230 @@ if is_admin:
                     name_jp, name_local, brewery_jp, brewery_local,
                     country, style_main_jp, style_sub_jp,
                     abv, volume, price, in_stock,
-                    beer_image_url, untappd_url, comment, detailed_comment
+                    beer_image_url, untappd_url, comment, detailed_comment,
+                    sheet_name=current_sheet
                 )
                 st.success("🍺 ビールを追加しました！")
 
+    # ---------- 一括インポート ----------
+    with st.expander("📥 Excel / CSV から一括追加"):
+        st.caption("1行目に列名（name_jp, name_local, brewery_jp, country, abv, price, in_stock など）を入れてください。id は自動で採番します。")
 
+        uploaded = st.file_uploader(
+            "ファイルを選択",
+            type=["xlsx", "csv"],
+            key=f"bulk_import_file_{st.session_state.get('bulk_import_gen', 0)}"
+        )
 
+        if uploaded is not None:
+            try:
+                raw = read_import_file(uploaded)
+            except Exception as e:
+                st.error(f"ファイルを読み込めませんでした: {e}")
+                raw = None
+
+            if raw is not None:
+                import_df, import_errors = validate_import_frame(raw, df_all)
+
+                st.markdown(f"**追加できる行：{len(import_df)} 件 / エラー：{len(import_errors)} 件**")
+
+                if len(import_errors):
+                    st.dataframe(import_errors, use_container_width=True)
+
+                if len(import_df):
+                    st.dataframe(
+                        import_df[["name_jp", "name_local", "brewery_jp", "country", "abv", "price", "in_stock"]],
+                        use_container_width=True
+                    )
+                    if st.button(f"{len(import_df)} 件を追加", key="bulk_import_submit"):
+                        bulk_import_beers(import_df, sheet_name=current_sheet)
+
+if is_admin and current_sheet:
+
+    # ---------- 在庫ダッシュボード ----------
+    with st.expander("📊 在庫ダッシュボード"):
+        stats_store = get_catalog_store(current_sheet)
+        with stats_store.lock:
+            # 集計は store と一緒に進むので、ASK の行も同じ時点の df から引く
+            # （df_all は描画の最初に取ったもので、その後の追加・保存の行を含まない）
+            stats, stats_df, ask_positions = stats_store.stats, stats_store.df, sorted(stats_store.stats.ask)
+
+        dc1, dc2, dc3, dc4 = st.columns(4)
+        dc1.metric("○ 在庫あり", stats.status.get("○", 0))
+        dc2.metric("△ 取り寄せ", stats.status.get("△", 0))
+        dc3.metric("× 在庫なし", stats.status.get("×", 0))
+        dc4.metric("ASK（価格0）", len(ask_positions))
+
+        dim_labels = {"country": "国", "style_main_jp": "スタイル", "brewery_local": "醸造所"}
+        dim = st.radio(
+            "集計",
+            list(dim_labels),
+            format_func=dim_labels.get,
+            horizontal=True,
+            key="dashboard_dim"
+        )
+        st.dataframe(stats.table(dim), use_container_width=True)
+
+        hc1, hc2 = st.columns(2)
+        with hc1:
+            st.markdown("**価格の分布**")
+            labels = InventoryStats.hist_labels(InventoryStats.PRICE_BINS)
+            st.bar_chart(pd.Series(
+                [stats.price_hist.get(i, 0) for i in range(len(labels))], index=labels, name="件数"
+            ))
+        with hc2:
+            st.markdown("**ABV の分布**")
+            labels = InventoryStats.hist_labels(InventoryStats.ABV_BINS)
+            st.bar_chart(pd.Series(
+                [stats.abv_hist.get(i, 0) for i in range(len(labels))], index=labels, name="件数"
+            ))
+
+        if ask_positions:
+            st.markdown("**ASK（価格0）のビール**")
+            st.dataframe(
+                stats_df.loc[ask_positions, ["id", "name_jp", "name_local", "brewery_jp", "stock_status"]],
+                use_container_width=True,
+                hide_index=True
+            )
 
+    # ---------- 一括編集（表） ----------
+    with st.expander("🧮 一括編集（表）"):
+        st.caption("今の絞り込み結果を表で編集できます。保存すると変わったセルだけをまとめて書き込みます。")
 
+        # 表は絞り込み条件が変わった時だけ作り直す。他の管理者の保存や段階読み込みで
+        # version が進んでも、編集途中の内容が消えないように開いた時の中身のまま使う
+        grid_filters = (
+            current_sheet, search_text, size_choice, abv_min, abv_max, price_min, price_max,
+            country_choice, brewery_choice, tuple(selected_styles), sort_option,
+            st.session_state.random_seed,
+        )
+        grid = st.session_state.get("bulk_grid")
+        if grid is None or grid["filters"] != grid_filters:
+            if use_sqlite:
+                grid_positions, _ = sqlite_backend.query(
+                    sort_option=sort_option,
+                    random_seed=st.session_state.random_seed,
+                    limit=-1,  # SQLite では LIMIT -1 = 全件
+                    styles=selected_styles,
+                    **sql_filters
+                )
+            else:
+                grid_positions = list(filtered.index)
+
+            grid = {
+                "filters": grid_filters,
+                "version": catalog_version,
+                "original": build_edit_grid(df_all, grid_positions),
+            }
+            st.session_state.bulk_grid = grid
+
+        if grid["version"] != catalog_version:
+            st.info("表を開いた後にカタログが更新されています（保存すると変えたセルだけを、同じ id の今の行に書き込みます）。")
+            if st.button("最新の内容で表を作り直す", key="bulk_editor_refresh"):
+                reset_bulk_grid()
+                st.rerun()
+
+        grid_original = grid["original"]
+        grid_edited = st.data_editor(
+            grid_original,
+            key=f"bulk_editor_{st.session_state.get('bulk_editor_gen', 0)}",
+            use_container_width=True,
+            hide_index=True,
+            disabled=["id", "name_jp", "name_local", "brewery_jp"],
+            column_config={
+                "in_stock": st.column_config.SelectboxColumn("在庫", options=["○", "△", "×"], required=True),
+                "price": st.column_config.NumberColumn("価格", min_value=0, step=100, format="%d"),
+                "comment": st.column_config.TextColumn("コメント"),
+                "detailed_comment": st.column_config.TextColumn("詳細コメント"),
+            },
+        )
 
+        grid_changes = diff_edit_grid(grid_original, grid_edited)
+        n_cells = sum(len(v) for v in grid_changes.values())
+
+        if st.button(
+            f"変更を保存（{len(grid_changes)} 件 / {n_cells} セル）",
+            key="bulk_editor_save",
+            disabled=not grid_changes
+        ):
+            try:
+                write_cells(grid_changes, current_sheet)
+                reset_bulk_grid()  # 保存した内容で表を作り直す
+                st.session_state["save_success_flash"] = True
+                st.rerun()
+            except Exception as e:
+                st.error(f"保存中にエラーが発生しました: {e}")
 
+if is_admin:
 
+    # ---------- セッション状態 ----------
+    with st.expander("🧠 セッション状態"):
+        n_keys, n_bytes = session_state_footprint()
+        sc1, sc2, sc3 = st.columns(3)
+        sc1.metric("キー数", n_keys)
+        sc2.metric("サイズ（概算）", f"{n_bytes / 1024:.1f} KB")
+        sc3.metric("表示中カード", len(filter_state.visible_cards))
+
+    # ---------- Sheets API 状況 ----------
+    with st.expander("📈 Sheets API 状況"):
+        m = get_sheets_scheduler().metrics()
+        mc1, mc2, mc3, mc4, mc5 = st.columns(5)
+        mc1.metric("待ち行列", m["queue_depth"])
+        mc2.metric("成功", m["completed"])
+        mc3.metric("失敗", m["failed"])
+        mc4.metric("再試行", m["retries"])
+        mc5.metric("待ち時間 p50 / p95", f"{m['latency_p50']:.2f}s / {m['latency_p95']:.2f}s")
+        if m["paused_for"] > 0:
+            st.warning(f"クォータ超過のため {m['paused_for']:.0f} 秒待機中です")
+
+    # ---------- シートから再読み込み ----------
+    with st.expander("🔄 シートから再読み込み"):
+        for n in active_sheets:
+            fetched_at = get_catalog_store(n).fetched_at
+            st.caption(
+                f"{SHOP_SHEETS.get(n, n)}: 最終読み込み "
+                + (time.strftime("%m/%d %H:%M:%S", time.localtime(fetched_at)) if fetched_at else "—")
+            )
+        if CATALOG_REFRESH_SECONDS:
+            st.caption(f"{CATALOG_REFRESH_SECONDS:.0f} 秒ごとに裏で読み直します")
+        st.write("スプレッドシートで直接直した内容を取り込みます。")
+        if st.button("🔄 再読み込み", key="catalog_reload"):
+            for n in active_sheets:
+                reload_catalog(n)
+            st.rerun()
 
+    # ---------- リンク切れ ----------
+    with st.expander("🔗 リンク切れ（画像・Untappd）"):
+        checker = get_url_checker()
+        urls = catalog_urls(catalog_version, df_all)
+        n_checked = sum(1 for u in urls if u in checker.results)
+        st.caption(f"確認済み {n_checked} / {len(urls)} 件（{URL_CHECK_TTL // 3600} 時間ごとに再確認）")
+
+        broken_rows = []
+        for col in URL_CHECK_COLUMNS:
+            urls_col = df_all[col].astype(str).str.strip()
+            for pos in df_all.index[urls_col.map(checker.is_broken)]:
+                r = df_all.loc[pos]
+                broken_rows.append({
+                    "id": r["id"],
+                    "name_jp": r["name_jp"],
+                    "brewery_jp": r["brewery_jp"],
+                    "列": col,
+                    "URL": urls_col[pos],
+                    "結果": checker.detail(urls_col[pos]),
+                })
+
+        if broken_rows:
+            st.dataframe(pd.DataFrame(broken_rows), use_container_width=True, hide_index=True)
+        else:
+            st.write("リンク切れは見つかっていません。")
 
+        if st.button("🔁 もう一度チェック", key="url_recheck"):
+            checker.reset()
+            st.rerun()
 
 
+# ---------- 段階読み込み中は続きが届くまで待って描き直す ----------
+if catalog_loading:
+    time.sleep(LOAD_POLL_SECONDS)
+    st.rerun()
@@ -0,0 +1,386 @@
+"""
+同時セッション数を増やしながら app.py の rerun 時間を測る負荷テスト。
+
+本物の `streamlit run` サーバーを1つ立て、各セッションはブラウザと同じく
+WebSocket（/_stcore/stream）で BackMsg を送り、ForwardMsg を受け取る。
+サーバー側では Google Sheets をメモリ上の FakeWorksheet に、st.secrets をダミー値にし、
+リンク切れチェックの HEAD は外に出さずに 200 を返す。
+
+    python loadtest.py --sessions 1 5 10 20 --steps 20 --rows 2000
+
+各 N について rerun 時間（BackMsg を送ってから script_finished が届くまで）の
+p50 / p95 / p99、サーバープロセスの CPU 使用率とメモリ（RSS）、
+管理セッションの最後の session_state サイズを表示する。
+"""
+import argparse
+import asyncio
+import os
+import random
+import runpy
+import socket
+import statistics
+import subprocess
+import sys
+import tempfile
+import time
+import urllib.request
+
+import gspread
+from google.oauth2.service_account import Credentials
+
+from tests.fakes import FakeClient, FakeWorksheet, make_rows
+
+
+APP_PATH = os.path.join(os.path.dirname(os.path.abspath(__file__)), "app.py")
+
+SEARCH_WORDS = ["ipa", "cantillon", "ヴァイツェン", "stout", "orval", "saison"]
+
+SECRETS_TOML = """
+[gcp_service_account]
+type = "service_account"
+project_id = "loadtest"
+private_key = "dummy"
+client_email = "loadtest@example.com"
+"""
+
+
+# ---------- HEAD の代わり ----------
+class StubResponse:
+    status = 200
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        return False
+
+def stub_urlopen(req, timeout=None):
+    # リンク切れチェック（UrlChecker）の HEAD を外に出さずに 200 で返す
+    return StubResponse()
+
+
+# ---------- サーバー側（streamlit run loadtest.py -- --serve ...） ----------
+def serve(argv):
+    """
+    streamlit run から rerun のたびに呼ばれる。
+    Sheets・認証・HEAD を差し替えてから app.py をそのまま実行する。
+    """
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--serve", action="store_true")
+    parser.add_argument("--rows", type=int, default=2000)
+    parser.add_argument("--sheet-latency", type=float, default=0.2)
+    parser.add_argument("--error-rate", type=float, default=0.0)
+    args, _ = parser.parse_known_args(argv)
+
+    # サーバーが生きている間は同じシートを使う（編集も残る）。
+    # このファイルは rerun ごとに実行し直されるので、置き場所は gspread モジュールにする。
+    # （st.cache_resource を使うと app.py の set_page_config より前の Streamlit 呼び出しになる）
+    worksheet = getattr(gspread, "_loadtest_worksheet", None)
+    if worksheet is None:
+        worksheet = FakeWorksheet(make_rows(args.rows), latency=args.sheet_latency, error_rate=args.error_rate)
+        gspread._loadtest_worksheet = worksheet
+    gspread.authorize = lambda creds: FakeClient(worksheet)
+    Credentials.from_service_account_info = lambda info, scopes=None: object()
+    urllib.request.urlopen = stub_urlopen
+
+    runpy.run_path(APP_PATH, run_name="__main__")
+
+
+def free_port():
+    with socket.socket() as s:
+        s.bind(("127.0.0.1", 0))
+        return s.getsockname()[1]
+
+def start_server(args, workdir):
+    """workdir に secrets を置き、そこで streamlit run を起動する"""
+    os.makedirs(os.path.join(workdir, ".streamlit"), exist_ok=True)
+    with open(os.path.join(workdir, ".streamlit", "secrets.toml"), "w", encoding="utf-8") as f:
+        f.write(SECRETS_TOML)
+
+    port = free_port()
+    cmd = [
+        sys.executable, "-m", "streamlit", "run", os.path.abspath(__file__),
+        "--server.port", str(port),
+        "--server.address", "127.0.0.1",
+        "--server.headless", "true",
+        "--server.fileWatcherType", "none",
+        "--browser.gatherUsageStats", "false",
+        "--",
+        "--serve",
+        "--rows", str(args.rows),
+        "--sheet-latency", str(args.sheet_latency),
+        "--error-rate", str(args.error_rate),
+    ]
+    log = open(os.path.join(workdir, "server.log"), "w")
+    proc = subprocess.Popen(cmd, cwd=workdir, stdout=log, stderr=subprocess.STDOUT)
+
+    deadline = time.monotonic() + 60
+    while time.monotonic() < deadline:
+        if proc.poll() is not None:
+            raise RuntimeError(f"サーバーが起動しませんでした（{workdir}/server.log を参照）")
+        try:
+            with urllib.request.urlopen(f"http://127.0.0.1:{port}/_stcore/health", timeout=1) as r:
+                if r.status == 200:
+                    return proc, port
+        except OSError:
+            time.sleep(0.2)
+    proc.kill()
+    raise RuntimeError("サーバーの起動がタイムアウトしました")
+
+
+# ---------- クライアント（ブラウザの代わりに WebSocket で話す） ----------
+class BrowserSession:
+    """
+    1タブ分。rerun_script の BackMsg を送り、script_finished までの ForwardMsg から
+    今回描画された要素（widget の id・ラベル、metric など）を集める。
+    """
+    def __init__(self, port, query_string="", timeout=60):
+        self.url = f"ws://127.0.0.1:{port}/_stcore/stream"
+        self.query_string = query_string
+        self.timeout = timeout
+        self.conn = None
+        self.elements = {}       # delta_path -> Element
+        self.cached = {}         # ForwardMsg.hash -> ForwardMsg（ref_hash で送られてくる分）
+        self.widget_values = {}  # widget id -> WidgetState（ブラウザと同じく毎回全部送る）
+        self.exceptions = []
+
+    async def connect(self):
+        from tornado.websocket import websocket_connect
+        self.conn = await websocket_connect(self.url, subprotocols=["streamlit"])
+
+    async def close(self):
+        if self.conn is not None:
+            self.conn.close()
+
+    def _send_rerun(self, trigger_id=None):
+        from streamlit.proto.BackMsg_pb2 import BackMsg
+        from streamlit.proto.WidgetStates_pb2 import WidgetState
+
+        msg = BackMsg()
+        msg.rerun_script.query_string = self.query_string
+        for state in self.widget_values.values():
+            msg.rerun_script.widget_states.widgets.append(state)
+        if trigger_id is not None:
+            msg.rerun_script.widget_states.widgets.append(WidgetState(id=trigger_id, trigger_value=True))
+        return self.conn.write_message(msg.SerializeToString(), binary=True)
+
+    async def rerun(self, trigger_id=None):
+        """1回の rerun にかかった秒数を返す（st.rerun() で続いた分も含む）"""
+        from streamlit.proto.ForwardMsg_pb2 import ForwardMsg
+
+        t0 = time.perf_counter()
+        await self._send_rerun(trigger_id)
+
+        while True:
+            raw = await asyncio.wait_for(self.conn.read_message(), self.timeout)
+            if raw is None:
+                raise RuntimeError("WebSocket が切れました")
+
+            msg = ForwardMsg()
+            msg.ParseFromString(raw)
+            if msg.WhichOneof("type") == "ref_hash":
+                # 大きいメッセージは2回目から hash だけ届く（delta_path は参照側のものを使う）
+                full = ForwardMsg()
+                full.CopyFrom(self.cached[msg.ref_hash])
+                full.metadata.CopyFrom(msg.metadata)
+                msg = full
+            elif msg.metadata.cacheable:
+                self.cached[msg.hash] = msg
+
+            kind = msg.WhichOneof("type")
+            if kind == "new_session":
+                self.elements = {}
+            elif kind == "delta" and msg.delta.WhichOneof("type") == "new_element":
+                element = msg.delta.new_element
+                self.elements[tuple(msg.metadata.delta_path)] = element
+                if element.WhichOneof("type") == "exception":
+                    # どこで落ちたか分かるよう、app.py の中の行だけ添える
+                    where = [line for line in element.exception.stack_trace if APP_PATH in line]
+                    self.exceptions.append("\n".join([element.exception.message, *where[-2:]]))
+            elif kind == "script_finished":
+                if msg.script_finished == ForwardMsg.FINISHED_EARLY_FOR_RERUN:
+                    continue  # st.rerun() の続きを待つ
+                if msg.script_finished == ForwardMsg.FINISHED_WITH_COMPILE_ERROR:
+                    raise RuntimeError("app.py のコンパイルエラー")
+                return time.perf_counter() - t0
+
+    # --- 描画された要素を探す ---
+    def widgets(self, kind):
+        for element in self.elements.values():
+            if element.WhichOneof("type") == kind:
+                yield getattr(element, kind)
+
+    def find(self, kind, key=None, label=None):
+        for w in self.widgets(kind):
+            if key is not None and w.id.endswith(f"-{key}"):
+                return w
+            if label is not None and w.label == label:
+                return w
+        return None
+
+    def metric(self, label):
+        w = self.find("metric", label=label)
+        return w.body if w is not None else None
+
+    # --- 操作（値を覚えて rerun） ---
+    async def set_text(self, key, value):
+        from streamlit.proto.WidgetStates_pb2 import WidgetState
+        w = self.find("text_input", key=key)
+        if w is None:
+            return None
+        self.widget_values[w.id] = WidgetState(id=w.id, string_value=value)
+        return await self.rerun()
+
+    async def set_range(self, key, lo, hi):
+        from streamlit.proto.WidgetStates_pb2 import WidgetState
+        w = self.find("slider", key=key)
+        if w is None:
+            return None
+        state = WidgetState(id=w.id)
+        state.double_array_value.data.extend([lo, hi])
+        self.widget_values[w.id] = state
+        return await self.rerun()
+
+    async def click(self, label):
+        w = self.find("button", label=label)
+        if w is None:
+            return None
+        return await self.rerun(trigger_id=w.id)
+
+
+# ---------- セッションの操作シナリオ ----------
+async def customer_step(s, rnd, latencies):
+    action = rnd.choice(["type", "abv", "price", "more", "clear"])
+
+    if action == "type":
+        # 1文字ずつ打つ（text_input は確定ごとに rerun）
+        word = rnd.choice(SEARCH_WORDS)
+        results = [await s.set_text("search_text", word[:i]) for i in range(1, len(word) + 1)]
+    elif action == "abv":
+        lo = rnd.choice([0.0, 4.0, 6.0])
+        results = [await s.set_range("abv_slider", lo, lo + 6.0)]
+    elif action == "price":
+        results = [await s.set_range("price_slider", 0, rnd.choice([2000, 5000, 20000]))]
+    elif action == "more":
+        results = [await s.click("🔽もっと見る🔽")]
+    else:
+        results = [await s.set_text("search_text", "")]
+
+    latencies.extend(r for r in results if r is not None)
+
+async def admin_step(s, rnd, latencies):
+    edit = await s.click("✏ 編集")
+    if edit is None:
+        return await customer_step(s, rnd, latencies)
+    latencies.append(edit)
+
+    save = await s.click("保存")
+    if save is not None:
+        latencies.append(save)
+
+async def run_session(idx, port, steps, admin_ratio, timeout, latencies, footprints, errors):
+    rnd = random.Random(idx)
+    admin = rnd.random() < admin_ratio
+    s = BrowserSession(port, "yakuzen_beer=" if admin else "", timeout)
+    try:
+        await s.connect()
+        latencies.append(await s.rerun())
+        for _ in range(steps):
+            await (admin_step if admin else customer_step)(s, rnd, latencies)
+
+        if admin:
+            footprints.append((s.metric("キー数"), s.metric("サイズ（概算）")))
+        if s.exceptions:
+            errors.append(f"session {idx}: {s.exceptions[0]}")
+    except Exception as e:
+        errors.append(f"session {idx}: {type(e).__name__}: {e}")
+    finally:
+        await s.close()
+
+
+# ---------- 計測 ----------
+def percentile(values, p):
+    if not values:
+        return 0.0
+    values = sorted(values)
+    return values[min(len(values) - 1, int(len(values) * p))]
+
+def proc_cpu_seconds(pid):
+    # /proc/<pid>/stat の utime + stime（サーバープロセスの CPU 時間）
+    with open(f"/proc/{pid}/stat") as f:
+        fields = f.read().rsplit(")", 1)[1].split()
+    return (int(fields[11]) + int(fields[12])) / os.sysconf("SC_CLK_TCK")
+
+def proc_rss_mb(pid):
+    with open(f"/proc/{pid}/status") as f:
+        for line in f:
+            if line.startswith("VmRSS:"):
+                return int(line.split()[1]) / 1024
+    return 0.0
+
+async def run_level(n, port, pid, steps, admin_ratio, timeout):
+    latencies, footprints, errors = [], [], []
+
+    wall0, cpu0 = time.perf_counter(), proc_cpu_seconds(pid)
+    await asyncio.gather(*[
+        run_session(i, port, steps, admin_ratio, timeout, latencies, footprints, errors)
+        for i in range(n)
+    ])
+    wall, cpu = time.perf_counter() - wall0, proc_cpu_seconds(pid) - cpu0
+
+    return {
+        "sessions": n,
+        "reruns": len(latencies),
+        "p50": percentile(latencies, 0.50) * 1000,
+        "p95": percentile(latencies, 0.95) * 1000,
+        "p99": percentile(latencies, 0.99) * 1000,
+        "mean": (statistics.mean(latencies) * 1000) if latencies else 0.0,
+        "cpu": cpu / wall * 100 if wall else 0.0,
+        "rss": proc_rss_mb(pid),
+        "footprints": footprints,
+        "errors": errors,
+    }
+
+async def drive(args, port, pid):
+    # 1回目はシートの読み込み・事前計算が入るので別に測る
+    warm = BrowserSession(port, timeout=args.timeout)
+    await warm.connect()
+    first = await warm.rerun()
+    await warm.close()
+    print(f"初回表示（シート読み込み込み）: {first * 1000:.0f} ms")
+
+    print(f"{'N':>4} {'reruns':>7} {'p50ms':>8} {'p95ms':>8} {'p99ms':>8} {'mean':>8} {'CPU%':>6} {'RSSMB':>7}  state")
+    for n in args.sessions:
+        r = await run_level(n, port, pid, args.steps, args.admin_ratio, args.timeout)
+        state = ", ".join(f"{k}件/{b}" for k, b in r["footprints"][:3]) or "-"
+        print(
+            f"{r['sessions']:>4} {r['reruns']:>7} {r['p50']:>8.1f} {r['p95']:>8.1f} "
+            f"{r['p99']:>8.1f} {r['mean']:>8.1f} {r['cpu']:>6.0f} {r['rss']:>7.1f}  {state}"
+        )
+        for e in r["errors"]:
+            print("   !", e)
+
+def main():
+    parser = argparse.ArgumentParser(description="app.py の同時セッション負荷テスト")
+    parser.add_argument("--sessions", type=int, nargs="+", default=[1, 5, 10, 20])
+    parser.add_argument("--steps", type=int, default=20, help="1セッションあたりの操作回数")
+    parser.add_argument("--rows", type=int, default=2000, help="ダミーカタログの行数")
+    parser.add_argument("--admin-ratio", type=float, default=0.1, help="管理モードのセッションの割合")
+    parser.add_argument("--sheet-latency", type=float, default=0.2, help="Sheets 呼び出し1回の遅延（秒）")
+    parser.add_argument("--error-rate", type=float, default=0.0, help="429 で失敗させる Sheets 呼び出しの割合")
+    parser.add_argument("--timeout", type=float, default=60)
+    args = parser.parse_args()
+
+    with tempfile.TemporaryDirectory(prefix="beer-loadtest-") as workdir:
+        proc, port = start_server(args, workdir)
+        try:
+            asyncio.run(drive(args, port, proc.pid))
+        finally:
+            proc.terminate()
+            proc.wait(timeout=10)
+
+if __name__ == "__main__":
+    if "--serve" in sys.argv:
+        serve(sys.argv[1:])
+    else:
+        main()
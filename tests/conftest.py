@@ -0,0 +1,60 @@
+import ast
+import pathlib
+import sys
+
+ROOT = pathlib.Path(__file__).resolve().parent.parent
+APP = ROOT / "app.py"
+
+sys.path.insert(0, str(ROOT))
+
+
+def load_app_defs(*names):
+    """
+    app.py は Streamlit のスクリプトなので import すると画面まで動いてしまう。
+    import 文と、指定した名前のトップレベル定義（関数・クラス・定数）だけを取り出して実行する。
+    """
+    tree = ast.parse(APP.read_text(encoding="utf-8"))
+    body = []
+    for node in tree.body:
+        if isinstance(node, (ast.Import, ast.ImportFrom)):
+            body.append(node)
+        elif isinstance(node, (ast.FunctionDef, ast.ClassDef)) and node.name in names:
+            body.append(node)
+        elif isinstance(node, ast.Assign) and any(
+            isinstance(t, ast.Name) and t.id in names for t in node.targets
+        ):
+            body.append(node)
+
+    namespace = {}
+    exec(compile(ast.Module(body=body, type_ignores=[]), str(APP), "exec"), namespace)
+    missing = [n for n in names if n not in namespace]
+    assert not missing, f"app.py に見つからない定義: {missing}"
+    return namespace
+
+
+# CatalogStore を動かすのに要る定義（読み込み・統計・マスタ・共有ロック）
+CATALOG_DEFS = (
+    "SHEET_NAME", "HIRAGANA_TO_KATAKANA", "fold_search", "try_number", "stock_status", "COUNTRY_INFO",
+    "get_collator", "locale_key", "locale_key_bytes",
+    "EXPECTED_COLUMNS", "BREWERY_DETAIL_COLUMNS", "prepare_catalog",
+    "brewery_details_of", "merge_brewery_details",
+    "normalize_jan", "build_jan_index", "InventoryStats", "MasterData",
+    "CATALOG_FORMAT_VERSION", "ARROW_TYPES", "shared_dir", "_shared_lock_held", "shared_catalog_lock",
+    "read_shared_manifest", "to_arrow_table", "publish_shared_catalog", "map_shared_catalog",
+    "CATALOG_CHANGE_LOG_SIZE", "CatalogStore",
+)
+
+
+def load_catalog_defs(*names, share_dir=""):
+    """
+    CATALOG_DEFS と names を読み込み、テスト用に差し替えたものを返す。
+    share_dir が空ならプロセス内だけで動く（secrets は読まない）。
+    """
+    ns = load_app_defs(*dict.fromkeys(CATALOG_DEFS + names))
+    ns["CATALOG_SHARE_DIR"] = share_dir
+    # スクリプト実行外では cache_resource が効かず、Collator を毎回作ってしまう
+    collator = ns["get_collator"]()
+    ns["get_collator"] = lambda: collator
+    # Sheets の呼び出しはスケジューラを通さずその場で実行する
+    ns["sheets_call"] = lambda fn, *args, priority=None, **kwargs: fn(*args, **kwargs)
+    return ns
@@ -0,0 +1,162 @@
+"""
+テストと負荷テスト（loadtest.py）で使う Google Sheets の代わり。
+"""
+import json
+import random
+import threading
+import time
+
+import gspread
+import requests
+from gspread.utils import a1_to_rowcol
+
+
+COLUMNS = [
+    "id","name_jp","name_local","yomi","brewery_local","brewery_jp","country","city",
+    "brewery_description","brewery_image_url","style_main","style_main_jp",
+    "style_sub","style_sub_jp","abv","volume","vintage","price","comment","detailed_comment",
+    "in_stock","untappd_url","jan","beer_image_url"
+]
+
+COUNTRIES = ["Belgium", "Germany", "Japan", "United States", "Netherlands", "Czech Republic", "Italy", "Austria"]
+STYLES = ["ランビック", "トラピスト", "セゾン", "IPA", "スタウト", "ピルスナー", "ヴァイツェン", "サワー"]
+
+
+def make_rows(n, seed=0):
+    rnd = random.Random(seed)
+    rows = []
+    for i in range(1, n + 1):
+        brewery = f"Brewery {i % 150}"
+        rows.append({
+            "id": i,
+            "name_jp": f"ビール{i}",
+            "name_local": f"Beer {i} {rnd.choice(['Tripel', 'Dubbel', 'IPA', 'Stout', 'Gueuze'])}",
+            "yomi": f"びーる{i}",
+            "brewery_local": brewery,
+            "brewery_jp": f"醸造所{i % 150}",
+            "country": rnd.choice(COUNTRIES),
+            "city": "",
+            "brewery_description": "説明" * 20,
+            "brewery_image_url": "",
+            "style_main": "",
+            "style_main_jp": rnd.choice(STYLES),
+            "style_sub": "",
+            "style_sub_jp": "",
+            "abv": round(rnd.uniform(3, 12), 1),
+            "volume": rnd.choice([330, 375, 500, 750]),
+            "vintage": "",
+            "price": rnd.choice([0, 800, 1200, 1800, 3500]),
+            "comment": "コメント",
+            "detailed_comment": "詳細コメント" if i % 3 == 0 else "",
+            "in_stock": rnd.choice(["○", "○", "△", "×"]),
+            # 予約済みの .invalid ドメイン（どこにも届かない）
+            "untappd_url": f"https://untappd.invalid/b/beer-{i}",
+            "jan": f"49{i:011d}",
+            "beer_image_url": "",
+        })
+    return rows
+
+def api_error(code=429, message="Quota exceeded for quota metric 'Read requests'"):
+    """Sheets API が返すのと同じ形の gspread.exceptions.APIError"""
+    response = requests.Response()
+    response.status_code = code
+    response._content = json.dumps(
+        {"error": {"code": code, "message": message, "status": "RESOURCE_EXHAUSTED"}}
+    ).encode()
+    return gspread.exceptions.APIError(response)
+
+class FakeWorksheet:
+    """
+    アプリが使う gspread.Worksheet のメソッドだけを持つ。
+    error_rate を指定すると、その割合の呼び出しが 429（クォータ超過）で失敗する。
+    """
+    def __init__(self, rows, latency=0.0, error_rate=0.0, seed=0, spare_rows=100):
+        self.header = list(COLUMNS)
+        self.rows = [[r.get(c, "") for c in self.header] for r in rows]
+        self.spare_rows = spare_rows
+        self.latency = latency
+        self.error_rate = error_rate
+        self.rnd = random.Random(seed)
+        self.lock = threading.Lock()
+        self.calls = 0
+        self.errors = 0
+
+    def _wait(self):
+        if self.latency:
+            time.sleep(self.latency)
+        with self.lock:
+            self.calls += 1
+            fail = self.error_rate and self.rnd.random() < self.error_rate
+            if fail:
+                self.errors += 1
+        if fail:
+            raise api_error(429)
+
+    def get_all_records(self):
+        self._wait()
+        with self.lock:
+            return [dict(zip(self.header, row)) for row in self.rows]
+
+    def row_values(self, row):
+        self._wait()
+        with self.lock:
+            return list(self.header if row == 1 else self.rows[row - 2])
+
+    @property
+    def row_count(self):
+        # シートのグリッドはデータより多めの行を持っている
+        with self.lock:
+            return len(self.rows) + 1 + self.spare_rows
+
+    def get(self, range_name):
+        self._wait()
+        start, end = range_name.split(":")
+        r1, c1 = a1_to_rowcol(start)
+        r2, c2 = a1_to_rowcol(end)
+        with self.lock:
+            grid = [self.header] + self.rows
+            values = [row[c1 - 1:c2] for row in grid[r1 - 1:r2]]
+
+        # 本物の API と同じく、行末の空セルと範囲の末尾の空行は返さない
+        values = [row[:max((i + 1 for i, v in enumerate(row) if v != ""), default=0)] for row in values]
+        while values and not values[-1]:
+            values.pop()
+        return values
+
+    def append_row(self, values, **kwargs):
+        self._wait()
+        with self.lock:
+            self.rows.append(list(values))
+
+    def append_rows(self, values, **kwargs):
+        self._wait()
+        with self.lock:
+            self.rows.extend(list(v) for v in values)
+
+    def update(self, values, *args, **kwargs):
+        self._wait()
+        with self.lock:
+            self.header = list(values[0])
+            self.rows = [list(v) for v in values[1:]]
+
+    def batch_update(self, data, **kwargs):
+        self._wait()
+        with self.lock:
+            for item in data:
+                row, col = a1_to_rowcol(item["range"])
+                target = self.header if row == 1 else self.rows[row - 2]
+                target[col - 1] = item["values"][0][0]
+
+class FakeSpreadsheet:
+    def __init__(self, worksheet):
+        self.ws = worksheet
+
+    def worksheet(self, name):
+        return self.ws
+
+class FakeClient:
+    def __init__(self, worksheet):
+        self.ws = worksheet
+
+    def open_by_key(self, key):
+        return FakeSpreadsheet(self.ws)
@@ -0,0 +1,35 @@
+import pandas as pd
+import pytest
+
+from conftest import load_app_defs
+
+
+@pytest.fixture(scope="module")
+def app():
+    return load_app_defs("BREWERY_DETAIL_COLUMNS", "brewery_details_of", "merge_brewery_details")
+
+
+def test_first_non_empty_value_per_brewery(app):
+    raw = pd.DataFrame({
+        "brewery_local": ["Cantillon", "Cantillon", "Orval", "", "Cantillon"],
+        "brewery_description": ["", "ランビックの醸造所", "修道院", "所属なし", "別の説明"],
+        "brewery_image_url": ["", "", "", "x.png", "https://img.invalid/cantillon.png"],
+    })
+
+    assert app["brewery_details_of"](raw) == {
+        "Cantillon": ("ランビックの醸造所", "https://img.invalid/cantillon.png"),
+        "Orval": ("修道院", ""),
+    }
+
+
+def test_missing_columns(app):
+    assert app["brewery_details_of"](pd.DataFrame({"brewery_local": ["Orval"]})) == {}
+    assert app["brewery_details_of"](pd.DataFrame({"name_jp": ["x"]})) == {}
+
+
+def test_merge_keeps_existing_values(app):
+    base = {"Orval": ("修道院", "")}
+    merged = app["merge_brewery_details"](base, {"Orval": ("別の説明", "o.png"), "Westvleteren": ("", "w.png")})
+
+    assert merged == {"Orval": ("修道院", "o.png"), "Westvleteren": ("", "w.png")}
+    assert base == {"Orval": ("修道院", "")}  # 元の dict は書き換えない
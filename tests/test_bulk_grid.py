@@ -0,0 +1,111 @@
+import numpy as np
+import pandas as pd
+import pytest
+
+from conftest import load_catalog_defs
+from fakes import FakeWorksheet, make_rows
+
+
+@pytest.fixture
+def app():
+    return load_catalog_defs(
+        "GRID_COLUMNS", "build_edit_grid", "diff_edit_grid", "to_cell_value", "write_cells",
+    )
+
+
+def make_store(app, worksheet):
+    store = app["CatalogStore"]("Sheet1")
+    store.replace(app["prepare_catalog"](pd.DataFrame(worksheet.get_all_records())))
+    app["get_catalog_store"] = {"Sheet1": store}.get
+    app["get_worksheet"] = {"Sheet1": worksheet}.get
+    return store
+
+
+def count_batch_updates(worksheet):
+    calls = []
+    batch_update = worksheet.batch_update
+    worksheet.batch_update = lambda data, **kw: (calls.append(data), batch_update(data, **kw))
+    return calls
+
+
+# ---------- 差分 ----------
+def test_diff_is_keyed_by_id_and_ignores_blank_cells(app):
+    df = app["prepare_catalog"](pd.DataFrame(make_rows(6)))
+    original = app["build_edit_grid"](df, [1, 3, 4])
+    original.loc[3, "comment"] = None
+    original.loc[4, "price"] = np.nan
+
+    edited = original.copy()
+    edited.loc[3, "comment"] = np.nan      # None → NaN は変更ではない
+    edited.loc[4, "price"] = np.nan        # 空のまま
+    edited.loc[1, "price"] = 2400.0        # data_editor は数値を float で返す
+    edited.loc[1, "in_stock"] = "×"
+    edited.loc[4, "detailed_comment"] = "入荷待ち"
+
+    changes = app["diff_edit_grid"](original, edited)
+
+    assert changes == {2: {"price": 2400, "in_stock": "×"}, 5: {"detailed_comment": "入荷待ち"}}
+    assert type(changes[2]["price"]) is int
+
+
+def test_cleared_price_is_written_as_empty(app):
+    df = app["prepare_catalog"](pd.DataFrame(make_rows(3)))
+    original = app["build_edit_grid"](df, [0, 1, 2])
+    edited = original.copy()
+    edited.loc[0, "price"] = np.nan
+
+    changes = app["diff_edit_grid"](original, edited)
+
+    assert list(changes) == [1] and pd.isna(changes[1]["price"])
+    assert app["to_cell_value"](changes[1]["price"]) == ""
+
+
+# ---------- 書き込み ----------
+def test_one_batch_update_and_one_version(app):
+    worksheet = FakeWorksheet(make_rows(20))
+    store = make_store(app, worksheet)
+    batches = count_batch_updates(worksheet)
+    version = store.version
+
+    app["write_cells"]({3: {"price": 900, "comment": "限定"}, 8: {"in_stock": "×"}}, "Sheet1")
+
+    assert len(batches) == 1 and len(batches[0]) == 3
+    assert store.version == version + 1
+    header = worksheet.header
+    assert worksheet.rows[2][header.index("price")] == 900
+    assert worksheet.rows[2][header.index("comment")] == "限定"
+    assert worksheet.rows[7][header.index("in_stock")] == "×"
+    assert store.df.loc[2, "comment"] == "限定"
+    assert store.df.loc[7, "stock_status"] == "×"
+
+
+def test_rows_are_found_by_id_after_a_reload(app):
+    worksheet = FakeWorksheet(make_rows(20))
+    store = make_store(app, worksheet)
+    original = app["build_edit_grid"](store.df, [9, 10])
+    edited = original.copy()
+    edited.loc[10, "comment"] = "樽生"
+    changes = app["diff_edit_grid"](original, edited)
+
+    # 表を開いた後でシートの先頭に行が入り、読み直しで行位置がずれた
+    worksheet.rows.insert(0, list(worksheet.rows[19]))
+    worksheet.rows[0][worksheet.header.index("id")] = 99
+    store.replace(app["prepare_catalog"](pd.DataFrame(worksheet.get_all_records())))
+
+    app["write_cells"](changes, "Sheet1")
+
+    comment = worksheet.header.index("comment")
+    assert worksheet.rows[11][comment] == "樽生"   # id 11 の今の行
+    assert worksheet.rows[10][comment] != "樽生"   # 開いた時の行位置には書かない
+    assert store.df.loc[11, "comment"] == "樽生"
+
+
+def test_unknown_id_writes_nothing(app):
+    worksheet = FakeWorksheet(make_rows(5))
+    store = make_store(app, worksheet)
+    batches = count_batch_updates(worksheet)
+
+    with pytest.raises(ValueError, match="IDが見つかりません"):
+        app["write_cells"]({2: {"comment": "x"}, 404: {"comment": "y"}}, "Sheet1")
+
+    assert batches == [] and store.version == 1
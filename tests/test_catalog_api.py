@@ -0,0 +1,127 @@
+import gzip
+import json
+import threading
+import urllib.error
+import urllib.parse
+import urllib.request
+from http.server import ThreadingHTTPServer
+
+import pandas as pd
+import pytest
+
+from conftest import load_catalog_defs
+from fakes import make_rows
+
+
+@pytest.fixture
+def app():
+    ns = load_catalog_defs(
+        "CATALOG_API_CACHE_SIZE", "CATALOG_API_COLUMNS", "CatalogApiCache",
+        "build_api_body", "etag_matches", "CatalogApiHandler",
+    )
+    ns["SHOP_SHEETS"] = {"Sheet1": "本店"}
+
+    store = ns["CatalogStore"]("Sheet1")
+    store.replace(ns["prepare_catalog"](pd.DataFrame(make_rows(60))))
+    ns["get_catalog_store"] = {"Sheet1": store}.get
+    ns["get_worksheet"] = lambda sheet_name: None
+    ns["fetch_into_store"] = lambda store, sheet: store.df
+    ns["CatalogApiHandler"].cache = ns["CatalogApiCache"]()
+    return ns
+
+
+@pytest.fixture
+def api(app):
+    httpd = ThreadingHTTPServer(("127.0.0.1", 0), app["CatalogApiHandler"])
+    httpd.daemon_threads = True
+    httpd.script_ctx = None
+    threading.Thread(target=httpd.serve_forever, daemon=True).start()
+    yield f"http://127.0.0.1:{httpd.server_port}"
+    httpd.shutdown()
+    httpd.server_close()
+
+
+def get(url, **headers):
+    """(ステータス, ヘッダー, 本文)。4xx / 3xx も例外にせず返す"""
+    try:
+        with urllib.request.urlopen(urllib.request.Request(url, headers=headers), timeout=5) as res:
+            return res.status, res.headers, res.read()
+    except urllib.error.HTTPError as e:
+        return e.code, e.headers, e.read()
+
+
+# ---------- 絞り込み ----------
+def test_filters(app, api):
+    df = app["get_catalog_store"]("Sheet1").df
+
+    status, headers, body = get(f"{api}/catalog.json")
+    rows = json.loads(body)
+    assert status == 200 and headers["Content-Type"].startswith("application/json")
+    assert len(rows) == (df["stock_status"] == "○").sum()  # 既定は在庫ありだけ
+    assert set(rows[0]) == set(app["CATALOG_API_COLUMNS"].values())
+
+    _, _, body = get(f"{api}/catalog.json?stock=all&country=Belgium&style=" + urllib.parse.quote("セゾン"))
+    expected = df[(df["country"] == "Belgium") & (df["style_main_jp"] == "セゾン")]
+    assert 0 < len(expected) and expected["stock_status"].nunique() > 1
+    assert sorted(r["id"] for r in json.loads(body)) == sorted(expected["id"])
+
+    status, headers, body = get(f"{api}/catalog.csv?" + urllib.parse.urlencode({"stock": "×", "shop": "Sheet1"}))
+    lines = body.decode("utf-8").splitlines()
+    assert status == 200 and headers["Content-Type"].startswith("text/csv")
+    assert lines[0].split(",")[:3] == ["id", "name_jp", "name_local"]
+    assert len(lines) - 1 == (df["stock_status"] == "×").sum()
+
+    assert get(f"{api}/catalog.json?shop=Nowhere")[0] == 404
+    assert get(f"{api}/menu.json")[0] == 404
+
+
+# ---------- ETag ----------
+def test_if_none_match_returns_304_until_the_content_changes(app, api):
+    status, headers, body = get(f"{api}/catalog.json")
+    etag = headers["ETag"]
+
+    status, headers, body = get(f"{api}/catalog.json", **{"If-None-Match": etag})
+    assert status == 304 and body == b"" and headers["ETag"] == etag
+    assert get(f"{api}/catalog.json", **{"If-None-Match": f'"other", W/{etag}'})[0] == 304
+
+    # version が進んでも中身が同じなら同じ ETag
+    store = app["get_catalog_store"]("Sheet1")
+    store.update({0: {"comment": store.df.loc[0, "comment"]}})
+    assert get(f"{api}/catalog.json", **{"If-None-Match": etag})[0] == 304
+
+    pos = int(store.df.index[store.df["stock_status"] == "○"][0])
+    store.update({pos: {"comment": "樽生あり"}})
+    status, headers, body = get(f"{api}/catalog.json", **{"If-None-Match": etag})
+    assert status == 200 and headers["ETag"] != etag
+    assert "樽生あり" in body.decode("utf-8")
+
+
+# ---------- gzip ----------
+def test_gzip_only_when_accepted(api):
+    _, plain_headers, plain = get(f"{api}/catalog.json")
+    status, headers, packed = get(f"{api}/catalog.json", **{"Accept-Encoding": "br, gzip"})
+
+    assert "Content-Encoding" not in plain_headers
+    assert status == 200 and headers["Content-Encoding"] == "gzip"
+    assert headers["Vary"] == "Accept-Encoding" and headers["ETag"] == plain_headers["ETag"]
+    assert int(headers["Content-Length"]) == len(packed) < len(plain)
+    assert gzip.decompress(packed) == plain
+
+
+# ---------- LRU ----------
+def test_cache_evicts_least_recently_used(app):
+    cache = app["CatalogApiCache"](size=2)
+    built = []
+
+    def get_entry(key):
+        return cache.get(key, lambda: (built.append(key), ("text/plain", key.encode()))[1])
+
+    get_entry("a")
+    get_entry("b")
+    get_entry("a")  # a を使ったので、次に押し出されるのは b
+    get_entry("c")
+    assert list(cache.entries) == ["a", "c"]
+
+    get_entry("a")
+    get_entry("b")
+    assert built == ["a", "b", "c", "b"]
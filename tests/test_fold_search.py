@@ -0,0 +1,33 @@
+import pandas as pd
+import pytest
+
+from conftest import load_catalog_defs
+from fakes import make_rows
+
+
+@pytest.fixture(scope="module")
+def app():
+    return load_catalog_defs()
+
+
+@pytest.mark.parametrize("typed", [
+    "ひゅーがるでん",     # ひらがな
+    "ヒューガルデン",     # 全角カナ
+    "ﾋｭｰｶﾞﾙﾃﾞﾝ",          # 半角カナ（濁点が別の文字）
+    "ＨＯＥＧＡＡＲＤＥＮ",  # 全角英字
+    "hoeGaarden",
+])
+def test_spellings_match_the_catalog(app, typed):
+    fold = app["fold_search"]
+    assert fold(typed) in {fold("ヒューガルデン"), fold("Hoegaarden")}
+
+    row = {**make_rows(1)[0], "name_jp": "ヒューガルデン ホワイト", "name_local": "Hoegaarden Witbier"}
+    blob = app["prepare_catalog"](pd.DataFrame([row]))["search_blob"].iloc[0]
+    assert fold(typed) in blob
+
+
+def test_folds_to_katakana_and_lowercase(app):
+    fold = app["fold_search"]
+    assert fold("ひゅーがるでん") == fold("ﾋｭｰｶﾞﾙﾃﾞﾝ") == "ヒューガルデン"
+    assert fold("ＨＯＥＧＡＡＲＤＥＮ") == "hoegaarden"
+    assert fold("ＩＰＡ　６％") == "ipa 6%"
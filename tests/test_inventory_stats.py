@@ -0,0 +1,48 @@
+import pandas as pd
+import pytest
+
+from conftest import load_catalog_defs
+from fakes import make_rows
+
+
+@pytest.fixture(scope="module")
+def app():
+    return load_catalog_defs()
+
+
+def assert_same_stats(stats, fresh):
+    assert stats.counts == fresh.counts
+    assert stats.status == fresh.status
+    assert stats.ask == fresh.ask
+    assert stats.price_hist == fresh.price_hist
+    assert stats.abv_hist == fresh.abv_hist
+
+
+def test_incremental_stats_match_a_fresh_build(app):
+    store = app["CatalogStore"]("Sheet1")
+    store.replace(app["prepare_catalog"](pd.DataFrame(make_rows(200))))
+    stats = store.stats
+    assert stats.ask  # make_rows には価格 0（ASK）の行がある
+
+    ask_pos = min(stats.ask)
+    store.update({
+        ask_pos: {"price": 1500},                                 # ASK から外れる
+        3: {"price": 0, "in_stock": "×"},                         # ASK に入る
+        10: {"abv": 13.5, "country": "Japan", "style_main_jp": "ヴァイツェン"},
+        11: {"abv": None, "price": None},                         # 空欄は分布に入らない
+        12: {"brewery_local": "Cantillon", "in_stock": "△"},
+    })
+    assert store.stats is stats  # 作り直さずに差分で直している
+    assert_same_stats(stats, app["InventoryStats"](store.df))
+
+    added = make_rows(230)[200:]
+    added[0]["price"] = 0
+    added[1]["country"] = "Denmark"  # 新しい国
+    store.append(app["prepare_catalog"](pd.DataFrame(added)))
+    assert_same_stats(stats, app["InventoryStats"](store.df))
+
+    # 追加した行の変更でも、数え終わった値が残らない
+    store.update({200: {"price": 2500}, 201: {"country": "Belgium"}})
+    assert store.stats is stats
+    assert_same_stats(stats, app["InventoryStats"](store.df))
+    assert not any(country == "Denmark" for country, _ in stats.counts["country"])
@@ -0,0 +1,29 @@
+import pandas as pd
+import pytest
+from gspread.utils import numericise
+
+from conftest import load_app_defs
+
+
+@pytest.fixture(scope="module")
+def app():
+    return load_app_defs("normalize_jan", "build_jan_index")
+
+
+def test_leading_zero_survives_numericise(app):
+    # シートの "0490…" は get_all_records / numericise で int になり先頭の 0 が落ちる
+    sheet_values = ["04901234567894", "4512345678906", ""]
+    df = pd.DataFrame({"jan": [numericise(v) for v in sheet_values]})
+    df["jan"] = df["jan"].fillna("").astype(str)
+    assert df["jan"][0] == "4901234567894"
+
+    index = app["build_jan_index"](df)
+    normalize = app["normalize_jan"]
+    assert index[normalize("04901234567894")] == 0  # スキャナは 0 付きで読む
+    assert index[normalize("４５１２３４５６７８９０６\n")] == 1
+    assert len(index) == 2
+
+
+def test_normalize_drops_noise(app):
+    assert app["normalize_jan"](" 0049-0123 ") == "490123"
+    assert app["normalize_jan"]("0000") == ""
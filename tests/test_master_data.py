@@ -0,0 +1,71 @@
+import pandas as pd
+import pytest
+
+from conftest import load_app_defs
+from fakes import make_rows
+
+
+LIST_NAMES = [
+    "filter_breweries", "brewery_local_by_jp", "form_breweries", "form_brewery_by_jp",
+    "style_main", "style_sub",
+]
+
+
+@pytest.fixture(scope="module")
+def app():
+    return load_app_defs("MasterData")
+
+
+def frame(rows):
+    return pd.DataFrame(rows)[["brewery_local", "brewery_jp", "style_main_jp", "style_sub_jp"]]
+
+
+def lists(master):
+    return {name: master[name] for name in LIST_NAMES}
+
+
+def test_add_and_remove_match_a_fresh_build(app):
+    MasterData = app["MasterData"]
+    rows = make_rows(120)
+    for i, r in enumerate(rows):
+        r["style_sub_jp"] = ["", "インペリアル", "バレルエイジド"][i % 3]
+    rows[5]["brewery_jp"] = ""  # 日本語名のない醸造所（フォーム用の選択肢には出ない）
+
+    master = MasterData(frame(rows[:100]))
+    master.add(frame(rows[100:]))
+    assert lists(master) == lists(MasterData(frame(rows)))
+
+    master.remove(frame(rows[:30]))
+    assert lists(master) == lists(MasterData(frame(rows[30:])))
+    assert master.breweries == MasterData(frame(rows[30:])).breweries
+
+    # 行の変更 = 古い行を引いて新しい行を足す
+    old = frame(rows[40:41])
+    new = old.assign(brewery_local="Cantillon", brewery_jp="カンティヨン", style_main_jp="ランビック")
+    master.remove(old)
+    master.add(new)
+    assert lists(master) == lists(MasterData(pd.concat([frame(rows[30:40]), new, frame(rows[41:])])))
+
+
+def test_lists_are_rebuilt_only_when_a_key_appears_or_disappears(app):
+    rows = make_rows(20)
+    master = app["MasterData"](frame(rows))
+    first = master["style_main"]
+
+    # 既にある醸造所・スタイルの件数が増えるだけ → 作り直さない
+    master.add(frame(rows[:3]))
+    assert master._lists is not None and master["style_main"] is first
+
+    # 件数が減っても 0 にならなければそのまま
+    master.remove(frame(rows[:3]))
+    assert master._lists is not None
+
+    # 新しいスタイルが出てきた
+    master.add(frame(rows[:1]).assign(style_main_jp="グリュート"))
+    assert master._lists is None
+    assert "グリュート" in master["style_main"]
+
+    # 最後の1行が消えた
+    master.remove(frame(rows[:1]).assign(style_main_jp="グリュート"))
+    assert master._lists is None
+    assert "グリュート" not in master["style_main"]
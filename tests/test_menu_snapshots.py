@@ -0,0 +1,62 @@
+import threading
+import time
+
+import pandas as pd
+import pytest
+
+from conftest import load_app_defs
+from fakes import make_rows
+
+
+@pytest.fixture(scope="module")
+def app():
+    return load_app_defs("catalog_content_tag")
+
+
+def test_tag_depends_only_on_content(app):
+    tag = app["catalog_content_tag"]
+    a = pd.DataFrame(make_rows(50))
+    b = pd.DataFrame(make_rows(50))  # 別プロセスで読んだ同じシート
+
+    assert tag(a) == tag(b)
+
+    b.loc[7, "price"] = 1234
+    assert tag(a) != tag(b)
+    assert tag(a) != tag(a.iloc[::-1])  # 並び順も中身のうち
+
+
+def test_rebuilds_in_background_and_serves_previous_version():
+    app = load_app_defs("MenuSnapshots")
+    started, release = [], threading.Event()
+
+    def build(shop, version, df):
+        started.append(version)
+        release.wait(timeout=10)
+        return {"all_all": {"version": version}}
+
+    app["build_menu_snapshots"] = build
+    menu = app["MenuSnapshots"]("Sheet1")
+
+    # まだ1つもない間は None（呼ぶ側はその場で描画する）
+    assert menu.get(1, None) is None
+    assert menu.get(1, None) is None
+    release.set()
+    assert menu.get(1, None, wait=True) == {"all_all": {"version": 1}}
+    wait_until(lambda: not menu.building)
+
+    # version が変わっても、作り直している間は前の version を返す
+    release.clear()
+    assert menu.get(2, None) == {"all_all": {"version": 1}}
+    assert menu.get(3, None) == {"all_all": {"version": 1}}  # 作っている間は重ねて作らない
+    release.set()
+    wait_until(lambda: menu.version == 2 and not menu.building)
+    assert menu.get(3, None) == {"all_all": {"version": 2}}
+    wait_until(lambda: menu.version == 3)
+    assert started == [1, 2, 3]
+
+
+def wait_until(condition, timeout=10):
+    deadline = time.monotonic() + timeout
+    while not condition():
+        assert time.monotonic() < deadline
+        time.sleep(0.01)
@@ -0,0 +1,38 @@
+import sys
+from dataclasses import dataclass, field
+
+import pandas as pd
+import pytest
+
+from conftest import load_app_defs
+
+
+@pytest.fixture(scope="module")
+def app():
+    return load_app_defs("deep_sizeof")
+
+
+@dataclass
+class State:
+    styles: set = field(default_factory=set)
+
+
+def test_counts_nested_contents(app):
+    deep_sizeof = app["deep_sizeof"]
+    empty = State()
+    full = State(styles={f"style_{i:04d}" for i in range(200)})
+
+    # getsizeof だけだと中身の違いが見えない
+    assert sys.getsizeof(empty) == sys.getsizeof(full)
+    assert deep_sizeof(full) - deep_sizeof(empty) > 200 * sys.getsizeof("style_0000")
+
+
+def test_counts_shared_objects_once(app):
+    deep_sizeof = app["deep_sizeof"]
+    blob = "x" * 10000
+    assert deep_sizeof([blob, blob]) < 2 * sys.getsizeof(blob)
+
+
+def test_dataframe_uses_memory_usage(app):
+    df = pd.DataFrame({"name": ["a" * 100] * 50})
+    assert app["deep_sizeof"](df) == df.memory_usage(deep=True).sum()
@@ -0,0 +1,108 @@
+import json
+import os
+import threading
+import time
+
+import pandas as pd
+import pytest
+
+from conftest import load_catalog_defs
+from fakes import FakeWorksheet, make_rows
+
+
+@pytest.fixture
+def app(tmp_path):
+    return load_catalog_defs("fetch_shared", "next_beer_id", share_dir=str(tmp_path))
+
+
+# ---------- ロック ----------
+def test_lock_is_reentrant_within_a_thread(app):
+    lock = app["shared_catalog_lock"]
+    with lock("Sheet1"):
+        with lock("Sheet1"):
+            pass
+        # 内側を抜けても外側はまだ持っている
+        assert app["_shared_lock_held"].depth["Sheet1"] == 1
+
+
+def test_lock_excludes_other_threads(app):
+    lock = app["shared_catalog_lock"]
+    order = []
+
+    def other():
+        with lock("Sheet1"):
+            order.append("other")
+
+    with lock("Sheet1"):
+        t = threading.Thread(target=other)
+        t.start()
+        time.sleep(0.2)
+        order.append("owner")
+    t.join(timeout=5)
+
+    assert order == ["owner", "other"]
+
+
+# ---------- manifest ----------
+def test_manifest_with_other_format_is_ignored(app):
+    df = app["prepare_catalog"](pd.DataFrame(make_rows(5)))
+    manifest = app["publish_shared_catalog"]("Sheet1", df, time.time(), {"Cantillon": ("説明", "")})
+    assert app["read_shared_manifest"]("Sheet1")["token"] == manifest["token"]
+    _, details = app["map_shared_catalog"]("Sheet1", manifest)
+    assert details == {"Cantillon": ("説明", "")}
+
+    path = os.path.join(app["shared_dir"]("Sheet1"), "manifest.json")
+    with open(path, "w", encoding="utf-8") as f:
+        json.dump({**manifest, "format": app["CATALOG_FORMAT_VERSION"] - 1}, f)
+    assert app["read_shared_manifest"]("Sheet1") is None
+
+    # 古い形式しかなければシートから読み直して書き直す
+    worksheet = FakeWorksheet(make_rows(7))
+    store = app["CatalogStore"]("Sheet1")
+    assert len(app["fetch_shared"](store, worksheet)) == 7
+    assert app["read_shared_manifest"]("Sheet1")["format"] == app["CATALOG_FORMAT_VERSION"]
+
+
+def test_file_removed_after_reading_manifest(app):
+    # manifest を読んでから memory-map するまでの間に、他のプロセスが新しい版を書いて古いファイルを消した
+    first = app["prepare_catalog"](pd.DataFrame(make_rows(5)))
+    stale = app["publish_shared_catalog"]("Sheet1", first, time.time(), {})
+    second = app["prepare_catalog"](pd.DataFrame(make_rows(8)))
+    app["publish_shared_catalog"]("Sheet1", second, time.time(), {})
+    assert not os.path.exists(os.path.join(app["shared_dir"]("Sheet1"), stale["file"]))
+
+    read_manifest = app["read_shared_manifest"]
+    reads = []
+    app["read_shared_manifest"] = lambda name: (reads.append(name), stale if len(reads) == 1 else read_manifest(name))[1]
+
+    store = app["CatalogStore"]("Sheet1")
+    assert len(app["fetch_shared"](store, FakeWorksheet([]))) == 8
+    assert len(reads) == 2
+
+
+# ---------- 採番 ----------
+def test_id_reservation_is_exclusive_across_stores(app):
+    # プロセスごとの store を2つ作り、同じシートに同時に追加する
+    worksheet = FakeWorksheet(make_rows(20), latency=0.01)
+    stores = [app["CatalogStore"]("Sheet1") for _ in range(2)]
+    for store in stores:
+        app["fetch_shared"](store, worksheet)
+
+    def add(store, n):
+        for _ in range(n):
+            with store.lock, app["shared_catalog_lock"]("Sheet1"):
+                new_id = app["next_beer_id"](app["fetch_shared"](store, worksheet))
+                row = {**make_rows(1)[0], "id": new_id, "jan": ""}
+                worksheet.append_row([row.get(c, "") for c in worksheet.header])
+                store.append(app["prepare_catalog"](pd.DataFrame([row])))
+
+    threads = [threading.Thread(target=add, args=(s, 5)) for s in stores]
+    for t in threads:
+        t.start()
+    for t in threads:
+        t.join(timeout=30)
+
+    ids = [row[0] for row in worksheet.rows]
+    assert len(ids) == len(set(ids)) == 30
+    for store in stores:
+        assert len(app["fetch_shared"](store, worksheet)) == 30
@@ -0,0 +1,180 @@
+import threading
+import time
+
+import gspread
+import pytest
+import requests
+
+from conftest import load_app_defs
+from fakes import FakeWorksheet, api_error, make_rows
+
+
+@pytest.fixture(scope="module")
+def app():
+    return load_app_defs(
+        "PRIORITY_USER", "PRIORITY_BACKGROUND",
+        "SHEETS_QUOTA_PER_MINUTE", "SHEETS_MAX_RETRIES", "SHEETS_WORKERS",
+        "is_retryable_error", "SheetsScheduler",
+    )
+
+
+def make_scheduler(app, **kwargs):
+    # テストではクォータで待たないよう、トークンを多めにしてバックオフも短くする
+    kwargs.setdefault("per_minute", 6000)
+    kwargs.setdefault("base_delay", 0.01)
+    kwargs.setdefault("max_delay", 0.05)
+    return app["SheetsScheduler"](**kwargs)
+
+
+def flaky(failures):
+    """最初の len(failures) 回はその例外を投げ、そのあと "ok" を返す"""
+    calls = []
+
+    def fn():
+        calls.append(time.monotonic())
+        if len(calls) <= len(failures):
+            raise failures[len(calls) - 1]
+        return "ok"
+
+    return fn, calls
+
+
+# ---------- 再試行する／しないエラー ----------
+@pytest.mark.parametrize("error", [
+    api_error(429),
+    api_error(503, "Backend Error"),
+    requests.exceptions.ConnectionError("connection reset"),
+    requests.exceptions.ReadTimeout("read timed out"),
+    ConnectionResetError("reset"),
+    TimeoutError("timeout"),
+])
+def test_retryable_errors(app, error):
+    assert app["is_retryable_error"](error)
+
+
+@pytest.mark.parametrize("error", [
+    api_error(400, "Invalid range"),
+    api_error(404, "Requested entity was not found"),
+    ValueError("bad value"),
+    gspread.exceptions.WorksheetNotFound("Sheet9"),
+])
+def test_non_retryable_errors(app, error):
+    assert not app["is_retryable_error"](error)
+
+
+# ---------- 再試行・バックオフ ----------
+def test_retries_429_then_succeeds(app):
+    scheduler = make_scheduler(app)
+    fn, calls = flaky([api_error(429), api_error(429)])
+
+    assert scheduler.call(fn) == "ok"
+    assert len(calls) == 3
+    m = scheduler.metrics()
+    assert (m["completed"], m["failed"], m["retries"]) == (1, 0, 2)
+
+
+def test_retries_requests_connection_error(app):
+    scheduler = make_scheduler(app)
+    fn, calls = flaky([requests.exceptions.ConnectionError("reset by peer")])
+
+    assert scheduler.call(fn) == "ok"
+    assert len(calls) == 2
+
+
+def test_gives_up_after_max_retries(app):
+    scheduler = make_scheduler(app, max_retries=2)
+    fn, calls = flaky([api_error(429)] * 10)
+
+    with pytest.raises(gspread.exceptions.APIError):
+        scheduler.call(fn)
+    assert len(calls) == 3  # 1回目 + 再試行2回
+    assert scheduler.metrics()["failed"] == 1
+
+
+def test_does_not_retry_client_errors(app):
+    scheduler = make_scheduler(app)
+    fn, calls = flaky([api_error(404, "not found")])
+
+    with pytest.raises(gspread.exceptions.APIError):
+        scheduler.call(fn)
+    assert len(calls) == 1
+    assert scheduler.metrics()["retries"] == 0
+
+
+def test_backoff_waits_between_attempts(app):
+    scheduler = make_scheduler(app, base_delay=0.2, max_delay=1.0)
+    fn, calls = flaky([api_error(429)])
+
+    scheduler.call(fn)
+    # 1回目の待ちは base_delay の 1/2〜1 倍（ジッター付き）
+    assert calls[1] - calls[0] >= 0.1
+
+
+def test_backoff_pauses_other_requests(app):
+    # 429 を受けたら、同時に並んでいる別のリクエストも待たせる
+    scheduler = make_scheduler(app, base_delay=0.4, max_delay=1.0, workers=2)
+    fn, calls = flaky([api_error(429)])
+
+    failing = scheduler.submit(fn)
+    while not calls:
+        time.sleep(0.005)
+    started = time.monotonic()
+    assert scheduler.call(lambda: "other") == "other"
+
+    assert time.monotonic() - started >= 0.15
+    assert failing.result() == "ok"
+
+
+def test_backoff_delay_is_capped(app):
+    scheduler = make_scheduler(app, base_delay=1.0, max_delay=4.0)
+    for attempt in range(10):
+        delay = scheduler._backoff_delay(attempt)
+        assert 0 < delay <= 4.0
+
+
+# ---------- 優先度 ----------
+def test_user_requests_run_before_background(app):
+    scheduler = make_scheduler(app, workers=1)
+    release = threading.Event()
+    order = []
+
+    # ワーカーを塞いでいる間に、裏の処理 → 画面の処理の順で積む
+    blocker = scheduler.submit(release.wait)
+    time.sleep(0.05)
+    background = [
+        scheduler.submit(order.append, f"bg{i}", priority=app["PRIORITY_BACKGROUND"])
+        for i in range(3)
+    ]
+    user = scheduler.submit(order.append, "user", priority=app["PRIORITY_USER"])
+
+    release.set()
+    for f in [blocker, user, *background]:
+        f.result(timeout=5)
+
+    assert order == ["user", "bg0", "bg1", "bg2"]
+
+
+# ---------- クォータ ----------
+def test_token_bucket_limits_rate(app):
+    scheduler = make_scheduler(app, per_minute=600, workers=4)  # 10 回/秒
+    scheduler.tokens = 0.0
+
+    started = time.monotonic()
+    for f in [scheduler.submit(lambda: None) for _ in range(5)]:
+        f.result(timeout=5)
+
+    # バケットが空なので 5 回で 0.5 秒ほどかかる
+    assert time.monotonic() - started >= 0.4
+
+
+# ---------- 429 を返す FakeWorksheet 越し ----------
+def test_fake_worksheet_with_injected_429s(app):
+    worksheet = FakeWorksheet(make_rows(20), error_rate=0.5, seed=1)
+    scheduler = make_scheduler(app, max_retries=20)
+
+    records = [scheduler.call(worksheet.get_all_records) for _ in range(10)]
+
+    assert all(len(r) == 20 for r in records)
+    assert worksheet.errors > 0
+    assert scheduler.metrics()["retries"] == worksheet.errors
+    assert scheduler.metrics()["failed"] == 0
@@ -0,0 +1,104 @@
+import numpy as np
+import pandas as pd
+import pytest
+
+from conftest import load_app_defs
+
+
+@pytest.fixture(scope="module")
+def app():
+    return load_app_defs(
+        "SIMILAR_TOP_K", "SIMILAR_CATEGORY_WEIGHTS", "SIMILAR_TABLE_MAX_ROWS",
+        "PRICE_BANDS", "similarity_features", "category_codes", "category_distance",
+        "build_similarity_table", "get_similarity_index", "find_similar_positions",
+    )
+
+
+def catalog(**columns):
+    n = len(next(iter(columns.values())))
+    df = pd.DataFrame({
+        "style_main_jp": ["IPA"] * n,
+        "style_sub_jp": [""] * n,
+        "country": ["Belgium"] * n,
+        "brewery_local": ["Cantillon"] * n,
+        "abv_num": [6.0] * n,
+        "price_num": [1500] * n,
+        "stock_status": ["○"] * n,
+    })
+    for col, values in columns.items():
+        df[col] = values
+    return df
+
+
+def similarity_index(app, df, table_max):
+    app["SIMILAR_TABLE_MAX_ROWS"] = table_max
+    index = app["get_similarity_index"].__wrapped__(1, df)
+    assert index["table_ready"].wait(timeout=30)
+    return index
+
+
+def test_category_distance_matches_onehot(app):
+    weights = list(app["SIMILAR_CATEGORY_WEIGHTS"].values())
+    df = catalog(
+        style_main_jp=["IPA", "IPA", "", "", "スタウト"],
+        style_sub_jp=["", "NEIPA", "NEIPA", "", ""],
+        country=["Belgium", "Japan", "Japan", "", "Belgium"],
+        brewery_local=["Orval", "", "Orval", "", "Orval"],
+    )
+    codes = app["category_codes"](df)
+
+    # 値ごとの one-hot を重み付きで並べた時の距離の2乗
+    onehot = np.hstack([
+        pd.get_dummies(df[col].replace("", np.nan)).to_numpy(dtype=float) * w
+        for col, w in zip(app["SIMILAR_CATEGORY_WEIGHTS"], weights)
+    ])
+    expected = ((onehot[:, None, :] - onehot[None, :, :]) ** 2).sum(axis=-1)
+
+    assert app["category_distance"](codes[:, None, :], codes[None, :, :]) == pytest.approx(expected)
+    assert app["category_distance"](codes, codes[0]) == pytest.approx(expected[0])
+
+
+@pytest.mark.parametrize("col, own, other", [
+    # 32 バケットのハッシュでは同じ場所に落ちていた組み合わせ
+    ("style_main_jp", "IPA", "フルーツビール"),
+    ("style_main_jp", "スタウト", "クアドルペル"),
+    ("style_main_jp", "ポーター", "ドゥンケル"),
+    ("brewery_local", "Brewery 0", "Brewery 26"),
+])
+def test_different_values_are_not_similar(app, col, own, other):
+    df = catalog(**{col: [own, other, own]})
+
+    for table_max in (100, 0):  # top-k 表あり / その場で計算
+        index = similarity_index(app, df, table_max)
+        assert (index["table"] is not None) == bool(table_max)
+        assert list(app["find_similar_positions"](index, 0, k=2)) == [2, 1]
+
+
+def test_table_matches_direct_computation(app):
+    rnd = np.random.default_rng(0)
+    n = 300
+    df = catalog(
+        style_main_jp=rnd.choice(["IPA", "スタウト", "セゾン", ""], n),
+        style_sub_jp=rnd.choice(["", "NEIPA", "インペリアル"], n),
+        country=rnd.choice(["Belgium", "Japan", "Germany"], n),
+        brewery_local=[f"Brewery {i}" for i in rnd.integers(0, 40, n)],
+        abv_num=rnd.uniform(3, 12, n).round(1),
+        price_num=rnd.choice([0, 800, 1500, 4000], n),
+        stock_status=rnd.choice(["○", "○", "×"], n),
+    )
+    table_index = similarity_index(app, df, 1000)
+    direct_index = similarity_index(app, df, 0)
+
+    for pos in table_index["candidates"]:
+        from_table = app["find_similar_positions"](table_index, pos)
+        direct = app["find_similar_positions"](direct_index, pos)
+        # 距離が同じ行は順番が入れ替わることがあるので、距離で比べる
+        codes, matrix = direct_index["codes"], direct_index["matrix"]
+
+        def dist(others):
+            return (
+                ((matrix[others] - matrix[pos]) ** 2).sum(axis=1)
+                + app["category_distance"](codes[others], codes[pos])
+            )
+
+        assert dist(from_table) == pytest.approx(dist(direct), abs=1e-4)
@@ -0,0 +1,108 @@
+import pandas as pd
+import pytest
+
+from conftest import load_catalog_defs
+from fakes import make_rows
+
+
+@pytest.fixture(scope="module")
+def app():
+    return load_catalog_defs("SQLITE_COLUMNS", "SqliteCatalogBackend")
+
+
+FILTERS = dict(
+    search_text="", size_choice="すべて", abv_min=0.0, abv_max=20.0,
+    price_min=0, price_max=20000, country_choice="すべて",
+    in_stock_only=False, brewery_choice="すべて",
+)
+
+
+def make_store(app, name, rows):
+    store = app["CatalogStore"](name)
+    store.replace(app["prepare_catalog"](pd.DataFrame(rows)))
+    return store
+
+
+def results(backend, **overrides):
+    filters = {**FILTERS, **overrides}
+    return {
+        sort: backend.query(sort, 7, limit=1000, **filters)
+        for sort in ["名前順", "ABV（高）", "価格（低）", "ランダム"]
+    }
+
+
+def count_rebuilds(app, backend):
+    calls = []
+    rebuild = backend._rebuild
+    backend._rebuild = lambda *a: (calls.append(1), rebuild(*a))
+    return calls
+
+
+def test_updates_and_appends_are_applied_as_deltas(app):
+    store = make_store(app, "Sheet1", make_rows(120))
+    app["get_catalog_store"] = {"Sheet1": store}.get
+
+    backend = app["SqliteCatalogBackend"]()
+    df, v = store.snapshot()
+    backend.sync(df, (("Sheet1", v),))
+    rebuilds = count_rebuilds(app, backend)
+
+    store.update({3: {"name_local": "Zwanze", "abv": 11.5}, 10: {"in_stock": "×", "comment": "限定"}})
+    store.append(app["prepare_catalog"](pd.DataFrame(make_rows(130)[120:])))
+    store.update({125: {"price": 900}})
+    df, v = store.snapshot()
+    backend.sync(df, (("Sheet1", v),))
+    assert rebuilds == []
+
+    fresh = app["SqliteCatalogBackend"]()
+    fresh.sync(df, (("Sheet1", v),))
+    for overrides in [{}, {"search_text": "zwanze"}, {"search_text": "限定"}, {"in_stock_only": True}]:
+        assert results(backend, **overrides) == results(fresh, **overrides)
+    assert backend.query("名前順", 0, limit=10, **{**FILTERS, "search_text": "zwanze"}) == ([3], 1)
+
+
+def test_replace_falls_back_to_rebuild(app):
+    store = make_store(app, "Sheet1", make_rows(50))
+    app["get_catalog_store"] = {"Sheet1": store}.get
+
+    backend = app["SqliteCatalogBackend"]()
+    df, v = store.snapshot()
+    backend.sync(df, (("Sheet1", v),))
+    rebuilds = count_rebuilds(app, backend)
+
+    store.replace(app["prepare_catalog"](pd.DataFrame(make_rows(60))))
+    df, v = store.snapshot()
+    backend.sync(df, (("Sheet1", v),))
+    assert rebuilds == [1]
+    assert backend.query("名前順", 0, limit=1000, **FILTERS)[1] == 60
+
+
+def test_merged_view_offsets(app):
+    a = make_store(app, "A", make_rows(40))
+    b = make_store(app, "B", make_rows(30, seed=1))
+    app["get_catalog_store"] = {"A": a, "B": b}.get
+
+    def merged():
+        (da, va), (db, vb) = a.snapshot(), b.snapshot()
+        df = pd.concat([da.assign(shop="A"), db.assign(shop="B")], ignore_index=True)
+        return df, (("A", va), ("B", vb))
+
+    backend = app["SqliteCatalogBackend"]()
+    backend.sync(*merged())
+    rebuilds = count_rebuilds(app, backend)
+
+    b.update({5: {"name_local": "Cantillon Kriek"}})
+    b.append(app["prepare_catalog"](pd.DataFrame(make_rows(35, seed=1)[30:])))
+    backend.sync(*merged())
+    assert rebuilds == []
+    assert backend.query("名前順", 0, limit=10, **{**FILTERS, "search_text": "cantillon"})[0] == [40 + 5]
+    assert backend.query("名前順", 0, limit=1000, **FILTERS)[1] == 75
+
+    # 前の店舗に追加すると後ろの行位置がずれるので作り直す
+    a.append(app["prepare_catalog"](pd.DataFrame(make_rows(41)[40:])))
+    df, versions = merged()
+    backend.sync(df, versions)
+    assert rebuilds == [1]
+    fresh = app["SqliteCatalogBackend"]()
+    fresh.sync(df, versions)
+    assert results(backend) == results(fresh)
@@ -0,0 +1,68 @@
+import time
+
+import pytest
+
+from conftest import load_catalog_defs
+from fakes import FakeWorksheet, make_rows
+
+
+@pytest.fixture
+def app():
+    ns = load_catalog_defs(
+        "PRIORITY_USER", "PRIORITY_BACKGROUND", "LOAD_CHUNK_ROWS",
+        "fetch_chunk", "has_more_rows", "load_remaining_chunks", "stream_into_store",
+    )
+    ns["LOAD_CHUNK_ROWS"] = 10
+    return ns
+
+
+def blank_out(worksheet, rows):
+    for i in rows:
+        worksheet.rows[i] = [""] * len(worksheet.header)
+
+
+def stream(app, worksheet):
+    store = app["CatalogStore"]("Sheet1")
+    app["stream_into_store"](store, worksheet)
+    deadline = time.monotonic() + 30
+    while store.loading and time.monotonic() < deadline:
+        time.sleep(0.01)
+    assert not store.loading and store.load_error is None
+    return store
+
+
+def test_reads_past_blank_rows(app):
+    worksheet = FakeWorksheet(make_rows(100), spare_rows=0)
+    # チャンクの末尾の空行（API は返さない）と、チャンクまるごとの空行
+    blank_out(worksheet, list(range(6, 10)) + list(range(40, 55)))
+
+    store = stream(app, worksheet)
+
+    assert len(store.df) == 100
+    # 行位置がシートの行とずれていない（行位置 0 = シートの2行目）
+    assert store.df["id"].iloc[99] == 100
+    assert store.df["id"].iloc[55] == 56
+    assert (store.df["name_local"].iloc[40:55] == "").all()
+    # 醸造所の説明はフレームではなく store の dict に入る
+    assert "brewery_description" not in store.df.columns
+    assert store.brewery_details["Brewery 99"] == ("説明" * 20, "")
+
+
+def test_stops_at_row_count_and_drops_trailing_blanks(app):
+    worksheet = FakeWorksheet(make_rows(95), spare_rows=30)
+    blank_out(worksheet, range(90, 95))
+    calls_before = worksheet.calls
+
+    store = stream(app, worksheet)
+
+    assert len(store.df) == 90
+    # ヘッダー1回 + データのある9チャンク + 空の範囲を row_count まで
+    assert worksheet.calls - calls_before == 1 + 13
+
+
+def test_appends_are_batched(app):
+    store = stream(app, FakeWorksheet(make_rows(320), spare_rows=0))
+
+    assert len(store.df) == 320
+    # 10 → 20 → 40 → 80 → 160 → 320 と倍々に反映する（チャンクごとに 32 回ではない）
+    assert store.version <= 7
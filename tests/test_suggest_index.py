@@ -0,0 +1,55 @@
+import pandas as pd
+import pytest
+
+from conftest import load_app_defs
+
+
+@pytest.fixture(scope="module")
+def app():
+    return load_app_defs(
+        "HIRAGANA_TO_KATAKANA", "fold_search",
+        "SUGGEST_COLUMNS", "SUGGEST_LIMIT", "suggest_key", "SuggestIndex",
+    )
+
+
+def catalog(*rows):
+    columns = ["name_local", "name_jp", "brewery_local", "brewery_jp", "yomi"]
+    return pd.DataFrame([dict(zip(columns, r)) for r in rows])
+
+
+@pytest.fixture(scope="module")
+def index(app):
+    return app["SuggestIndex"](catalog(
+        ("Westmalle Tripel", "ウェストマール トリプル", "Westmalle", "ウェストマール", "うぇすとまーる"),
+        ("Westmalle Dubbel", "ウェストマール ダブル", "Westmalle", "ウェストマール", "うぇすとまーる"),
+        ("Orval", "オルヴァル", "Orval", "オルヴァル", "おるゔぁる"),
+        ("Tripel Karmeliet", "トリプル カルメリート", "Bosteels", "ボステールス", "とりぷる かるめりーと"),
+        ("Duvel", "", "Duvel Moortgat", "", ""),
+    ))
+
+
+def test_matches_the_start_of_any_word(index):
+    # キー順（"tripel" < "tripel karmeliet"）
+    assert index.suggest("trip") == ["Westmalle Tripel", "Tripel Karmeliet"]
+    assert index.suggest("ＫＡＲＭ") == ["Tripel Karmeliet"]
+    assert index.suggest("moort") == ["Duvel Moortgat"]
+    assert index.suggest("almle") == []  # 単語の途中からは出さない
+
+
+def test_yomi_suggests_the_japanese_name(index):
+    # 読みは候補には出さず、日本語名を出す
+    assert index.suggest("おるゔ") == ["オルヴァル"]
+    assert index.suggest("かるめ") == ["トリプル カルメリート"]
+
+
+def test_same_label_is_listed_once(index):
+    # Westmalle は brewery_local に2回、name_local の先頭にも出てくる
+    assert index.suggest("westmalle") == ["Westmalle", "Westmalle Dubbel", "Westmalle Tripel"]
+    assert index.suggest("うぇすと") == ["ウェストマール", "ウェストマール ダブル", "ウェストマール トリプル"]
+
+
+def test_limit_and_blank_prefix(app, index):
+    many = app["SuggestIndex"](catalog(*[(f"Saison {i:02d}", "", "", "", "") for i in range(20)]))
+    assert len(many.suggest("saison")) == app["SUGGEST_LIMIT"]
+    assert many.suggest("saison", limit=2) == ["Saison 00", "Saison 01"]
+    assert index.suggest("   ") == []
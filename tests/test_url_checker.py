@@ -0,0 +1,171 @@
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+import pytest
+
+from conftest import load_app_defs
+
+
+@pytest.fixture(scope="module")
+def app():
+    return load_app_defs(
+        "DEFAULT_BEER_IMG",
+        "URL_CHECK_COLUMNS", "URL_CHECK_WORKERS", "URL_CHECK_TIMEOUT", "URL_CHECK_TTL",
+        "URL_CHECK_IGNORED_STATUS", "UrlChecker",
+        "image_or_default", "IMG_SRC_RE", "apply_image_fallback",
+    )
+
+
+# ---------- ローカルの HTTP サーバー（画像・Untappd の代わり） ----------
+class StandIn(BaseHTTPRequestHandler):
+    hits = {}
+    active = 0
+    max_active = 0
+    lock = threading.Lock()
+
+    def _respond(self):
+        cls = type(self)
+        with cls.lock:
+            cls.hits[(self.command, self.path)] = cls.hits.get((self.command, self.path), 0) + 1
+            cls.active += 1
+            cls.max_active = max(cls.max_active, cls.active)
+        try:
+            path = self.path.split("?")[0]
+            if path == "/slow":
+                time.sleep(1.0)
+            elif path == "/busy":
+                time.sleep(0.1)
+
+            if path == "/no-head" and self.command == "HEAD":
+                code = 405
+            else:
+                code = {
+                    "/ok": 200, "/slow": 200, "/busy": 200, "/no-head": 206,
+                    "/missing": 404, "/error": 500, "/bot": 403,
+                }.get(path, 404)
+            self.send_response(code)
+            self.send_header("Content-Length", "0")
+            self.end_headers()
+        finally:
+            with cls.lock:
+                cls.active -= 1
+
+    do_HEAD = _respond
+    do_GET = _respond
+
+    def log_message(self, format, *args):
+        pass
+
+
+@pytest.fixture
+def server():
+    StandIn.hits = {}
+    StandIn.active = StandIn.max_active = 0
+    httpd = ThreadingHTTPServer(("127.0.0.1", 0), StandIn)
+    httpd.daemon_threads = True
+    threading.Thread(target=httpd.serve_forever, daemon=True).start()
+    yield f"http://127.0.0.1:{httpd.server_port}"
+    httpd.shutdown()
+    httpd.server_close()
+
+
+def wait_done(checker, timeout=10):
+    deadline = time.monotonic() + timeout
+    while checker.pending and time.monotonic() < deadline:
+        time.sleep(0.01)
+    assert not checker.pending
+
+
+# ---------- 判定 ----------
+def test_classifies_responses(app, server):
+    checker = app["UrlChecker"](timeout=0.5)
+    urls = {
+        "ok": f"{server}/ok",
+        "missing": f"{server}/missing",
+        "error": f"{server}/error",
+        "bot": f"{server}/bot",
+        "no_head": f"{server}/no-head",
+        "slow": f"{server}/slow",
+        "refused": "http://127.0.0.1:1/refused",
+        "not_http": "ftp://example.invalid/beer.png",
+    }
+    checker.schedule(1, urls.values())
+    wait_done(checker)
+
+    broken = {name for name, url in urls.items() if checker.is_broken(url)}
+    assert broken == {"missing", "error", "slow", "refused", "not_http"}
+    assert checker.detail(urls["missing"]) == "404"
+    assert checker.detail(urls["no_head"]) == "206"  # HEAD 405 → GET で確認
+    assert checker.detail(urls["not_http"]) == "invalid URL"
+    assert ("GET", "/no-head") in StandIn.hits
+
+
+def test_unchecked_url_is_not_broken(app):
+    checker = app["UrlChecker"]()
+    assert not checker.is_broken("https://example.invalid/never-checked.png")
+
+
+# ---------- TTL ----------
+def test_results_are_cached_until_ttl(app, server):
+    checker = app["UrlChecker"](ttl=0.3)
+    url = f"{server}/ok"
+
+    checker.schedule(1, [url])
+    wait_done(checker)
+    # 同じ version も、別の version でも TTL 内なら問い合わせない
+    checker.schedule(1, [url])
+    checker.schedule(2, [url])
+    wait_done(checker)
+    assert StandIn.hits[("HEAD", "/ok")] == 1
+
+    time.sleep(0.35)
+    checker.schedule(2, [url])
+    wait_done(checker)
+    assert StandIn.hits[("HEAD", "/ok")] == 2
+
+
+def test_reset_rechecks(app, server):
+    checker = app["UrlChecker"]()
+    url = f"{server}/ok"
+    checker.schedule(1, [url])
+    wait_done(checker)
+
+    checker.reset()
+    checker.schedule(1, [url])
+    wait_done(checker)
+    assert StandIn.hits[("HEAD", "/ok")] == 2
+
+
+# ---------- 同時実行数 ----------
+def test_pool_is_bounded(app, server):
+    checker = app["UrlChecker"](workers=3)
+    checker.schedule(1, [f"{server}/busy?n={i}" for i in range(12)])
+    wait_done(checker)
+
+    assert StandIn.max_active <= 3
+    assert sum(StandIn.hits.values()) == 12
+
+
+# ---------- 描画時の差し替え ----------
+def test_image_fallback(app, server):
+    checker = app["UrlChecker"]()
+    ok, missing = f"{server}/ok", f"{server}/missing"
+    checker.schedule(1, [ok, missing])
+    wait_done(checker)
+
+    app["get_url_checker"] = lambda: checker
+    default = app["DEFAULT_BEER_IMG"]
+
+    assert app["image_or_default"](ok) == ok
+    assert app["image_or_default"](missing) == default
+    assert app["image_or_default"]("") == default
+
+    html = (
+        f"<div><img src='https://flags.invalid/be.png' width='18'>"
+        f'<img src="{missing}" loading="lazy"><img src="{ok}" loading="lazy"></div>'
+    )
+    out = app["apply_image_fallback"](html)
+    assert f'<img src="{default}" loading="lazy">' in out
+    assert f'<img src="{ok}" loading="lazy">' in out
+    assert "https://flags.invalid/be.png" in out  # 未確認の URL はそのまま